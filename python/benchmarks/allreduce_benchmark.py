@@ -0,0 +1,99 @@
+# # Unity ML-Agents Toolkit
+# ## Data-parallel learner benchmark
+"""
+Measures the duration of the update of a PPO model when its mini-batches are split across 1 to N processes of a
+single thread each, whose gradients are averaged with a ring all-reduce.
+
+Usage:
+  allreduce_benchmark [options]
+  allreduce_benchmark --help
+
+Options:
+  --processes=<n>            Comma separated numbers of processes [default: 1,2,4].
+  --buffer-size=<n>          Number of experiences of an update [default: 10240].
+  --batch-size=<n>           Number of experiences of a mini-batch [default: 2048].
+  --num-epoch=<n>            Number of epochs of an update [default: 3].
+  --hidden-units=<n>         Size of the hidden layers [default: 256].
+  --num-layers=<n>           Number of hidden layers [default: 2].
+  --observation-size=<n>     Size of the vector observations [default: 64].
+  --repeats=<n>              Number of measures of each configuration [default: 3].
+"""
+
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+from docopt import docopt
+
+from unityagents import UnityEnvironment
+from unityagents.simulated_communicator import SimulatedCommunicator
+from unitytrainers.ppo.trainer import PPOTrainer
+
+
+def _fill_update_buffer(update_buffer, buffer_size, observation_size, action_size, random):
+    update_buffer['masks'].set(np.ones(buffer_size, np.float32))
+    update_buffer['discounted_returns'].set(random.normal(size=buffer_size).astype(np.float32))
+    update_buffer['value_estimates'].set(random.normal(size=buffer_size).astype(np.float32))
+    update_buffer['advantages'].set(random.normal(size=buffer_size).astype(np.float32))
+    update_buffer['action_probs'].set(random.normal(size=(buffer_size, action_size)).astype(np.float32))
+    update_buffer['actions_pre'].set(random.normal(size=(buffer_size, action_size)).astype(np.float32))
+    update_buffer['actions'].set(random.normal(size=(buffer_size, action_size)).astype(np.float32))
+    update_buffer['vector_obs'].set(random.normal(size=(buffer_size, observation_size)).astype(np.float32))
+
+
+def benchmark_update(n_processes, buffer_size, batch_size, num_epoch, hidden_units, num_layers, observation_size,
+                     repeats):
+    """
+    Measures the update of a PPO model of a continuous control brain with random experiences.
+    :return: Dictionary of the median duration of an update in milliseconds and the experiences per second.
+    """
+    env = UnityEnvironment(communicator=SimulatedCommunicator(num_agents=1, vector_observation_size=observation_size))
+    trainer_parameters = {'batch_size': batch_size, 'beta': 5.0e-3, 'buffer_size': buffer_size, 'epsilon': 0.2,
+                          'gamma': 0.99, 'hidden_units': hidden_units, 'lambd': 0.95, 'learning_rate': 3.0e-4,
+                          'max_steps': 5.0e6, 'normalize': False, 'num_epoch': num_epoch, 'num_layers': num_layers,
+                          'time_horizon': 64, 'sequence_length': 1, 'summary_freq': 1000, 'use_recurrent': False,
+                          'graph_scope': '', 'memory_size': 8, 'use_curiosity': False, 'curiosity_strength': 0.0,
+                          'curiosity_enc_size': 1, 'data_parallel_processes': n_processes}
+    random = np.random.RandomState(0)
+    durations = []
+    tf.reset_default_graph()
+    # Every process, the first one included, uses a single thread.
+    config = tf.ConfigProto(intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)
+    with tf.Session(config=config) as sess, tempfile.TemporaryDirectory() as summary_dir:
+        trainer_parameters['summary_path'] = summary_dir
+        trainer = PPOTrainer(sess, env, 'SimulatedBrain', trainer_parameters, True, 0, 0)
+        sess.run(tf.global_variables_initializer())
+        try:
+            # The first update is not measured.
+            for _ in range(repeats + 1):
+                _fill_update_buffer(trainer.training_buffer.update_buffer, buffer_size, observation_size,
+                                    trainer.brain.vector_action_space_size[0], random)
+                start = time.perf_counter()
+                trainer.update_model()
+                durations.append(time.perf_counter() - start)
+        finally:
+            trainer.close()
+    env.close()
+    update_ms = np.median(durations[1:]) * 1000
+    return {'processes': n_processes, 'update_ms': update_ms,
+            'experiences_per_second': buffer_size * num_epoch / update_ms * 1000}
+
+
+def main():
+    options = docopt(__doc__)
+    print('{0:>10} {1:>12} {2:>18} {3:>10}'.format('processes', 'update ms', 'experiences / s', 'speedup'))
+    reference_ms = None
+    for n_processes in [int(x) for x in options['--processes'].split(',')]:
+        r = benchmark_update(n_processes, int(options['--buffer-size']), int(options['--batch-size']),
+                             int(options['--num-epoch']), int(options['--hidden-units']),
+                             int(options['--num-layers']), int(options['--observation-size']),
+                             int(options['--repeats']))
+        if reference_ms is None:
+            reference_ms = r['update_ms']
+        print('{0:>10} {1:>12.1f} {2:>18.0f} {3:>10.2f}'.format(
+            r['processes'], r['update_ms'], r['experiences_per_second'], reference_ms / r['update_ms']))
+
+
+if __name__ == '__main__':
+    main()
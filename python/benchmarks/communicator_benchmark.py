@@ -0,0 +1,159 @@
+# # Unity ML-Agents Toolkit
+# ## Communicator benchmark
+"""
+Loopback benchmark of the Python communicators. A fake Unity process answers every exchange with an observation
+message of the given size, so that only the transport is measured.
+
+Usage:
+  communicator_benchmark [options]
+  communicator_benchmark --help
+
+Options:
+  --sizes=<sizes>            Comma separated sizes in bytes of the observation messages [default: 1000,100000,1000000].
+  --steps=<n>                Number of exchanges measured for each size [default: 200].
+  --base-port=<n>            First port used by the communicators [default: 6005].
+"""
+
+import multiprocessing
+import socket
+import struct
+import threading
+import time
+
+import grpc
+import numpy as np
+from docopt import docopt
+
+from communicator_objects import UnityMessage, UnityInput, UnityRLOutput, AgentInfoProto, \
+    UnityRLInitializationOutput, UnityToExternalStub
+from unityagents import rpc_communicator
+from unityagents.rpc_communicator import RpcCommunicator
+from unityagents.socket_communicator import SocketCommunicator
+
+
+def _unity_messages(message_size):
+    """
+    Returns the serialized initialization message and step message the fake Unity process answers with.
+    """
+    initialization = UnityMessage()
+    initialization.header.status = 200
+    initialization.unity_output.rl_initialization_output.CopyFrom(
+        UnityRLInitializationOutput(name="BenchmarkAcademy", version="API-4"))
+    step = UnityMessage()
+    step.header.status = 200
+    agent_info = AgentInfoProto(visual_observations=[bytes(message_size)], id=0)
+    step.unity_output.rl_output.CopyFrom(UnityRLOutput(
+        agentInfos={"BenchmarkBrain": UnityRLOutput.ListAgentInfoProto(value=[agent_info])}))
+    return initialization, step
+
+
+def fake_socket_unity(port, message_size):
+    """
+    Client side of the SocketCommunicator, answering until it receives a message with status 400.
+    """
+    initialization, step = _unity_messages(message_size)
+    replies = [initialization.SerializeToString(), step.SerializeToString()]
+    conn = None
+    while conn is None:
+        try:
+            conn = socket.create_connection(("localhost", port))
+        except ConnectionRefusedError:
+            time.sleep(0.01)
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    stream = conn.makefile('rb')
+    n_messages = 0
+    while True:
+        header = stream.read(4)
+        if len(header) < 4:
+            break
+        message = UnityMessage()
+        message.ParseFromString(stream.read(struct.unpack("I", header)[0]))
+        if message.header.status == 400:
+            break
+        reply = replies[min(n_messages, 1)]
+        conn.sendall(struct.pack("I", len(reply)) + reply)
+        n_messages += 1
+    stream.close()
+    conn.close()
+
+
+def fake_rpc_unity(port, message_size):
+    """
+    Client side of the RpcCommunicator, answering until it receives a message with status 400.
+    """
+    initialization, step = _unity_messages(message_size)
+    channel = grpc.insecure_channel('localhost:{0}'.format(port))
+    grpc.channel_ready_future(channel).result(timeout=30)
+    stub = UnityToExternalStub(channel)
+    stub.Exchange(initialization)
+    while stub.Exchange(step).header.status != 400:
+        pass
+    channel.close()
+
+
+def benchmark_communicator(communicator, fake_unity, port, message_size, steps):
+    """
+    Measures the duration of the exchanges of a communicator with a fake Unity process.
+    :return: Dictionary of the statistics of the exchanges.
+    """
+    unity = threading.Thread(target=fake_unity, args=(port, message_size), daemon=True)
+    unity.start()
+    communicator.initialize(UnityInput())
+    durations = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        communicator.exchange(UnityInput())
+        durations.append(time.perf_counter() - start)
+    communicator.close()
+    unity.join(timeout=10)
+    durations = np.array(durations)
+    return {
+        'mean_ms': 1000 * float(durations.mean()),
+        'p50_ms': 1000 * float(np.percentile(durations, 50)),
+        'p99_ms': 1000 * float(np.percentile(durations, 99)),
+        'mb_per_sec': message_size * steps / float(durations.sum()) / 1e6
+    }
+
+
+def benchmark_pipe_rpc_communicator(port, message_size, steps):
+    """
+    Measures the RpcCommunicator handing the messages over a multiprocessing Pipe, as it used to.
+    """
+    connection_pair = rpc_communicator._connection_pair
+    rpc_communicator._connection_pair = multiprocessing.Pipe
+    try:
+        return benchmark_communicator(RpcCommunicator(0, port), fake_rpc_unity, port, message_size, steps)
+    finally:
+        rpc_communicator._connection_pair = connection_pair
+
+
+def run(sizes, steps, base_port):
+    results = []
+    port = base_port
+    for message_size in sizes:
+        for name, benchmark in [
+                ('socket', lambda p: benchmark_communicator(
+                    SocketCommunicator(0, p), fake_socket_unity, p, message_size, steps)),
+                ('rpc', lambda p: benchmark_communicator(
+                    RpcCommunicator(0, p), fake_rpc_unity, p, message_size, steps)),
+                ('rpc-pipe', lambda p: benchmark_pipe_rpc_communicator(p, message_size, steps))]:
+            statistics = benchmark(port)
+            statistics.update({'communicator': name, 'message_size': message_size})
+            results.append(statistics)
+            port += 1
+    return results
+
+
+def main():
+    options = docopt(__doc__)
+    results = run([int(x) for x in options['--sizes'].split(',')], int(options['--steps']),
+                  int(options['--base-port']))
+    print('{0:>12} {1:>14} {2:>10} {3:>10} {4:>10} {5:>10}'.format(
+        'communicator', 'message bytes', 'mean ms', 'p50 ms', 'p99 ms', 'MB/s'))
+    for r in results:
+        print('{0:>12} {1:>14} {2:>10.3f} {3:>10.3f} {4:>10.3f} {5:>10.1f}'.format(
+            r['communicator'], r['message_size'], r['mean_ms'], r['p50_ms'], r['p99_ms'], r['mb_per_sec']))
+
+
+if __name__ == '__main__':
+    main()
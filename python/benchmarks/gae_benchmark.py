@@ -0,0 +1,71 @@
+# # Unity ML-Agents Toolkit
+# ## Advantage estimation benchmark
+"""
+Compares the per trajectory generalized advantage estimation of the PPO trainer with the batched one, for
+trajectories finishing at the same step.
+
+Usage:
+  gae_benchmark [options]
+  gae_benchmark --help
+
+Options:
+  --trajectories=<n>         Comma separated numbers of trajectories finishing at the same step [default: 1,16,64].
+  --time-horizon=<n>         Length of the trajectories [default: 1000].
+  --repeats=<n>              Number of measures of each configuration [default: 20].
+  --gamma=<n>                Discount factor [default: 0.99].
+  --lambd=<n>                GAE weighing factor [default: 0.95].
+"""
+
+import time
+
+import numpy as np
+from docopt import docopt
+
+from unitytrainers.ppo.trainer import get_gae, get_gae_batch
+
+
+def _measure(function, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return np.median(durations) * 1000
+
+
+def benchmark_gae(n_trajectories, time_horizon, repeats, gamma, lambd):
+    """
+    Measures the computation of the advantages of n_trajectories random trajectories of length time_horizon.
+    :return: Dictionary of the median durations in milliseconds and the largest difference between the results.
+    """
+    random = np.random.RandomState(0)
+    rewards = [random.normal(size=time_horizon).astype(np.float32) for _ in range(n_trajectories)]
+    value_estimates = [random.normal(size=time_horizon).astype(np.float32) for _ in range(n_trajectories)]
+    value_next = [float(x) for x in random.normal(size=n_trajectories)]
+
+    def per_trajectory():
+        return [get_gae(r, v, n, gamma, lambd) for r, v, n in zip(rewards, value_estimates, value_next)]
+
+    def batched():
+        return get_gae_batch(rewards, value_estimates, value_next, gamma, lambd)
+
+    error = max([np.abs(a - b).max() for a, b in zip(per_trajectory(), batched())])
+    loop_ms = _measure(per_trajectory, repeats)
+    batch_ms = _measure(batched, repeats)
+    return {'trajectories': n_trajectories, 'time_horizon': time_horizon, 'loop_ms': loop_ms,
+            'batch_ms': batch_ms, 'speedup': loop_ms / batch_ms, 'max_error': error}
+
+
+def main():
+    options = docopt(__doc__)
+    print('{0:>12} {1:>12} {2:>10} {3:>10} {4:>10} {5:>10}'.format(
+        'trajectories', 'time horizon', 'loop ms', 'batch ms', 'speedup', 'max error'))
+    for n_trajectories in [int(x) for x in options['--trajectories'].split(',')]:
+        r = benchmark_gae(n_trajectories, int(options['--time-horizon']), int(options['--repeats']),
+                          float(options['--gamma']), float(options['--lambd']))
+        print('{0:>12} {1:>12} {2:>10.3f} {3:>10.3f} {4:>10.1f} {5:>10.2e}'.format(
+            r['trajectories'], r['time_horizon'], r['loop_ms'], r['batch_ms'], r['speedup'], r['max_error']))
+
+
+if __name__ == '__main__':
+    main()
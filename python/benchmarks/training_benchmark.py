@@ -0,0 +1,205 @@
+# # Unity ML-Agents Toolkit
+# ## Training benchmark
+"""
+Runs the TrainerController training loop against a SimulatedCommunicator for a set of scenarios and reports
+the throughput of the Python side of training as JSON. Every scenario runs in a fresh process, so that its peak
+resident memory is its own.
+
+Usage:
+  training_benchmark [options]
+  training_benchmark --help
+
+Options:
+  --scenarios=<names>        Comma separated scenarios to run [default: ppo_vector,ppo_recurrent,ppo_curiosity,ppo_visual,bc].
+  --steps=<n>                Number of training steps of every scenario [default: 2000].
+  --agents=<n>               Number of simulated agents [default: 16].
+  --num-envs=<n>             Number of simulated environments [default: 1].
+  --seed=<n>                 Random seed [default: 0].
+  --output=<file>            Also write the results to this JSON file [default: None].
+"""
+
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+import yaml
+from docopt import docopt
+
+BASE_CONFIG = {
+    'trainer': 'ppo',
+    'batch_size': 256,
+    'beta': 5.0e-3,
+    'buffer_size': 2048,
+    'epsilon': 0.2,
+    'gamma': 0.99,
+    'hidden_units': 128,
+    'lambd': 0.95,
+    'learning_rate': 3.0e-4,
+    'memory_size': 64,
+    'normalize': True,
+    'num_epoch': 3,
+    'num_layers': 2,
+    'time_horizon': 64,
+    'sequence_length': 16,
+    'summary_freq': 1000000,
+    'use_recurrent': False,
+    'use_curiosity': False,
+    'curiosity_strength': 0.01,
+    'curiosity_enc_size': 128,
+}
+
+# Trainer parameters and SimulatedCommunicator parameters of every scenario.
+SCENARIOS = {
+    'ppo_vector': ({}, {}),
+    'ppo_recurrent': ({'use_recurrent': True}, {}),
+    'ppo_curiosity': ({'use_curiosity': True}, {}),
+    'ppo_visual': ({}, {'camera_resolutions': [(84, 84, False)]}),
+    'bc': ({'trainer': 'imitation', 'brain_to_imitate': 'TeacherBrain', 'batches_per_epoch': 5},
+           {'teacher_brain_name': 'TeacherBrain'}),
+}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def run_scenario(name, steps, num_agents, num_envs, seed):
+    """
+    Trains a scenario in the current process.
+    :return: Dictionary of the measures of the scenario.
+    """
+    from unityagents.simulated_communicator import launch_simulated_environment
+    from unitytrainers.trainer_controller import TrainerController
+
+    class BenchmarkTrainerController(TrainerController):
+        def __init__(self, *args, **kwargs):
+            self.inference_durations = []
+            self.update_durations = []
+            self.agent_steps = 0
+            self.start_time = None
+            super(BenchmarkTrainerController, self).__init__(*args, **kwargs)
+
+        def _initialize_trainers(self, trainer_config, sess):
+            super(BenchmarkTrainerController, self)._initialize_trainers(trainer_config, sess)
+            for trainer in self.trainers.values():
+                trainer.update_model = self._timed(trainer.update_model, self.update_durations)
+
+        @staticmethod
+        def _timed(function, durations):
+            def timed_function(*args, **kwargs):
+                start = time.perf_counter()
+                result = function(*args, **kwargs)
+                durations.append(time.perf_counter() - start)
+                return result
+            return timed_function
+
+        def _take_action(self, sess, curr_info):
+            if self.start_time is None:
+                self.start_time = time.perf_counter()
+            self.agent_steps += sum([len(curr_info[b].agents) for b in self.trainers])
+            start = time.perf_counter()
+            result = super(BenchmarkTrainerController, self)._take_action(sess, curr_info)
+            self.inference_durations.append(time.perf_counter() - start)
+            return result
+
+        def _save_model(self, sess, steps=0, saver=None):
+            pass
+
+        def _export_graph(self):
+            pass
+
+    trainer_parameters, environment_parameters = SCENARIOS[name]
+    config = dict(BASE_CONFIG, max_steps=steps)
+    config.update(trainer_parameters)
+    environment_parameters = dict(environment_parameters, num_agents=num_agents)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        # The models and summaries are written in a temporary directory.
+        os.chdir(directory)
+        try:
+            with open('trainer_config.yaml', 'w') as config_file:
+                yaml.dump({'default': config}, config_file)
+            tc = BenchmarkTrainerController(
+                None, name, 10 ** 9, None, True, False, True, 0, 1, 0, seed, '', 'trainer_config.yaml', True,
+                num_envs, partial(launch_simulated_environment, **environment_parameters))
+            tc.start_learning()
+            duration = time.perf_counter() - tc.start_time
+        finally:
+            os.chdir(cwd)
+    inference = np.array(tc.inference_durations) * 1000
+    updates = np.array(tc.update_durations)
+    return {
+        'scenario': name,
+        'env_steps': len(tc.inference_durations),
+        'agent_steps': tc.agent_steps,
+        'duration_s': duration,
+        'env_steps_per_sec': len(tc.inference_durations) / duration,
+        'agent_steps_per_sec': tc.agent_steps / duration,
+        'update_model': {
+            'count': len(updates),
+            'total_s': float(updates.sum()),
+            'mean_s': float(updates.mean()) if len(updates) > 0 else None
+        },
+        'inference_ms': {
+            'p50': float(np.percentile(inference, 50)),
+            'p99': float(np.percentile(inference, 99))
+        },
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def _run_scenario_process(queue, *args):
+    try:
+        queue.put(run_scenario(*args))
+    except Exception as e:
+        queue.put({'scenario': args[0], 'error': repr(e)})
+
+
+def run(scenarios, steps, num_agents, num_envs, seed):
+    """
+    Runs every scenario in a new process.
+    :return: List of the measures of the scenarios.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name in scenarios:
+        if name not in SCENARIOS:
+            raise KeyError('Unknown scenario {0}. Valid scenarios are {1}.'.format(name, ', '.join(SCENARIOS)))
+        queue = context.Queue()
+        process = context.Process(target=_run_scenario_process,
+                                  args=(queue, name, steps, num_agents, num_envs, seed))
+        process.start()
+        results.append(queue.get())
+        process.join()
+    return results
+
+
+def main():
+    options = docopt(__doc__)
+    steps = int(options['--steps'])
+    num_agents = int(options['--agents'])
+    num_envs = int(options['--num-envs'])
+    seed = int(options['--seed'])
+    results = {
+        'config': {'steps': steps, 'agents': num_agents, 'num_envs': num_envs, 'seed': seed,
+                   'python': platform.python_version(), 'numpy': np.__version__},
+        'results': run(options['--scenarios'].split(','), steps, num_agents, num_envs, seed)
+    }
+    output = json.dumps(results, indent=2)
+    print(output)
+    if options['--output'] != 'None':
+        with open(options['--output'], 'w') as output_file:
+            output_file.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,10 +7,12 @@ import os
 import multiprocessing
 import numpy as np
 from docopt import docopt
+from functools import partial
 
 
 from unitytrainers.trainer_controller import TrainerController
 from unitytrainers.exception import TrainerError
+from unityagents.simulated_communicator import launch_simulated_environment
 
 def run_training(sub_id, use_seed, options):
     # Docker Parameters
@@ -35,6 +37,10 @@ def run_training(sub_id, use_seed, options):
     lesson = int(options['--lesson'])
     fast_simulation = not bool(options['--slow'])
     no_graphics = options['--no-graphics']
+    num_envs = int(options['--num-envs'])
+    pipeline = options['--pipeline']
+    num_workers = int(options['--num-workers'])
+    simulated_agents = int(options['--simulated-agents'])
 
     # Constants
     # Assumption that this yaml is present in same dir as this file
@@ -44,13 +50,21 @@ def run_training(sub_id, use_seed, options):
 
 
 
-    if env_path is None and num_runs > 1:
+    if env_path is None and num_runs > 1 and simulated_agents == 0:
         raise TrainerError("It is not possible to launch more than one concurrent training session "
                            "when training from the editor")
 
+    env_factory = None
+    if simulated_agents > 0:
+        env_factory = partial(launch_simulated_environment, num_agents=simulated_agents, seed=use_seed)
+    elif env_path is None and (num_envs > 1 or num_workers > 0):
+        raise TrainerError("It is not possible to launch more than one environment per training session "
+                           "when training from the editor")
+
     tc = TrainerController(env_path, run_id + "-" + str(sub_id), save_freq, curriculum_file, fast_simulation,
-                            load_model, train_model, worker_id + sub_id, keep_checkpoints, lesson, use_seed,
-                            docker_target_name, TRAINER_CONFIG_PATH, no_graphics)
+                            load_model, train_model, worker_id + sub_id * max(num_envs, num_workers), keep_checkpoints,
+                            lesson, use_seed, docker_target_name, TRAINER_CONFIG_PATH, no_graphics, num_envs,
+                            env_factory, pipeline, num_workers)
     tc.start_learning()
 
 if __name__ == '__main__':
@@ -85,6 +99,9 @@ if __name__ == '__main__':
       --load                     Whether to load the model or randomly initialize [default: False].
       --run-id=<path>            The sub-directory name for model and summary statistics [default: ppo].
       --num-runs=<n>             Number of concurrent training sessions [default: 1]. 
+      --num-envs=<n>             Number of Unity environments each training session collects from [default: 1].
+      --num-workers=<n>          Number of rollout worker processes collecting experiences for the trainers [default: 0].
+      --pipeline                 Decide the actions of half of the environments while the other half simulates [default: False].
       --save-freq=<n>            Frequency at which to save model [default: 50000].
       --seed=<n>                 Random seed used for training [default: -1].
       --slow                     Whether to run the game at training speed [default: False].
@@ -92,6 +109,7 @@ if __name__ == '__main__':
       --worker-id=<n>            Number to add to communication port (5005). Used for multi-environment [default: 0].
       --docker-target-name=<dt>  Docker Volume to store curriculum, executable and model files [default: Empty].
       --no-graphics              Whether to run the Unity simulator in no-graphics mode [default: False].
+      --simulated-agents=<n>     Train against a simulated environment with this many agents instead of Unity [default: 0].
     '''
 
     options = docopt(_USAGE)
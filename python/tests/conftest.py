@@ -0,0 +1,52 @@
+import pytest
+import tensorflow as tf
+
+from unityagents import UnityEnvironment
+from unityagents.simulated_communicator import SimulatedCommunicator
+from unitytrainers.ppo.trainer import PPOTrainer
+
+
+@pytest.fixture
+def ppo_trainer_parameters(tmpdir):
+    """
+    Returns a function building the parameters of a small PPO trainer writing its summaries in tmpdir, updated with
+    its keyword arguments.
+    """
+    def make_parameters(**kwargs):
+        trainer_parameters = {'batch_size': 32, 'beta': 5.0e-3, 'buffer_size': 512, 'epsilon': 0.2, 'gamma': 0.99,
+                              'hidden_units': 16, 'lambd': 0.95, 'learning_rate': 3.0e-4, 'max_steps': 1000,
+                              'normalize': False, 'num_epoch': 1, 'num_layers': 1, 'time_horizon': 64,
+                              'sequence_length': 1, 'summary_freq': 1000, 'use_recurrent': False,
+                              'graph_scope': '', 'summary_path': str(tmpdir), 'memory_size': 8,
+                              'use_curiosity': False, 'curiosity_strength': 0.0, 'curiosity_enc_size': 1}
+        trainer_parameters.update(kwargs)
+        return trainer_parameters
+    return make_parameters
+
+
+@pytest.fixture
+def simulated_ppo_trainer(ppo_trainer_parameters):
+    """
+    Returns a function building a PPOTrainer of the SimulatedBrain in a new default graph and session, whose
+    variables are initialized. The environment is a simulated one built with the communicator keyword arguments
+    unless env is given, the other keyword arguments update the trainer parameters. The sessions and the simulated
+    environments are closed at the end of the test.
+    """
+    sessions, environments = [], []
+
+    def make_trainer(env=None, communicator=None, is_training=True, **kwargs):
+        if env is None:
+            env = UnityEnvironment(communicator=SimulatedCommunicator(**(communicator or {})))
+            environments.append(env)
+        tf.reset_default_graph()
+        sess = tf.Session()
+        sessions.append(sess)
+        trainer = PPOTrainer(sess, env, 'SimulatedBrain', ppo_trainer_parameters(**kwargs), is_training, 0, 0)
+        sess.run(tf.global_variables_initializer())
+        return trainer, env
+
+    yield make_trainer
+    for sess in sessions:
+        sess.close()
+    for env in environments:
+        env.close()
@@ -1,12 +1,18 @@
 
+import io
+
+import numpy as np
+from PIL import Image
+
 from unityagents.communicator import Communicator
+from unityagents.shared_memory import SharedMemoryWriter
 from communicator_objects import UnityMessage, UnityOutput, UnityInput,\
     ResolutionProto, BrainParametersProto, UnityRLInitializationOutput,\
     AgentInfoProto, UnityRLOutput
 
 
 class MockCommunicator(Communicator):
-    def __init__(self, discrete_action=False, visual_inputs=0, stack=True, num_agents=3):
+    def __init__(self, discrete_action=False, visual_inputs=0, stack=True, num_agents=3, shared_memory_path=None):
         """
         Python side of the grpc communication. Python is the client and Unity the server
 
@@ -18,6 +24,11 @@ class MockCommunicator(Communicator):
         self.visual_inputs = visual_inputs
         self.has_been_closed = False
         self.num_agents = num_agents
+        self.shared_memory_path = shared_memory_path
+        self.shared_memory = None
+        image = io.BytesIO()
+        Image.fromarray(np.arange(40 * 30 * 3, dtype=np.uint8).reshape(40, 30, 3)).save(image, format='PNG')
+        self.visual_observation = image.getvalue()
         if stack:
             self.num_stacks = 2
         else:
@@ -38,6 +49,9 @@ class MockCommunicator(Communicator):
             brain_name="RealFakeBrain",
             brain_type=2
         )
+        if self.shared_memory_path is not None:
+            self.shared_memory = SharedMemoryWriter(
+                self.shared_memory_path, {"RealFakeBrain": (self.num_agents, 3 * self.num_stacks)})
         rl_init = UnityRLInitializationOutput(
             name="RealFakeAcademy",
             version="API-4",
@@ -64,6 +78,7 @@ class MockCommunicator(Communicator):
             list_agent_info.append(
                 AgentInfoProto(
                     stacked_vector_observation=observation,
+                    visual_observations=[self.visual_observation] * self.visual_inputs,
                     reward=1,
                     stored_vector_actions=vector_action,
                     stored_text_actions="",
@@ -73,6 +88,13 @@ class MockCommunicator(Communicator):
                     max_step_reached=False,
                     id=i
                 ))
+        if self.shared_memory is not None:
+            self.shared_memory.write_frame({"RealFakeBrain": (
+                [[x * 10 + i for x in observation] for i in range(self.num_agents)],
+                [i + 0.5 for i in range(self.num_agents)],
+                [i == 1 for i in range(self.num_agents)])})
+            for agent_info in list_agent_info:
+                del agent_info.stacked_vector_observation[:]
         dict_agent_info["RealFakeBrain"] = \
             UnityRLOutput.ListAgentInfoProto(value=list_agent_info)
         global_done = False
@@ -93,3 +115,5 @@ class MockCommunicator(Communicator):
         Sends a shutdown signal to the unity environment, and closes the grpc connection.
         """
         self.has_been_closed = True
+        if self.shared_memory is not None:
+            self.shared_memory.close()
@@ -0,0 +1,73 @@
+import multiprocessing
+import tempfile
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from unitytrainers.allreduce import RingAllReduce, DataParallelLearner
+from unitytrainers.ppo.trainer import PPOTrainer
+from unitytrainers.rollout import PolicyVariables
+
+
+def _allreduce_process(rank, size, socket_dir, queue):
+    ring = RingAllReduce(rank, size, socket_dir)
+    queue.put((rank, ring.allreduce_mean(np.arange(7, dtype=np.float32) * (rank + 1))))
+    ring.close()
+
+
+def test_ring_allreduce():
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    with tempfile.TemporaryDirectory() as socket_dir:
+        processes = [context.Process(target=_allreduce_process, args=(rank, 3, socket_dir, queue))
+                     for rank in range(3)]
+        for process in processes:
+            process.start()
+        results = dict([queue.get(timeout=60) for _ in processes])
+        for process in processes:
+            process.join()
+    for rank in range(3):
+        np.testing.assert_allclose(results[rank], np.arange(7) * 2)
+
+
+@pytest.mark.parametrize('n_processes,graph_scope', [(2, ''), (3, ''), (2, 'Brain')])
+def test_data_parallel_update(simulated_ppo_trainer, n_processes, graph_scope):
+    trainer, env = simulated_ppo_trainer(communicator={'num_agents': 4}, buffer_size=64, time_horizon=8,
+                                         num_epoch=2, graph_scope=graph_scope)
+    sess = trainer.sess
+    if graph_scope:
+        # The variables of a model whose scope starts with the scope of the trainer are not part of its model.
+        PPOTrainer(sess, env, 'SimulatedBrain', dict(trainer.parameters, graph_scope=graph_scope + '2'), True, 0, 0)
+        sess.run(tf.global_variables_initializer())
+    policy_variables = PolicyVariables(tf.global_variables())
+    curr_info = env.reset()
+    while not trainer.is_ready_update():
+        take_action_outputs = trainer.take_action(curr_info)
+        next_info = env.step(take_action_outputs[0])
+        trainer.add_experiences(curr_info, next_info, take_action_outputs[4])
+        trainer.process_experiences(curr_info, next_info)
+        curr_info = next_info
+    update_buffer = trainer.training_buffer.update_buffer
+    fields = {key: field.data.copy() for key, field in update_buffer.items()}
+    initial_values = policy_variables.get(sess)
+    np.random.seed(0)
+    trainer.update_model()
+    expected_values = policy_variables.get(sess)
+
+    # The gradients of the parts of the mini-batches averaged are the gradients of the mini-batches, the
+    # mini-batches of 32 experiences being split in unequal parts across 3 processes.
+    policy_variables.set(sess, initial_values)
+    for key, data in fields.items():
+        update_buffer[key].set(data)
+    trainer.data_parallel = DataParallelLearner.start(n_processes, trainer.brain, trainer.parameters, 0)
+    np.random.seed(0)
+    trainer.update_model()
+    scope = graph_scope + '/' if graph_scope else ''
+    assert all(v.op.name.startswith(scope) for v in trainer.data_parallel._variables.variables)
+    trainer.close()
+    assert trainer.data_parallel is None
+    values = policy_variables.get(sess)
+    assert len(trainer.stats['value_loss']) == 2
+    for name, value in expected_values.items():
+        np.testing.assert_allclose(values[name], value, rtol=1e-3, atol=1e-5, err_msg=name)
@@ -0,0 +1,8 @@
+from benchmarks.training_benchmark import run_scenario
+
+
+def test_training_benchmark_scenario():
+    result = run_scenario('ppo_vector', 20, 2, 1, 0)
+    assert result['scenario'] == 'ppo_vector'
+    assert result['env_steps'] > 0
+    assert result['agent_steps'] == 2 * result['env_steps']
@@ -54,3 +54,61 @@ def test_buffer():
                            batch_size=None, training_length=2)
     assert len(b.update_buffer['action']) == 10
     assert np.array(b.update_buffer['action']).shape == (10, 2, 2)
+
+
+def test_buffer_field_storage():
+    b = Buffer()
+    field = b[0]['visual_obs0']
+    for step in range(40):
+        field.append(np.full((2, 2, 1), step, dtype=np.uint8))
+    assert len(field) == 40
+    assert field.get_batch().dtype == np.uint8
+    assert_array(field.get_batch(batch_size=2)[:, 0, 0, 0], np.array([38, 39], dtype=np.uint8))
+    storage = field.get_batch()
+    b[0].reset_agent()
+    assert len(field) == 0
+    field.extend(np.ones((3, 2, 2, 1), dtype=np.uint8))
+    # The storage is reused after a reset
+    assert np.shares_memory(storage, field.get_batch())
+    b[0]['rewards'].append(1)
+    b[0]['rewards'].set([0.5, 0.25])
+    assert b[0]['rewards'].get_batch().dtype == np.float32
+    assert_array(np.array(b[0]['rewards']), np.array([0.5, 0.25], dtype=np.float32))
+
+
+def test_buffer_sequences():
+    b = Buffer()
+    for step in range(11):
+        b[0]['memory'].append([step + 1, -step - 1])
+    elements = [np.array([step + 1, -step - 1]) for step in range(11)]
+    padding = np.zeros(2)
+    for training_length in [2, 3, 11, 12]:
+        leftover = 11 % training_length
+        sequences = [elements[end - training_length:end]
+                     for end in range(11, leftover, -training_length)]
+        if leftover != 0:
+            sequences = [[padding] * (training_length - leftover) + elements[:leftover]] + sequences[::-1]
+        else:
+            sequences = sequences[::-1]
+        assert_array(b[0]['memory'].get_batch(training_length=training_length), np.array(sequences, np.float32))
+        assert_array(b[0]['memory'].get_batch(batch_size=1, training_length=training_length),
+                     np.array(sequences[-1:], np.float32))
+    windows = [elements[end - 4:end] for end in range(4, 12)]
+    assert_array(b[0]['memory'].get_batch(training_length=4, sequential=False), np.array(windows, np.float32))
+    assert_array(b[0]['memory'].get_batch(batch_size=3, training_length=4, sequential=False),
+                 np.array(windows[-3:], np.float32))
+
+
+def test_buffer_shuffle_mini_batch():
+    b = Buffer()
+    for step in range(10):
+        b.update_buffer['vector_obs'].append([step, step])
+        b.update_buffer['rewards'].append(step)
+    b.update_buffer.shuffle()
+    rewards = b.update_buffer['rewards'].get_batch()
+    assert sorted(rewards) == list(range(10))
+    # The fields are reordered in the same way
+    assert_array(b.update_buffer['vector_obs'].get_batch(), np.stack([rewards, rewards], axis=1))
+    mini_batch = b.update_buffer.make_mini_batch(2, 5)
+    assert_array(mini_batch['rewards'], rewards[2:5])
+    assert np.shares_memory(mini_batch['vector_obs'], b.update_buffer['vector_obs'].get_batch())
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from unitytrainers.inference import InferenceEngine
+
+
+@pytest.mark.parametrize('vector_action_space_type', ['continuous', 'discrete'])
+def test_inference_engine(tmpdir, simulated_ppo_trainer, vector_action_space_type):
+    trainer, env = simulated_ppo_trainer(
+        communicator={'num_agents': 4, 'vector_action_space_type': vector_action_space_type,
+                      'vector_action_size': 2},
+        is_training=False, use_recurrent=True, normalize=True, use_curiosity=True)
+    graph_path = str(tmpdir.join('graph.bytes'))
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        trainer.sess, trainer.sess.graph.as_graph_def(), ['action', 'value_estimate', 'recurrent_out'])
+    with open(graph_path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    info = env.reset()
+    _, memories, _, values, _ = trainer.take_action(info)
+
+    engine = InferenceEngine(graph_path, env.brains, {'SimulatedBrain': ''})
+    # The optimizer and the curiosity models are not part of the exported graph.
+    operation_names = [op.name for op in engine.graph.get_operations()]
+    assert 'next_vector_observation' not in operation_names
+    assert not [name for name in operation_names if 'Adam' in name]
+    vector_action, memory, text_action, value = engine.decide_actions(info)
+    assert len(vector_action['SimulatedBrain']) == 4
+    np.testing.assert_allclose(value['SimulatedBrain'], values, rtol=1e-5)
+    np.testing.assert_allclose(memory['SimulatedBrain'], memories, rtol=1e-5, atol=1e-6)
+    engine.close()
+
+
+def test_inference_engine_visual(tmpdir, simulated_ppo_trainer):
+    trainer, env = simulated_ppo_trainer(communicator={'num_agents': 4, 'camera_resolutions': [(40, 40, False)]},
+                                         is_training=False)
+    graph_path = str(tmpdir.join('graph.bytes'))
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        trainer.sess, trainer.sess.graph.as_graph_def(), ['action', 'value_estimate'])
+    with open(graph_path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    info = env.reset()
+    assert info['SimulatedBrain'].visual_observations[0].dtype == np.uint8
+    values = trainer.take_action(info)[3]
+
+    engine = InferenceEngine(graph_path, env.brains, {'SimulatedBrain': ''})
+    assert engine.tensors['SimulatedBrain']['visual_observations'][0].dtype == tf.uint8
+    np.testing.assert_allclose(engine.decide_actions(info)[3]['SimulatedBrain'], values, rtol=1e-5, atol=1e-6)
+    # The frames are scaled for the graphs without the uint8 placeholder.
+    engine.tensors['SimulatedBrain']['visual_observations'] = [engine._get_tensor('visual_observation_0')]
+    np.testing.assert_allclose(engine.decide_actions(info)[3]['SimulatedBrain'], values, rtol=1e-5, atol=1e-6)
+    engine.close()
@@ -0,0 +1,24 @@
+import numpy as np
+
+from unitytrainers.normalizer import RunningNormalizer
+
+
+def test_running_normalizer():
+    random = np.random.RandomState(0)
+    batches = [random.normal(3, 2, (n, 4)) for n in [1, 10, 100, 7]]
+    normalizer = RunningNormalizer(4)
+    np.testing.assert_array_equal(normalizer.variance, np.ones(4))
+    for batch in batches:
+        normalizer.update(batch)
+    normalizer.update(np.zeros((0, 4)))
+    observations = np.concatenate(batches)
+    assert normalizer.count == len(observations)
+    np.testing.assert_allclose(normalizer.mean, observations.mean(axis=0))
+    np.testing.assert_allclose(normalizer.variance, observations.var(axis=0))
+
+    restored = RunningNormalizer(4)
+    restored.set(normalizer.mean, normalizer.variance, normalizer.count)
+    restored.update(batches[0])
+    normalizer.update(batches[0])
+    np.testing.assert_allclose(restored.mean, normalizer.mean)
+    np.testing.assert_allclose(restored.variance, normalizer.variance)
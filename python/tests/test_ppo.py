@@ -5,7 +5,7 @@ import numpy as np
 import tensorflow as tf
 
 from unitytrainers.ppo.models import PPOModel
-from unitytrainers.ppo.trainer import discount_rewards
+from unitytrainers.ppo.trainer import discount_rewards, discount_rewards_batch, get_gae, get_gae_batch
 from unityagents import UnityEnvironment
 from .mock_communicator import MockCommunicator
 
@@ -274,6 +274,95 @@ def test_ppo_model_cc_visual_curio(mock_communicator, mock_launcher):
             env.close()
 
 
+def test_ppo_trainer_value_estimates(simulated_ppo_trainer):
+    trainer, env = simulated_ppo_trainer(communicator={'num_agents': 4})
+    info = env.reset()
+    value = trainer.take_action(info)[3]
+    np.testing.assert_allclose(trainer.generate_value_estimates(info['SimulatedBrain'], [2, 0]),
+                               value[[2, 0], 0], rtol=1e-5)
+
+
+@pytest.mark.parametrize('vector_action_space_type', ['continuous', 'discrete'])
+def test_ppo_trainer_fused_curiosity(simulated_ppo_trainer, vector_action_space_type):
+    trainer, env = simulated_ppo_trainer(
+        communicator={'num_agents': 4, 'vector_action_space_type': vector_action_space_type,
+                      'vector_action_size': 2},
+        use_curiosity=True, curiosity_strength=1.0, curiosity_enc_size=8)
+    trainer.has_updated = True
+    curr_info = env.reset()
+    take_action_outputs = trainer.take_action(curr_info)
+    assert trainer.fused_intrinsic_rewards is None
+    next_info = env.step(take_action_outputs[0])
+    trainer.take_action(next_info)
+    fused_rewards = trainer.generate_intrinsic_rewards(curr_info['SimulatedBrain'], next_info['SimulatedBrain'])
+    trainer.fused_intrinsic_rewards = None
+    rewards = trainer.generate_intrinsic_rewards(curr_info['SimulatedBrain'], next_info['SimulatedBrain'])
+    assert rewards.shape == (4,)
+    np.testing.assert_allclose(fused_rewards, rewards, rtol=1e-4, atol=1e-6)
+
+
+def test_ppo_trainer_step(simulated_ppo_trainer):
+    trainer, env = simulated_ppo_trainer(communicator={'num_agents': 2}, normalize=True)
+    sess = trainer.sess
+    trainer.stats['cumulative_reward'].append(2.0)
+    for _ in range(3):
+        trainer.increment_step_and_update_last_reward()
+    assert trainer.get_step == 3
+    assert trainer.get_last_reward == 2.0
+    # The step is fed to the model, whose variables are only written when saving
+    assert sess.run(trainer.model.current_step, {trainer.model.current_step: trainer.step}) == 3
+    assert sess.run(trainer.model.global_step) == 0
+    trainer.update_normalizer(np.array([[1, 2, 3, 4, 5, 6, 7, 8], [3, 4, 1, 0, 5, 6, 7, 8]]))
+    np.testing.assert_allclose(sess.run(trainer.model.normalized_state,
+                                        {trainer.model.vector_in: [[2, 5, 2, 2, 5, 6, 7, 8]]}),
+                               [[0, 2, 0, 0, 0, 0, 0, 0]], atol=1e-6)
+    trainer.save_step_to_graph()
+    trainer.step, trainer.last_reward = 0, 0.0
+    trainer.normalizer.set(np.zeros(8), np.ones(8), 0)
+    trainer.load_step_from_graph()
+    assert trainer.get_step == 3
+    assert trainer.get_last_reward == 2.0
+    assert trainer.normalizer.count == 2
+    np.testing.assert_allclose(trainer.normalizer.mean, [2, 3, 2, 2, 5, 6, 7, 8])
+
+
+@pytest.mark.parametrize('vector_action_space_type', ['continuous', 'discrete'])
+def test_ppo_trainer_async_update(simulated_ppo_trainer, vector_action_space_type):
+    trainer, env = simulated_ppo_trainer(
+        communicator={'num_agents': 4, 'vector_action_space_type': vector_action_space_type,
+                      'vector_action_size': 2},
+        async_update=True, buffer_size=32, time_horizon=8, use_curiosity=True, curiosity_strength=1.0,
+        curiosity_enc_size=8)
+    curr_info = env.reset()
+    while not trainer.is_ready_update():
+        take_action_outputs = trainer.take_action(curr_info)
+        next_info = env.step(take_action_outputs[0])
+        trainer.add_experiences(curr_info, next_info, take_action_outputs[4])
+        trainer.process_experiences(curr_info, next_info)
+        curr_info = next_info
+    update_buffer = trainer.training_buffer.update_buffer
+    # The experiences were collected by the current policy
+    trainer.compute_importance_weights(update_buffer, 8)
+    np.testing.assert_allclose(update_buffer['proximal_action_probs'].data, update_buffer['action_probs'].data,
+                               rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(update_buffer['importance_weights'].data, 1, rtol=1e-4)
+    trainer.update_model()
+    assert trainer.training_buffer.update_buffer is not update_buffer
+    assert len(trainer.training_buffer.update_buffer['actions']) == 0
+    # The intrinsic rewards are not fused across the weights changing during the update.
+    trainer.take_action(curr_info)
+    trainer.take_action(curr_info)
+    assert trainer.fused_intrinsic_rewards is None
+    # The statistics of the update are added by the main thread.
+    assert len(trainer.stats['value_loss']) == 0
+    trainer.wait_update()
+    assert trainer.learner is None
+    assert trainer.last_encoded_states is None
+    assert len(update_buffer['actions']) == 0
+    assert len(trainer.stats['value_loss']) == 1
+    assert max(trainer.stats['importance_weight']) <= 1.0
+
+
 def test_rl_functions():
     rewards = np.array([0.0, 0.0, 0.0, 1.0])
     gamma = 0.9
@@ -281,5 +370,21 @@ def test_rl_functions():
     np.testing.assert_array_almost_equal(returns, np.array([0.729, 0.81, 0.9, 1.0]))
 
 
+
+def test_batched_rl_functions():
+    random = np.random.RandomState(0)
+    lengths = [1, 5, 64, 65, 1000]
+    rewards = [random.normal(size=n) for n in lengths]
+    value_estimates = [random.normal(size=n) for n in lengths]
+    value_next = list(random.normal(size=len(lengths)))
+    for gamma, lambd in [(0.99, 0.95), (0.9, 1.0), (0.0, 0.5)]:
+        advantages = get_gae_batch(rewards, value_estimates, value_next, gamma, lambd)
+        for i in range(len(lengths)):
+            np.testing.assert_allclose(advantages[i], get_gae(rewards[i], value_estimates[i], value_next[i],
+                                                               gamma, lambd), rtol=1e-7, atol=1e-9)
+    returns = discount_rewards_batch(np.array([[0.0, 0.0, 0.0, 1.0], [1.0, 0.0, 0.0, 0.0]]), 0.9, [0.0, 1.0])
+    np.testing.assert_array_almost_equal(returns, np.array([[0.729, 0.81, 0.9, 1.0], [1.6561, 0.729, 0.81, 0.9]]))
+    assert get_gae_batch([], [], []) == []
+
 if __name__ == '__main__':
     pytest.main()
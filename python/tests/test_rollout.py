@@ -0,0 +1,62 @@
+import threading
+from functools import partial
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from unityagents.exception import UnityEnvironmentException
+from unityagents.simulated_communicator import launch_simulated_environment
+from unitytrainers.rollout import RolloutWorkers, PolicyVariables
+
+
+def test_policy_variables():
+    tf.reset_default_graph()
+    with tf.variable_scope('brain'):
+        weights = tf.get_variable('weights', [2, 3], initializer=tf.zeros_initializer())
+        running_mean = tf.get_variable('running_mean', [3], trainable=False, initializer=tf.zeros_initializer())
+        tf.get_variable('global_step', [], trainable=False, initializer=tf.zeros_initializer())
+    policy_variables = PolicyVariables()
+    assert policy_variables.variables == [weights, running_mean]
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        values = policy_variables.get(sess)
+        assert sorted(values.keys()) == ['brain/running_mean', 'brain/weights']
+        policy_variables.set(sess, {'brain/weights': np.ones((2, 3)), 'brain/running_mean': [1, 2, 3]})
+        np.testing.assert_array_equal(sess.run(weights), np.ones((2, 3)))
+        np.testing.assert_array_equal(sess.run(running_mean), [1, 2, 3])
+
+
+def test_rollout_workers(simulated_ppo_trainer):
+    workers = RolloutWorkers(partial(launch_simulated_environment, num_agents=2), n_workers=2)
+    assert workers.external_brain_names == ['SimulatedBrain']
+    trainer, _ = simulated_ppo_trainer(env=workers, trainer='ppo', time_horizon=4)
+    policy_variables = PolicyVariables()
+    workers.start({'SimulatedBrain': trainer.parameters}, True, 0, 0)
+    workers.broadcast(policy_variables.get(trainer.sess), {'SimulatedBrain': 0}, {'SimulatedBrain': False})
+    steps = 0
+    while len(trainer.training_buffer.update_buffer['actions']) == 0:
+        for experiences, worker_steps in workers.receive():
+            trainer.add_update_experiences(*experiences['SimulatedBrain'])
+            steps += worker_steps
+    update_buffer = trainer.training_buffer.update_buffer
+    assert steps >= 4
+    assert len(update_buffer['advantages']) == len(update_buffer['actions'])
+    assert update_buffer['vector_obs'].data.shape[1:] == (8,)
+    workers.close()
+
+
+class _UnpicklableError(Exception):
+    def __init__(self):
+        super(_UnpicklableError, self).__init__('The environment could not be launched.')
+        self.lock = threading.Lock()
+
+
+def _failing_environment_factory(worker_index):
+    raise _UnpicklableError()
+
+
+def test_rollout_workers_unpicklable_error():
+    # The worker sends the traceback of the error instead.
+    with pytest.raises(UnityEnvironmentException, match='_UnpicklableError'):
+        RolloutWorkers(_failing_environment_factory, n_workers=1)
@@ -1,6 +1,10 @@
 import json
+import os
+import threading
 import unittest.mock as mock
+from functools import partial
 
+import numpy as np
 import yaml
 import pytest
 import tensorflow as tf
@@ -12,6 +16,7 @@ from unitytrainers.bc.trainer import BehavioralCloningTrainer
 from unitytrainers.curriculum import Curriculum
 from unitytrainers.exception import CurriculumError
 from unityagents.exception import UnityEnvironmentException
+from unityagents.simulated_communicator import launch_simulated_environment
 from .mock_communicator import MockCommunicator
 
 
@@ -131,6 +136,23 @@ def test_initialization(mock_communicator, mock_launcher):
     assert(tc.env.brain_names[0] == 'RealFakeBrain')
 
 
+def test_simulated_initialization():
+    tc = TrainerController(None, ' ', 1, None, True, True, False, 0,
+                           1, 1, 1, '', "tests/test_unitytrainers.py", False,
+                           env_factory=launch_simulated_environment)
+    assert(tc.env.brain_names[0] == 'SimulatedBrain')
+    assert(tc.env_name == 'SimulatedAcademy')
+    tc.env.close()
+
+
+def test_pipeline_needs_two_environments():
+    with pytest.raises(UnityEnvironmentException):
+        TrainerController(None, ' ', 1, None, True, True, False, 0,
+                          1, 1, 1, '', "tests/test_unitytrainers.py", False,
+                          env_factory=launch_simulated_environment,
+                          pipeline=True)
+
+
 @mock.patch('unityagents.UnityEnvironment.executable_launcher')
 @mock.patch('unityagents.UnityEnvironment.get_communicator')
 def test_load_config(mock_communicator, mock_launcher, dummy_config):
@@ -185,3 +207,233 @@ def test_initialize_trainers(mock_communicator, mock_launcher, dummy_config,
             with tf.Session() as sess:
                 with pytest.raises(UnityEnvironmentException):
                     tc._initialize_trainers(config, sess)
+
+
+def test_take_action_single_run(tmpdir, ppo_trainer_parameters):
+    tc = TrainerController(None, ' ', 1, None, True, True, False, 0,
+                           1, 1, 1, '', "tests/test_unitytrainers.py", False,
+                           env_factory=launch_simulated_environment)
+    tf.reset_default_graph()
+    with tf.Session() as sess:
+        tc.trainers = {}
+        for graph_scope in ['first', 'second']:
+            trainer_parameters = ppo_trainer_parameters(
+                summary_path=str(tmpdir.join(graph_scope)),
+                graph_scope=graph_scope)
+            tc.trainers[graph_scope] = PPOTrainer(
+                sess, tc.env, 'SimulatedBrain', trainer_parameters, True, 0, 0)
+        sess.run(tf.global_variables_initializer())
+        curr_info = tc.env.reset()
+        with mock.patch.object(sess, 'run', wraps=sess.run) as run:
+            take_action_value = tc._take_action(sess, curr_info)[3]
+            assert run.call_count == 1
+        for graph_scope, trainer in tc.trainers.items():
+            np.testing.assert_allclose(take_action_value[graph_scope],
+                                       trainer.take_action(curr_info)[3],
+                                       rtol=1e-5)
+    tc.env.close()
+
+
+def test_rollout_workers_async_update(tmpdir, dummy_config, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    config = dummy_config
+    config['default'].update({'buffer_size': 64, 'time_horizon': 16, 'max_steps': 200, 'sequence_length': 4,
+                              'hidden_units': 16, 'num_epoch': 1, 'async_update': True})
+    with open('trainer_config.yaml', 'w') as config_file:
+        yaml.dump(config, config_file)
+    tc = TrainerController(None, 'run', 10 ** 9, None, True, False, True, 0,
+                           1, 0, 1, '', 'trainer_config.yaml', False,
+                           env_factory=partial(launch_simulated_environment,
+                                               num_agents=2),
+                           num_workers=2)
+    broadcast = tc._broadcast_policy
+    learners = []
+
+    def recording_broadcast(sess, policy_variables):
+        learners.extend([t.learner for t in tc.trainers.values()])
+        broadcast(sess, policy_variables)
+
+    tc._broadcast_policy = recording_broadcast
+    tc._export_graph = lambda: None
+    tc.start_learning()
+    # The policy is broadcast at the start and after each update.
+    assert len(learners) > 1
+    assert learners == [None] * len(learners)
+
+
+def test_pipeline_writes_summaries_in_main_thread(tmpdir, dummy_config,
+                                                  monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    config = dummy_config
+    config['default'].update({'buffer_size': 64, 'time_horizon': 16, 'max_steps': 100, 'sequence_length': 4,
+                              'hidden_units': 16, 'num_epoch': 1, 'summary_freq': 10})
+    with open('trainer_config.yaml', 'w') as config_file:
+        yaml.dump(config, config_file)
+    tc = TrainerController(None, 'run', 10 ** 9, None, True, False, True, 0,
+                           1, 0, 1, '', 'trainer_config.yaml', False,
+                           num_envs=2,
+                           env_factory=partial(launch_simulated_environment,
+                                               num_agents=2),
+                           pipeline=True)
+    initialize_trainers = tc._initialize_trainers
+    threads = []
+
+    def recording_initialize_trainers(trainer_config, sess):
+        initialize_trainers(trainer_config, sess)
+        for trainer in tc.trainers.values():
+            write_summary = trainer.write_summary
+
+            def recording_write_summary(*args, **kwargs):
+                threads.append(threading.current_thread())
+                write_summary(*args, **kwargs)
+
+            trainer.write_summary = recording_write_summary
+
+    tc._initialize_trainers = recording_initialize_trainers
+    tc._export_graph = lambda: None
+    tc.start_learning()
+    assert len(threads) > 0
+    assert threads == [threading.main_thread()] * len(threads)
+
+
+def _interrupt_after(tc, n_steps):
+    # Both the sequential and the inference loops step the environment.
+    steps = []
+
+    def interrupting(step):
+        def interrupting_step(*args, **kwargs):
+            steps.append(None)
+            if len(steps) > n_steps:
+                raise KeyboardInterrupt
+            return step(*args, **kwargs)
+        return interrupting_step
+
+    tc.env.step = interrupting(tc.env.step)
+    tc.env.step_wait = interrupting(tc.env.step_wait)
+    return steps
+
+
+def test_inference_runs_exported_graph(tmpdir, dummy_config, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    config = dummy_config
+    config['default'].update({'buffer_size': 64, 'time_horizon': 16, 'max_steps': 50, 'sequence_length': 4,
+                              'hidden_units': 16, 'num_epoch': 1})
+    with open('trainer_config.yaml', 'w') as config_file:
+        yaml.dump(config, config_file)
+
+    def trainer_controller(train, load=True):
+        return TrainerController(None, 'run', 10 ** 9, None, True, load, train, 0,
+                                 1, 0, 1, '', 'trainer_config.yaml', False,
+                                 env_factory=partial(launch_simulated_environment,
+                                                     num_agents=2))
+
+    trainer_controller(True, load=False).start_learning()
+    tc = trainer_controller(False)
+    assert os.path.isfile(tc._graph_path())
+    steps = _interrupt_after(tc, 5)
+    tc.start_learning()
+    # The exported graph decides the actions, without any trainer.
+    assert len(steps) == 6
+    assert tc.trainers == {}
+
+    # The trainers run a new model when it is not loaded.
+    tc = trainer_controller(False, load=False)
+    steps = _interrupt_after(tc, 5)
+    tc.start_learning()
+    assert len(steps) == 6
+    assert list(tc.trainers) == ['SimulatedBrain']
+
+    # The trainers load the model when it was saved after the graph was exported.
+    checkpoint_path = tf.train.get_checkpoint_state(tc.model_path).model_checkpoint_path + '.index'
+    mtime = os.path.getmtime(tc._graph_path()) + 10
+    os.utime(checkpoint_path, (mtime, mtime))
+    tc = trainer_controller(False)
+    steps = _interrupt_after(tc, 5)
+    tc.start_learning()
+    assert len(steps) == 6
+    assert list(tc.trainers) == ['SimulatedBrain']
+
+
+def test_restore_checkpoint_without_normalization_steps(tmpdir, dummy_config):
+    tc = TrainerController(None, 'run', 1, None, True, True, True, 0,
+                           1, 0, 1, '', 'tests/test_unitytrainers.py', False,
+                           env_factory=launch_simulated_environment)
+    tf.reset_default_graph()
+    with tf.Session() as sess:
+        tc._initialize_trainers(dummy_config, sess)
+        trainer = tc.trainers['SimulatedBrain']
+        sess.run(tf.global_variables_initializer())
+        trainer.step = 4
+        trainer.save_step_to_graph()
+        sess.run(tf.assign(trainer.model.running_mean, np.ones(8)))
+        sess.run(tf.assign(trainer.model.running_variance, np.full(8, 10.0)))
+        # The checkpoints written before the normalization steps were saved
+        checkpoint_path = str(tmpdir.join('model.cptk'))
+        tf.train.Saver([v for v in tf.global_variables() if 'normalization_steps' not in v.op.name]).save(
+            sess, checkpoint_path)
+        sess.run(tf.global_variables_initializer())
+        tc._restore_model(sess, checkpoint_path)
+        trainer.load_step_from_graph()
+        assert trainer.get_step == 4
+        assert trainer.normalizer.count == 4
+        np.testing.assert_allclose(trainer.normalizer.mean, 1)
+        np.testing.assert_allclose(trainer.normalizer.variance, 2)
+        np.testing.assert_allclose(sess.run(trainer.model.running_variance), 2)
+        assert sess.run(trainer.model.normalization_steps) == 4
+    tc.env.close()
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_max_steps_environment_steps(tmpdir, dummy_config, monkeypatch,
+                                     pipeline):
+    monkeypatch.chdir(tmpdir)
+    config = dummy_config
+    config['default'].update({'buffer_size': 64, 'time_horizon': 16, 'max_steps': 100, 'sequence_length': 4,
+                              'hidden_units': 16, 'num_epoch': 1})
+    with open('trainer_config.yaml', 'w') as config_file:
+        yaml.dump(config, config_file)
+    tc = TrainerController(None, 'run', 10 ** 9, None, True, False, True, 0,
+                           1, 0, 1, '', 'trainer_config.yaml', False,
+                           num_envs=2,
+                           env_factory=partial(launch_simulated_environment,
+                                               num_agents=2),
+                           pipeline=pipeline)
+    step_async = tc.env.step_async
+    stepped_environments = []
+
+    def counting_step_async(*args, workers=None, **kwargs):
+        stepped_environments.append(2 if workers is None else len(workers))
+        return step_async(*args, workers=workers, **kwargs)
+
+    tc.env.step_async = counting_step_async
+    tc._export_graph = lambda: None
+    tc.start_learning()
+    # The steps of all the environments count as a single step in both modes.
+    assert 101 <= tc.global_step <= 103
+    assert abs(sum(stepped_environments) / 2 - tc.global_step) <= 1
+
+
+def test_save_model_async_update(tmpdir, dummy_config, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    config = dummy_config
+    config['default'].update({'buffer_size': 64, 'time_horizon': 16, 'max_steps': 200, 'sequence_length': 4,
+                              'hidden_units': 16, 'num_epoch': 1, 'async_update': True})
+    with open('trainer_config.yaml', 'w') as config_file:
+        yaml.dump(config, config_file)
+    tc = TrainerController(None, 'run', 10, None, True, False, True, 0,
+                           1, 0, 1, '', 'trainer_config.yaml', False,
+                           env_factory=partial(launch_simulated_environment,
+                                               num_agents=2))
+    save = tf.train.Saver.save
+    learners = []
+
+    def recording_save(saver, *args, **kwargs):
+        learners.extend([t.learner for t in tc.trainers.values()])
+        return save(saver, *args, **kwargs)
+
+    monkeypatch.setattr(tf.train.Saver, 'save', recording_save)
+    tc._export_graph = lambda: None
+    tc.start_learning()
+    # The periodic saves wait for the asynchronous updates.
+    assert len(learners) > 1
+    assert learners == [None] * len(learners)
@@ -1,14 +1,29 @@
 import unittest.mock as mock
+import os
 import pytest
+import socket
 import struct
+import subprocess
+import sys
 
 import numpy as np
 
 from unityagents import UnityEnvironment, UnityEnvironmentException, UnityActionException, \
-    BrainInfo
+    BrainInfo, UnityVecEnvironment, SimulatedCommunicator
+from unityagents.socket_communicator import SocketCommunicator
+from unityagents.rpc_communicator import UnityToExternalServicerImplementation
+from communicator_objects import AgentInfoProto, UnityRLOutput
 from .mock_communicator import MockCommunicator
 
 
+def mock_environment_factory(worker_index):
+    with mock.patch('unityagents.UnityEnvironment.executable_launcher'), \
+            mock.patch('unityagents.UnityEnvironment.get_communicator') as mock_communicator:
+        mock_communicator.return_value = MockCommunicator(
+            discrete_action=False, visual_inputs=0, num_agents=2 + worker_index)
+        return UnityEnvironment(' ')
+
+
 def test_handles_bad_filename():
     with pytest.raises(UnityEnvironmentException):
         UnityEnvironment(' ')
@@ -78,6 +93,189 @@ def test_step(mock_communicator, mock_launcher):
     assert brain_info['RealFakeBrain'].local_done[2]
 
 
+@mock.patch('unityagents.UnityEnvironment.executable_launcher')
+@mock.patch('unityagents.UnityEnvironment.get_communicator')
+def test_step_async(mock_communicator, mock_launcher):
+    mock_communicator.return_value = MockCommunicator(
+        discrete_action=False, visual_inputs=0)
+    env = UnityEnvironment(' ')
+    brain = env.brains['RealFakeBrain']
+    brain_info = env.reset()
+    n_actions = brain.vector_action_space_size[0] * len(brain_info['RealFakeBrain'].agents)
+    with pytest.raises(UnityActionException):
+        env.step_wait()
+    env.step_async([0] * n_actions)
+    with pytest.raises(UnityActionException):
+        env.step_async([0] * n_actions)
+    with pytest.raises(UnityActionException):
+        env.reset()
+    brain_info = env.step_wait()
+    assert not env.global_done
+    assert len(brain_info['RealFakeBrain'].agents) == 3
+    env.step_async([-1] * n_actions)
+    env.step_wait()
+    assert env.global_done
+    env.close()
+
+
+@mock.patch('unityagents.UnityEnvironment.executable_launcher')
+@mock.patch('unityagents.UnityEnvironment.get_communicator')
+def test_generate_step_input(mock_communicator, mock_launcher):
+    mock_communicator.return_value = MockCommunicator(
+        discrete_action=False, visual_inputs=0)
+    env = UnityEnvironment(' ')
+    env.reset()
+    vector_action = np.arange(6, dtype=np.float32).reshape(3, 2)
+    value = np.array([[0.5], [1.5], [2.5]])
+    rl_input = env._generate_step_input({'RealFakeBrain': env._flatten(vector_action)}, {},
+                                        {'RealFakeBrain': [''] * 3},
+                                        {'RealFakeBrain': env._flatten(value)}).rl_input
+    actions = rl_input.agent_actions['RealFakeBrain'].value
+    assert [list(x.vector_actions) for x in actions] == [[0, 1], [2, 3], [4, 5]]
+    assert [x.value for x in actions] == [0.5, 1.5, 2.5]
+    assert all([len(x.memories) == 0 for x in actions])
+    rl_input = env._generate_step_input({'RealFakeBrain': env._flatten(vector_action)},
+                                        {'RealFakeBrain': env._flatten([[1], [2], [3]])},
+                                        {'RealFakeBrain': [''] * 3}, {}).rl_input
+    actions = rl_input.agent_actions['RealFakeBrain'].value
+    assert [list(x.memories) for x in actions] == [[1], [2], [3]]
+    assert [x.value for x in actions] == [0, 0, 0]
+    env.close()
+
+
+@mock.patch('unityagents.UnityEnvironment.executable_launcher')
+@mock.patch('unityagents.UnityEnvironment.get_communicator')
+def test_visual_observations(mock_communicator, mock_launcher):
+    mock_communicator.return_value = MockCommunicator(
+        discrete_action=False, visual_inputs=2)
+    env = UnityEnvironment(' ')
+    brain_info = env.reset()['RealFakeBrain']
+    expected = np.arange(40 * 30 * 3, dtype=np.uint8).reshape(40, 30, 3)
+    assert len(brain_info.visual_observations) == 2
+    for visual_observation in brain_info.visual_observations:
+        assert visual_observation.dtype == np.uint8
+        assert visual_observation.shape == (3, 40, 30, 3)
+        assert (visual_observation == expected).all()
+    gray = UnityEnvironment._process_pixels(mock_communicator.return_value.visual_observation, True)
+    assert gray.dtype == np.uint8
+    assert gray.shape == (40, 30, 1)
+    assert gray[0, 0, 0] == 1
+    env.close()
+
+
+@mock.patch('unityagents.UnityEnvironment.executable_launcher')
+@mock.patch('unityagents.UnityEnvironment.get_communicator')
+def test_get_state(mock_communicator, mock_launcher):
+    mock_communicator.return_value = MockCommunicator(
+        discrete_action=False, visual_inputs=0)
+    env = UnityEnvironment(' ')
+    agent_infos = [
+        AgentInfoProto(stacked_vector_observation=[1, float('nan'), 3], reward=float('nan'),
+                       stored_vector_actions=[1, 2], memories=[1], id=0),
+        AgentInfoProto(stacked_vector_observation=[4, 5, 6], reward=2, stored_vector_actions=[3, 4],
+                       memories=[1, 2, 3], done=True, max_step_reached=True, id=1)]
+    all_brain_info, global_done = env._get_state(UnityRLOutput(
+        agentInfos={'RealFakeBrain': UnityRLOutput.ListAgentInfoProto(value=agent_infos)}))
+    brain_info = all_brain_info['RealFakeBrain']
+    assert not global_done
+    assert brain_info.vector_observations.dtype == np.float32
+    assert brain_info.vector_observations.tolist() == [[1, 0, 3], [4, 5, 6]]
+    assert brain_info.rewards.tolist() == [0, 2]
+    assert brain_info.local_done.tolist() == [False, True]
+    assert brain_info.max_reached.tolist() == [False, True]
+    assert brain_info.memories.tolist() == [[1, 0, 0], [1, 2, 3]]
+    assert brain_info.previous_vector_actions.tolist() == [[1, 2], [3, 4]]
+    assert brain_info.agents == [0, 1]
+    # Infinite observations are clamped even without NaN.
+    all_brain_info, _ = env._get_state(UnityRLOutput(agentInfos={'RealFakeBrain': UnityRLOutput.ListAgentInfoProto(
+        value=[AgentInfoProto(stacked_vector_observation=[1, float('inf'), -float('inf')], id=0)])}))
+    assert np.isfinite(all_brain_info['RealFakeBrain'].vector_observations).all()
+    env.close()
+
+
+@mock.patch('unityagents.UnityEnvironment.executable_launcher')
+@mock.patch('unityagents.UnityEnvironment.get_communicator')
+def test_shared_memory(mock_communicator, mock_launcher, tmpdir):
+    path = str(tmpdir.join('shared_memory'))
+    comm = MockCommunicator(discrete_action=False, visual_inputs=0, shared_memory_path=path)
+    mock_communicator.return_value = comm
+    env = UnityEnvironment(' ', shared_memory_path=path)
+    brain_info = env.reset()['RealFakeBrain']
+    assert brain_info.vector_observations.dtype == np.float32
+    assert brain_info.vector_observations.tolist() == [[10 * x + i for x in [1, 2, 3, 1, 2, 3]] for i in range(3)]
+    assert brain_info.rewards.tolist() == [0.5, 1.5, 2.5]
+    assert brain_info.local_done.tolist() == [False, True, False]
+    previous_observations = brain_info.vector_observations
+    for _ in range(comm.shared_memory.n_slots):
+        brain_info = env.step([0] * 6)['RealFakeBrain']
+    assert previous_observations.tolist() == brain_info.vector_observations.tolist()
+    assert previous_observations.flags.writeable
+    env.close()
+
+
+def test_rpc_servicer_connection():
+    servicer = UnityToExternalServicerImplementation()
+    message = object()
+    assert not servicer.parent_conn.poll(0.01)
+    servicer.child_conn.send(message)
+    assert servicer.parent_conn.poll(0.01)
+    assert servicer.parent_conn.recv() is message
+    servicer.parent_conn.close()
+    with pytest.raises(EOFError):
+        servicer.child_conn.recv()
+
+
+def test_socket_communicator_receive():
+    comm = SocketCommunicator()
+    comm._conn, unity = socket.socketpair()
+    small_message, large_message = b'abc', bytes(range(256)) * 100
+    framed = struct.pack("I", len(small_message)) + small_message + \
+        struct.pack("I", len(large_message)) + large_message
+    # The header and the payload can be split across several reads
+    unity.sendall(framed[:2])
+    unity.sendall(framed[2:9])
+    assert comm._communicator_receive() == small_message
+    unity.sendall(framed[9:])
+    assert comm._communicator_receive() == large_message
+    comm._communicator_send(small_message)
+    assert unity.recv(100) == framed[:7]
+    unity.close()
+    with pytest.raises(UnityEnvironmentException):
+        comm._communicator_receive()
+    comm._conn.close()
+
+
+def test_socket_communicator_exchange_pure_python_protobuf():
+    # The implementation of protobuf is chosen when it is first imported, hence the separate interpreter.
+    script = """
+import socket
+import struct
+from communicator_objects import UnityInput, UnityMessage
+from google.protobuf.internal import api_implementation
+from unityagents.socket_communicator import SocketCommunicator
+assert api_implementation.Type() == 'python'
+comm = SocketCommunicator()
+comm._conn, unity = socket.socketpair()
+message = UnityMessage()
+message.header.status = 200
+message.unity_output.rl_output.global_done = True
+payload = message.SerializeToString()
+unity.sendall(struct.pack('I', len(payload)) + payload)
+assert comm.exchange(UnityInput()).rl_output.global_done
+"""
+    env = dict(os.environ, PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION='python')
+    subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_agent_index():
+    info = BrainInfo([], np.zeros((3, 1)), [''] * 3, agents=[7, 3, 5])
+    assert info.agent_index == {7: 0, 3: 1, 5: 2}
+    assert info.agent_index[5] == info.agents.index(5)
+    info.agents = ['0-7', '0-3', '0-5']
+    assert info.agent_index['0-3'] == 1
+
+
 @mock.patch('unityagents.UnityEnvironment.executable_launcher')
 @mock.patch('unityagents.UnityEnvironment.get_communicator')
 def test_close(mock_communicator, mock_launcher):
@@ -91,5 +289,69 @@ def test_close(mock_communicator, mock_launcher):
     assert comm.has_been_closed
 
 
+def test_simulated_environment():
+    comm = SimulatedCommunicator(num_agents=4, vector_observation_size=3, num_stacked_vector_observations=2,
+                                 camera_resolutions=[(20, 10, True)], vector_action_space_type='discrete',
+                                 vector_action_size=[3, 2], max_step=3, goal_radius=0)
+    env = UnityEnvironment(communicator=comm)
+    brain = env.brains['SimulatedBrain']
+    assert brain.vector_action_space_type == 'discrete'
+    assert brain.vector_action_space_size == [3, 2]
+    brain_info = env.reset()['SimulatedBrain']
+    assert brain_info.vector_observations.shape == (4, 6)
+    assert brain_info.visual_observations[0].shape == (4, 20, 10, 1)
+    assert not brain_info.local_done.any()
+    for step in range(3):
+        brain_info = env.step(np.ones((4, 2)), memory=np.full((4, 2), step))['SimulatedBrain']
+    assert brain_info.previous_vector_actions.tolist() == [[1, 1]] * 4
+    assert brain_info.memories.tolist() == [[2, 2]] * 4
+    assert brain_info.local_done.all()
+    assert brain_info.max_reached.all()
+    brain_info = env.step(np.zeros((4, 2)))['SimulatedBrain']
+    assert not brain_info.local_done.any()
+    env.close()
+    assert comm.has_been_closed
+
+
+def test_vec_environment():
+    env = UnityVecEnvironment(mock_environment_factory, n_env=2)
+    assert env.brain_names[0] == 'RealFakeBrain'
+    brain = env.brains['RealFakeBrain']
+    with pytest.raises(UnityActionException):
+        env.step([0] * 10)
+    brain_info = env.reset()['RealFakeBrain']
+    assert brain_info.agents == ['0-0', '0-1', '1-0', '1-1', '1-2']
+    assert brain_info.vector_observations.shape == (5, brain.vector_observation_space_size *
+                                                    brain.num_stacked_vector_observations)
+    brain_info = env.step(np.zeros((5, brain.vector_action_space_size[0])))['RealFakeBrain']
+    assert len(brain_info.agents) == 5
+    assert brain_info.local_done.tolist() == [False, False, False, False, True]
+    assert not env.global_done
+    env.step({'RealFakeBrain': np.array([-1] * 10)})
+    assert env.global_done
+    env.close()
+    with pytest.raises(UnityEnvironmentException):
+        env.close()
+
+
+def test_vec_environment_workers():
+    env = UnityVecEnvironment(mock_environment_factory, n_env=2)
+    assert env.reset(workers=[1])['RealFakeBrain'].agents == ['1-0', '1-1', '1-2']
+    assert env.global_done is None
+    with pytest.raises(UnityActionException):
+        env.step_async(np.zeros((2, 2)), workers=[0])
+    assert env.reset(workers=[0])['RealFakeBrain'].agents == ['0-0', '0-1']
+    env.step_async(np.zeros((2, 2)), workers=[0])
+    with pytest.raises(UnityActionException):
+        env.step_async(np.zeros((2, 2)), workers=[0])
+    env.step_async(np.zeros((3, 2)), workers=[1])
+    assert env.step_wait(workers=[1])['RealFakeBrain'].agents == ['1-0', '1-1', '1-2']
+    with pytest.raises(UnityActionException):
+        env.step_wait(workers=[1])
+    assert env.step_wait()['RealFakeBrain'].agents == ['0-0', '0-1']
+    assert not env.global_done
+    env.close()
+
+
 if __name__ == '__main__':
     pytest.main()
@@ -1,3 +1,5 @@
 from .environment import *
+from .vec_environment import *
+from .simulated_communicator import *
 from .brain import *
 from .exception import *
@@ -1,3 +1,5 @@
+import numpy as np
+
 from typing import Dict
 
 
@@ -19,6 +21,60 @@ class BrainInfo:
         self.previous_vector_actions = vector_action
         self.previous_text_actions = text_action
 
+    @property
+    def agents(self):
+        return self._agents
+
+    @agents.setter
+    def agents(self, agents):
+        self._agents = agents
+        self._agent_index = None
+
+    @property
+    def agent_index(self):
+        """
+        Dictionary of agent id to the row of the agent in this BrainInfo, built on first use.
+        """
+        if self._agent_index is None:
+            self._agent_index = {agent_id: i for i, agent_id in enumerate(self._agents)}
+        return self._agent_index
+
+    @staticmethod
+    def merge_instances(brain_infos):
+        """
+        Concatenates the BrainInfos of the same brain coming from several environments into a single BrainInfo.
+        Agents are kept in the order of the list of BrainInfos.
+        :param brain_infos: List of BrainInfo corresponding to the same brain.
+        :return: The merged BrainInfo.
+        """
+        non_empty = [x for x in brain_infos if len(x.agents) > 0]
+        if len(non_empty) == 0:
+            return brain_infos[0]
+        if len(non_empty) == 1:
+            return non_empty[0]
+        visual_observations = [np.concatenate([x.visual_observations[i] for x in non_empty])
+                               for i in range(len(non_empty[0].visual_observations))]
+        memory_size = max([x.memories.shape[1] for x in non_empty])
+        if memory_size == 0:
+            memories = np.zeros((0, 0))
+        else:
+            memories = np.concatenate([
+                np.pad(x.memories, ((0, 0), (0, memory_size - x.memories.shape[1])), 'constant')
+                if x.memories.shape[1] > 0 else np.zeros((len(x.agents), memory_size))
+                for x in non_empty])
+        return BrainInfo(
+            visual_observation=visual_observations,
+            vector_observation=np.concatenate([x.vector_observations for x in non_empty]),
+            text_observations=[t for x in non_empty for t in x.text_observations],
+            memory=memories,
+            reward=np.concatenate([x.rewards for x in non_empty]),
+            agents=[a for x in non_empty for a in x.agents],
+            local_done=np.concatenate([x.local_done for x in non_empty]),
+            vector_action=np.concatenate([x.previous_vector_actions for x in non_empty]),
+            text_action=[t for x in non_empty for t in x.previous_text_actions],
+            max_reached=np.concatenate([x.max_reached for x in non_empty])
+        )
+
 
 AllBrainInfo = Dict[str, BrainInfo]
 
@@ -1,15 +1,20 @@
 import atexit
 import glob
 import io
+import itertools
 import logging
 import numpy as np
 import os
+import queue
 import subprocess
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from .brain import BrainInfo, BrainParameters, AllBrainInfo
 from .exception import UnityEnvironmentException, UnityActionException, UnityTimeOutException
+from .shared_memory import SharedMemoryReader
 
-from communicator_objects import UnityRLInput, UnityRLOutput, AgentActionProto,\
+from communicator_objects import UnityRLInput, UnityRLOutput,\
     EnvironmentParametersProto, UnityRLInitializationInput, UnityRLInitializationOutput,\
     UnityInput, UnityOutput
 
@@ -27,7 +32,7 @@ logger = logging.getLogger("unityagents")
 class UnityEnvironment(object):
     def __init__(self, file_name=None, worker_id=0,
                  base_port=5005, seed=0,
-                 docker_training=False, no_graphics=False):
+                 docker_training=False, no_graphics=False, shared_memory_path=None, communicator=None):
         """
         Starts a new unity environment and establishes a connection with the environment.
         Notice: Currently communication between Unity and Python takes place over an open socket without authentication.
@@ -38,6 +43,10 @@ class UnityEnvironment(object):
         :int worker_id: Number to add to communication port (5005) [0]. Used for asynchronous agent scenarios.
         :param docker_training: Informs this class whether the process is being run within a container.
         :param no_graphics: Whether to run the Unity simulator in no-graphics mode
+        :param shared_memory_path: If set, the environment writes the vector observations, rewards and done flags
+        to this memory mapped file instead of the UnityMessage. Only for environments running on the same host.
+        :param communicator: Communicator to use instead of connecting to a Unity environment, for instance a
+        SimulatedCommunicator. No environment is launched when it is given.
         """
 
         atexit.register(self._close)
@@ -46,18 +55,28 @@ class UnityEnvironment(object):
         self._version_ = "API-4"
         self._loaded = False    # If true, this means the environment was successfully loaded
         self.proc1 = None       # The process that is started. If None, no process was started
-        self.communicator = self.get_communicator(worker_id, base_port)
-
-        # If the environment name is None, a new environment will not be launched
-        # and the communicator will directly try to connect to an existing unity environment.
-        # If the worker-id is not 0 and the environment name is None, an error is thrown
-        if file_name is None and worker_id!=0:
-            raise UnityEnvironmentException(
-                "If the environment name is None, the worker-id must be 0 in order to connect with the Editor.")
-        if file_name is not None:
-            self.executable_launcher(file_name, docker_training, no_graphics)
+        self._step_pending = False
+        self._exchange_thread = None  # Runs the communicator exchanges started by step_async
+        self._exchange_requests = queue.Queue()
+        self._exchange_results = queue.Queue()
+        self._shared_memory_path = shared_memory_path
+        self._shared_memory = None
+        self._decode_executor = None  # Decodes the visual observations, created with the first one
+        if communicator is not None:
+            self.communicator = communicator
         else:
-            logger.info("Start training by pressing the Play button in the Unity Editor.")
+            self.communicator = self.get_communicator(worker_id, base_port)
+
+            # If the environment name is None, a new environment will not be launched
+            # and the communicator will directly try to connect to an existing unity environment.
+            # If the worker-id is not 0 and the environment name is None, an error is thrown
+            if file_name is None and worker_id!=0:
+                raise UnityEnvironmentException(
+                    "If the environment name is None, the worker-id must be 0 in order to connect with the Editor.")
+            if file_name is not None:
+                self.executable_launcher(file_name, docker_training, no_graphics)
+            else:
+                logger.info("Start training by pressing the Play button in the Unity Editor.")
         self._loaded = True
 
         rl_init_parameters_in = UnityRLInitializationInput(
@@ -75,6 +94,9 @@ class UnityEnvironment(object):
                 "The API number is not compatible between Unity and python. Python API : {0}, Unity API : "
                 "{1}.\nPlease go to https://github.com/Unity-Technologies/ml-agents to download the latest version "
                 "of ML-Agents.".format(self._version_, self._unity_version))
+        if shared_memory_path is not None:
+            # The environment creates the file while it initializes.
+            self._shared_memory = SharedMemoryReader(shared_memory_path)
         self._n_agents = {}
         self._global_done = None
         self._academy_name = aca_params.name
@@ -94,8 +116,8 @@ class UnityEnvironment(object):
                     "vectorObservationSize": brain_param.vector_observation_size,
                     "numStackedVectorObservations": brain_param.num_stacked_vector_observations,
                     "cameraResolutions": resolution,
-                    "vectorActionSize": brain_param.vector_action_size,
-                    "vectorActionDescriptions": brain_param.vector_action_descriptions,
+                    "vectorActionSize": list(brain_param.vector_action_size),
+                    "vectorActionDescriptions": list(brain_param.vector_action_descriptions),
                     "vectorActionSpaceType": brain_param.vector_action_space_type
                 })
             if brain_param.brain_type == 2:
@@ -181,15 +203,18 @@ class UnityEnvironment(object):
                                             .format(true_filename))
         else:
             logger.debug("This is the launch string {}".format(launch_string))
+            shared_memory_args = []
+            if self._shared_memory_path is not None:
+                shared_memory_args = ['--shared-memory', self._shared_memory_path]
             # Launch Unity environment
             if not docker_training:
                 if no_graphics:
                     self.proc1 = subprocess.Popen(
                         [launch_string,'-nographics', '-batchmode',
-                         '--port', str(self.port)])
+                         '--port', str(self.port)] + shared_memory_args)
                 else:
                     self.proc1 = subprocess.Popen(
-                        [launch_string, '--port', str(self.port)])
+                        [launch_string, '--port', str(self.port)] + shared_memory_args)
             else:
                 """
                 Comments for future maintenance:
@@ -211,6 +236,8 @@ class UnityEnvironment(object):
                 docker_ls = ("exec xvfb-run --auto-servernum"
                              " --server-args='-screen 0 640x480x24'"
                              " {0} --port {1}").format(launch_string, str(self.port))
+                if shared_memory_args:
+                    docker_ls += " --shared-memory '{0}'".format(self._shared_memory_path)
                 self.proc1 = subprocess.Popen(docker_ls,
                                               stdout=subprocess.PIPE,
                                               stderr=subprocess.PIPE,
@@ -249,6 +276,8 @@ class UnityEnvironment(object):
             else:
                 raise UnityEnvironmentException("The parameter '{0}' is not a valid parameter.".format(k))
 
+        if self._step_pending:
+            raise UnityActionException("A step is in progress. Call 'step_wait()' before resetting.")
         if self._loaded:
             outputs = self.communicator.exchange(
                 self._generate_reset_input(train_mode, config)
@@ -273,6 +302,19 @@ class UnityEnvironment(object):
         :param text_action: Text action to send to environment for.
         :return: AllBrainInfo  : A Data structure corresponding to the new state of the environment.
         """
+        self.step_async(vector_action, memory, text_action, value)
+        return self.step_wait()
+
+    def step_async(self, vector_action=None, memory=None, text_action=None, value=None):
+        """
+        Sends an action to the environment without waiting for the environment to simulate it. The resulting
+        AllBrainInfo must be collected with step_wait before the environment can be stepped or reset again.
+        :param vector_action: Agent's vector action to send to environment. Can be a scalar or vector of int/floats.
+        :param memory: Vector corresponding to memory used for RNNs, frame-stacking, or other auto-regressive process.
+        :param text_action: Text action to send to environment for.
+        """
+        if self._step_pending:
+            raise UnityActionException("A step is already in progress. Call 'step_wait()' before stepping again.")
         vector_action = {} if vector_action is None else vector_action
         memory = {} if memory is None else memory
         text_action = {} if text_action is None else text_action
@@ -335,18 +377,17 @@ class UnityEnvironment(object):
                 if b not in vector_action:
                     # raise UnityActionException("You need to input an action for the brain {0}".format(b))
                     if self._brains[b].vector_action_space_type == "discrete":
-                        vector_action[b] = [0.0] * n_agent * len(self._brains[b].vector_action_space_size)
+                        vector_action[b] = np.zeros(n_agent * len(self._brains[b].vector_action_space_size),
+                                                    dtype=np.float32)
                     else:
-                        vector_action[b] = [0.0] * n_agent * self._brains[b].vector_action_space_size[0]
+                        vector_action[b] = np.zeros(n_agent * self._brains[b].vector_action_space_size[0],
+                                                    dtype=np.float32)
                 else:
                     vector_action[b] = self._flatten(vector_action[b])
-                if b not in memory:
-                    memory[b] = []
-                else:
-                    if memory[b] is None:
-                        memory[b] = []
-                    else:
-                        memory[b] = self._flatten(memory[b])
+                if memory.get(b) is not None:
+                    memory[b] = self._flatten(memory[b])
+                if value.get(b) is not None:
+                    value[b] = self._flatten(value[b])
                 if b not in text_action:
                     text_action[b] = [""] * n_agent
                 else:
@@ -372,17 +413,7 @@ class UnityEnvironment(object):
                         self._brains[b].vector_action_space_type,
                         str(vector_action[b])))
 
-            outputs = self.communicator.exchange(
-                self._generate_step_input(vector_action, memory, text_action, value)
-            )
-            if outputs is None:
-                raise KeyboardInterrupt
-            rl_output = outputs.rl_output
-            s = self._get_state(rl_output)
-            self._global_done = s[1]
-            for _b in self._external_brain_names:
-                self._n_agents[_b] = len(s[0][_b].agents)
-            return s[0]
+            self._exchange_async(self._generate_step_input(vector_action, memory, text_action, value))
         elif not self._loaded:
             raise UnityEnvironmentException("No Unity environment is loaded.")
         elif self._global_done:
@@ -391,6 +422,48 @@ class UnityEnvironment(object):
             raise UnityActionException(
                 "You cannot conduct step without first calling reset. Reset the environment with 'reset()'")
 
+    def step_wait(self) -> AllBrainInfo:
+        """
+        Waits for the environment to simulate the action sent with step_async, and returns
+        observation, state, and reward information to the agent.
+        :return: AllBrainInfo  : A Data structure corresponding to the new state of the environment.
+        """
+        if not self._step_pending:
+            raise UnityActionException("No step is in progress. Call 'step_async()' before 'step_wait()'.")
+        outputs, error = self._exchange_results.get()
+        self._step_pending = False
+        if error is not None:
+            raise error
+        if outputs is None:
+            raise KeyboardInterrupt
+        rl_output = outputs.rl_output
+        s = self._get_state(rl_output)
+        self._global_done = s[1]
+        for _b in self._external_brain_names:
+            self._n_agents[_b] = len(s[0][_b].agents)
+        return s[0]
+
+    def _exchange_async(self, inputs: UnityInput):
+        """
+        Hands the inputs to the exchange thread. The thread is a daemon so that an environment which stopped
+        responding does not prevent the interpreter from exiting.
+        """
+        if self._exchange_thread is None:
+            self._exchange_thread = threading.Thread(target=self._exchange_loop, daemon=True)
+            self._exchange_thread.start()
+        self._step_pending = True
+        self._exchange_requests.put(inputs)
+
+    def _exchange_loop(self):
+        while True:
+            inputs = self._exchange_requests.get()
+            if inputs is None:
+                return
+            try:
+                self._exchange_results.put((self.communicator.exchange(inputs), None))
+            except Exception as e:
+                self._exchange_results.put((None, e))
+
     def close(self):
         """
         Sends a shutdown signal to the unity environment, and closes the socket connection.
@@ -402,45 +475,69 @@ class UnityEnvironment(object):
 
     def _close(self):
         self._loaded = False
+        if self._exchange_thread is not None:
+            self._exchange_requests.put(None)
+            self._exchange_thread = None
         self.communicator.close()
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory = None
+        if self._decode_executor is not None:
+            self._decode_executor.shutdown(wait=False)
+            self._decode_executor = None
         if self.proc1 is not None:
             self.proc1.kill()
 
     @staticmethod
     def _flatten(arr):
         """
-        Converts arrays to list.
+        Converts scalars, lists and arrays to a flat float32 array, without copying contiguous float32 arrays.
         :param arr: numpy vector.
-        :return: flattened list.
+        :return: flattened float32 array.
         """
-        if isinstance(arr, (int, np.int_, float, np.float_)):
-            arr = [float(arr)]
-        if isinstance(arr, np.ndarray):
-            arr = arr.tolist()
-        if len(arr) == 0:
-            return arr
-        if isinstance(arr[0], np.ndarray):
-            arr = [item for sublist in arr for item in sublist.tolist()]
-        if isinstance(arr[0], list):
-            arr = [item for sublist in arr for item in sublist]
-        arr = [float(x) for x in arr]
-        return arr
+        return np.ravel(np.asarray(arr, dtype=np.float32))
 
     @staticmethod
     def _process_pixels(image_bytes, gray_scale):
         """
         Converts byte array observation image into numpy array, re-sizes it, and optionally converts it to grey scale
         :param image_bytes: input byte array corresponding to image
-        :return: processed numpy array of observation from environment
+        :return: processed uint8 numpy array of observation from environment
         """
-        s = bytearray(image_bytes)
-        image = Image.open(io.BytesIO(s))
-        s = np.array(image) / 255.0
+        image = Image.open(io.BytesIO(image_bytes))
+        s = np.asarray(image, dtype=np.uint8)
         if gray_scale:
-            s = np.mean(s, axis=2)
+            s = np.rint(np.mean(s, axis=2, dtype=np.float32)).astype(np.uint8)
             s = np.reshape(s, [s.shape[0], s.shape[1], 1])
         return s
 
+    def _process_visual_observations(self, brain_name, agent_info_list):
+        """
+        Decodes the visual observations of all the agents and cameras of a brain on a thread pool,
+        since PIL releases the GIL while decoding.
+        :return: List with one uint8 array of shape (n_agents, height, width, channels) per camera.
+        """
+        n_agents = len(agent_info_list)
+        vis_obs = []
+        for resolution in self.brains[brain_name].camera_resolutions:
+            vis_obs.append(np.empty((n_agents, resolution['height'], resolution['width'],
+                                     1 if resolution['blackAndWhite'] else 3), dtype=np.uint8))
+
+        def decode(task):
+            i, j = task
+            vis_obs[i][j] = self._process_pixels(agent_info_list[j].visual_observations[i],
+                                                 self.brains[brain_name].camera_resolutions[i]['blackAndWhite'])
+
+        tasks = [(i, j) for i in range(len(vis_obs)) for j in range(n_agents)]
+        if len(tasks) > 1:
+            if self._decode_executor is None:
+                self._decode_executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+            list(self._decode_executor.map(decode, tasks))
+        else:
+            for task in tasks:
+                decode(task)
+        return vis_obs
+
     def _get_state(self, output: UnityRLOutput) -> (AllBrainInfo, bool):
         """
         Collects experience information from all external brains in environment at current step.
@@ -449,59 +546,107 @@ class UnityEnvironment(object):
         _data = {}
         global_done = output.global_done
         for b in output.agentInfos:
-            agent_info_list = output.agentInfos[b].value
-            vis_obs = []
-            for i in range(self.brains[b].number_visual_observations):
-                obs = [self._process_pixels(x.visual_observations[i],
-                                            self.brains[b].camera_resolutions[i]['blackAndWhite'])
-                    for x in agent_info_list]
-                vis_obs += [np.array(obs)]
-            if len(agent_info_list) == 0:
-                memory_size = 0
-            else:
-                memory_size = max([len(x.memories) for x in agent_info_list])
-            if memory_size == 0:
-                memory = np.zeros((0, 0))
-            else:
-                [x.memories.extend([0] * (memory_size - len(x.memories))) for x in agent_info_list]
-                memory = np.array([x.memories for x in agent_info_list])
-            if any([np.isnan(x.reward) for x in agent_info_list]):
-                logger.warning("An agent had a NaN reward for brain "+b)
-            if any([np.isnan(x.stacked_vector_observation).any() for x in agent_info_list]):
-                logger.warning("An agent had a NaN observation for brain " + b)
-            _data[b] = BrainInfo(
-                visual_observation=vis_obs,
-                vector_observation=np.nan_to_num(np.array([x.stacked_vector_observation for x in agent_info_list])),
-                text_observations=[x.text_observation for x in agent_info_list],
-                memory=memory,
-                reward=[x.reward if not np.isnan(x.reward) else 0 for x in agent_info_list],
-                agents=[x.id for x in agent_info_list],
-                local_done=[x.done for x in agent_info_list],
-                vector_action=np.array([x.stored_vector_actions for x in agent_info_list]),
-                text_action=[x.stored_text_actions for x in agent_info_list],
-                max_reached=[x.max_step_reached for x in agent_info_list]
-                )
+            _data[b] = self._get_brain_info(b, output.agentInfos[b].value)
         return _data, global_done
 
+    def _get_brain_info(self, brain_name, agent_info_list) -> BrainInfo:
+        """
+        Builds the BrainInfo of a brain in a single pass over its agents. The repeated fields are streamed
+        straight into float32 arrays and the NaN checks run on the finished arrays.
+        When the shared memory transport is used, the vector observations, rewards and done flags are copied
+        out of the shared memory frame once, since the trainers keep the BrainInfos after the frame is overwritten.
+        :param brain_name: Name of the brain.
+        :param agent_info_list: The AgentInfoProtos of the agents of the brain.
+        :return: The BrainInfo of the brain.
+        """
+        n_agents = len(agent_info_list)
+        frame = None
+        if self._shared_memory is not None:
+            frame = self._shared_memory.latest_frame(brain_name)
+            if frame is not None and frame.n_agents != n_agents:
+                raise UnityEnvironmentException(
+                    "The shared memory frame of the brain {0} has {1} agents but {2} were expected."
+                    .format(brain_name, frame.n_agents, n_agents))
+        vis_obs = self._process_visual_observations(brain_name, agent_info_list)
+        observation_size = len(agent_info_list[0].stacked_vector_observation) if n_agents > 0 else 0
+        action_size = len(agent_info_list[0].stored_vector_actions) if n_agents > 0 else 0
+        vector_obs, vector_action, memories = [], [], []
+        rewards, local_done, max_reached = [], [], []
+        text_observations, agents, text_action = [], [], []
+        for x in agent_info_list:
+            vector_obs.append(x.stacked_vector_observation)
+            vector_action.append(x.stored_vector_actions)
+            memories.append(x.memories)
+            rewards.append(x.reward)
+            local_done.append(x.done)
+            max_reached.append(x.max_step_reached)
+            text_observations.append(x.text_observation)
+            agents.append(x.id)
+            text_action.append(x.stored_text_actions)
+        if frame is not None:
+            vector_obs = np.array(frame.vector_observations)
+            rewards = np.array(frame.rewards)
+            local_done = np.array(frame.local_done)
+        else:
+            vector_obs = np.fromiter(itertools.chain.from_iterable(vector_obs), dtype=np.float32,
+                                     count=n_agents * observation_size).reshape(n_agents, observation_size)
+            rewards = np.array(rewards, dtype=np.float32)
+            local_done = np.array(local_done, dtype=bool)
+        vector_action = np.fromiter(itertools.chain.from_iterable(vector_action), dtype=np.float32,
+                                    count=n_agents * action_size).reshape(n_agents, action_size)
+        max_reached = np.array(max_reached, dtype=bool)
+        memory_size = max([len(x) for x in memories]) if n_agents > 0 else 0
+        if memory_size == 0:
+            memory = np.zeros((0, 0))
+        else:
+            memory = np.zeros((n_agents, memory_size), dtype=np.float32)
+            for i, agent_memory in enumerate(memories):
+                memory[i, :len(agent_memory)] = agent_memory
+        nan_rewards = np.isnan(rewards)
+        if nan_rewards.any():
+            logger.warning("An agent had a NaN reward for brain " + brain_name)
+            rewards[nan_rewards] = 0
+        if not np.isfinite(vector_obs).all():
+            if np.isnan(vector_obs).any():
+                logger.warning("An agent had a NaN observation for brain " + brain_name)
+            # Infinite observations are clamped to the largest finite floats.
+            np.nan_to_num(vector_obs, copy=False)
+        return BrainInfo(
+            visual_observation=vis_obs,
+            vector_observation=vector_obs,
+            text_observations=text_observations,
+            memory=memory,
+            reward=rewards,
+            agents=agents,
+            local_done=local_done,
+            vector_action=vector_action,
+            text_action=text_action,
+            max_reached=max_reached
+        )
+
     def _generate_step_input(self, vector_action, memory, text_action, value) -> UnityRLInput:
+        """
+        Fills one AgentActionProto per agent from the flat float32 arrays of each brain. The arrays are converted to
+        Python lists once per brain, memories and values are only written for the brains which provided them.
+        """
         rl_in = UnityRLInput()
+        rl_in.command = 0
         for b in vector_action:
             n_agents = self._n_agents[b]
             if n_agents == 0:
                 continue
-            _a_s = len(vector_action[b]) // n_agents
-            _m_s = len(memory[b]) // n_agents
+            actions = vector_action[b].reshape(n_agents, -1).tolist()
+            memories = memory[b].reshape(n_agents, -1).tolist() \
+                if memory.get(b) is not None and len(memory[b]) > 0 else None
+            values = value[b].tolist() if value.get(b) is not None else None
+            texts = text_action[b]
+            agent_actions = rl_in.agent_actions[b].value
             for i in range(n_agents):
-                action = AgentActionProto(
-                    vector_actions=vector_action[b][i*_a_s: (i+1)*_a_s],
-                    memories=memory[b][i*_m_s: (i+1)*_m_s],
-                    text_actions=text_action[b][i],
-                )
-                if b in value:
-                    if value[b] is not None:
-                        action.value = value[b][i]
-                rl_in.agent_actions[b].value.extend([action])
-                rl_in.command = 0
+                action = agent_actions.add(vector_actions=actions[i], text_actions=texts[i])
+                if memories is not None:
+                    action.memories.extend(memories[i])
+                if values is not None:
+                    action.value = values[i]
         return self.wrap_unity_input(rl_in)
 
     def _generate_reset_input(self, training, config) -> UnityRLInput:
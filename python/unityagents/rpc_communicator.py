@@ -1,7 +1,7 @@
 import logging
+import queue
 import grpc
 
-from multiprocessing import Pipe
 from concurrent.futures import ThreadPoolExecutor
 
 from .communicator import Communicator
@@ -14,9 +14,48 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("unityagents")
 
 
+class _Connection(object):
+    _closed = object()
+
+    def __init__(self, incoming, outgoing):
+        """
+        One end of an in-process connection with the send, recv, poll and close methods of a multiprocessing
+        Connection. Messages are handed over as objects, without being pickled.
+        """
+        self._incoming = incoming
+        self._outgoing = outgoing
+        self._pending = []
+
+    def send(self, message):
+        self._outgoing.put(message)
+
+    def poll(self, timeout=0.0):
+        if not self._pending:
+            try:
+                self._pending.append(self._incoming.get(timeout=timeout))
+            except queue.Empty:
+                return False
+        return True
+
+    def recv(self):
+        message = self._pending.pop() if self._pending else self._incoming.get()
+        if message is self._closed:
+            self._incoming.put(message)
+            raise EOFError
+        return message
+
+    def close(self):
+        self._outgoing.put(self._closed)
+
+
+def _connection_pair():
+    parent_to_child, child_to_parent = queue.Queue(), queue.Queue()
+    return _Connection(child_to_parent, parent_to_child), _Connection(parent_to_child, child_to_parent)
+
+
 class UnityToExternalServicerImplementation(UnityToExternalServicer):
     def __init__(self):
-        self.parent_conn, self.child_conn = Pipe()
+        self.parent_conn, self.child_conn = _connection_pair()
 
     def Initialize(self, request, context):
         self.child_conn.send(request)
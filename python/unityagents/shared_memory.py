@@ -0,0 +1,179 @@
+"""
+Shared memory transport of the per-step agent data for environments running on the same host as Python.
+
+The environment writes the vector observations, rewards and done flags of each brain into a memory mapped file,
+while the control messages keep going through the UnityMessage channel. The file is laid out as follows (little
+endian) :
+
+    header          : magic 'MLSM', version (uint32), number of slots (uint32), number of brains (uint32),
+                      sequence (uint64) : the number of frames published so far.
+    brain table     : for each brain, its name (64 bytes, utf-8, zero padded), the maximum number of agents (uint32),
+                      the size of the stacked vector observation (uint32), the offset of its first slot (uint64)
+                      and the number of bytes between two consecutive slots (uint64).
+    brain slots     : for each brain and each slot, the number of agents (int32, padded to 8 bytes), the vector
+                      observations (float32[max_agents, observation_size]), the rewards (float32[max_agents])
+                      and the done flags (uint8[max_agents]).
+
+Frame number `sequence - 1` lives in slot `(sequence - 1) % number of slots`. The writer fills a slot and only then
+increments the sequence, so the slots of the previous frames stay readable while the next one is being written.
+"""
+
+import mmap
+import os
+
+import numpy as np
+
+from .exception import UnityEnvironmentException
+
+MAGIC = b'MLSM'
+VERSION = 1
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('n_slots', '<u4'), ('n_brains', '<u4'),
+                         ('sequence', '<u8')])
+BRAIN_DTYPE = np.dtype([('name', 'S64'), ('max_agents', '<u4'), ('observation_size', '<u4'),
+                        ('offset', '<u8'), ('stride', '<u8')])
+_COUNT_BYTES = 8
+
+
+def _slot_size(max_agents, observation_size):
+    size = _COUNT_BYTES + 4 * max_agents * observation_size + 4 * max_agents + max_agents
+    return (size + 7) // 8 * 8
+
+
+class SharedMemoryFrame(object):
+    def __init__(self, buffer, offset, max_agents, observation_size):
+        """
+        NumPy views on one slot of one brain in the shared memory file.
+        """
+        self._count = np.frombuffer(buffer, dtype='<i4', count=1, offset=offset)
+        offset += _COUNT_BYTES
+        self._observations = np.frombuffer(buffer, dtype='<f4', count=max_agents * observation_size,
+                                           offset=offset).reshape(max_agents, observation_size)
+        offset += 4 * max_agents * observation_size
+        self._rewards = np.frombuffer(buffer, dtype='<f4', count=max_agents, offset=offset)
+        offset += 4 * max_agents
+        self._dones = np.frombuffer(buffer, dtype=np.uint8, count=max_agents, offset=offset)
+        self.max_agents = max_agents
+
+    @property
+    def n_agents(self):
+        return int(self._count[0])
+
+    @property
+    def vector_observations(self):
+        return self._observations[:self.n_agents]
+
+    @property
+    def rewards(self):
+        return self._rewards[:self.n_agents]
+
+    @property
+    def local_done(self):
+        return self._dones[:self.n_agents].view(np.bool_)
+
+    def write(self, vector_observations, rewards, local_done):
+        n_agents = len(rewards)
+        if n_agents > self.max_agents:
+            raise UnityEnvironmentException("The shared memory can hold at most {0} agents but {1} were written."
+                                            .format(self.max_agents, n_agents))
+        self._observations[:n_agents] = vector_observations
+        self._rewards[:n_agents] = rewards
+        self._dones[:n_agents] = local_done
+        self._count[0] = n_agents
+
+
+class _SharedMemoryFile(object):
+    def __init__(self, path, access):
+        self.path = path
+        with open(path, 'r+b' if access == mmap.ACCESS_WRITE else 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=access)
+        self._header = np.frombuffer(self._mmap, dtype=HEADER_DTYPE, count=1)
+        if self._header['magic'][0] != MAGIC or self._header['version'][0] != VERSION:
+            self._mmap.close()
+            raise UnityEnvironmentException("The file {0} is not a compatible shared memory file.".format(path))
+        self.n_slots = int(self._header['n_slots'][0])
+        n_brains = int(self._header['n_brains'][0])
+        brain_table = np.frombuffer(self._mmap, dtype=BRAIN_DTYPE, count=n_brains, offset=HEADER_DTYPE.itemsize)
+        self.frames = {}
+        for brain in brain_table:
+            name = brain['name'].decode('utf-8')
+            self.frames[name] = [
+                SharedMemoryFrame(self._mmap, int(brain['offset']) + slot * int(brain['stride']),
+                                  int(brain['max_agents']), int(brain['observation_size']))
+                for slot in range(self.n_slots)]
+
+    @property
+    def sequence(self):
+        return int(self._header['sequence'][0])
+
+    def slot(self, sequence):
+        return (sequence - 1) % self.n_slots
+
+    def close(self):
+        self.frames = {}
+        self._header = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views on the memory map are still referenced, the mapping is released with them.
+            pass
+
+
+class SharedMemoryReader(_SharedMemoryFile):
+    def __init__(self, path):
+        """
+        Python side of the shared memory transport. Maps the file written by the environment as NumPy views.
+        :param path: Location of the shared memory file created by the environment.
+        """
+        if not os.path.exists(path):
+            raise UnityEnvironmentException("The shared memory file {0} could not be found.".format(path))
+        super(SharedMemoryReader, self).__init__(path, mmap.ACCESS_READ)
+
+    def latest_frame(self, brain_name):
+        """
+        Returns the views on the last frame published for a brain, or None if the brain has no frame.
+        The views are only valid until the environment writes number of slots frames more.
+        :param brain_name: Name of the brain.
+        :return: The SharedMemoryFrame of the brain.
+        """
+        sequence = self.sequence
+        if sequence == 0 or brain_name not in self.frames:
+            return None
+        return self.frames[brain_name][self.slot(sequence)]
+
+
+class SharedMemoryWriter(_SharedMemoryFile):
+    def __init__(self, path, brains, n_slots=4):
+        """
+        Stand-in for the environment side of the shared memory transport. Creates the shared memory file and
+        publishes the frames. Used to test and benchmark the transport without Unity.
+        :param path: Location of the shared memory file to create.
+        :param brains: Dictionary of brain name to (maximum number of agents, size of the stacked vector observation).
+        :param n_slots: Number of frames kept in the ring.
+        """
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['magic'] = MAGIC
+        header['version'] = VERSION
+        header['n_slots'] = n_slots
+        header['n_brains'] = len(brains)
+        brain_table = np.zeros(len(brains), dtype=BRAIN_DTYPE)
+        offset = HEADER_DTYPE.itemsize + BRAIN_DTYPE.itemsize * len(brains)
+        offset = (offset + 7) // 8 * 8
+        for i, (name, (max_agents, observation_size)) in enumerate(brains.items()):
+            stride = _slot_size(max_agents, observation_size)
+            brain_table[i] = (name.encode('utf-8'), max_agents, observation_size, offset, stride)
+            offset += stride * n_slots
+        with open(path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(brain_table.tobytes())
+            f.truncate(offset)
+        super(SharedMemoryWriter, self).__init__(path, mmap.ACCESS_WRITE)
+
+    def write_frame(self, brain_data):
+        """
+        Writes the data of all the brains for one step and publishes it.
+        :param brain_data: Dictionary of brain name to a tuple (vector observations, rewards, done flags).
+        """
+        sequence = self.sequence + 1
+        for brain_name, (vector_observations, rewards, local_done) in brain_data.items():
+            self.frames[brain_name][self.slot(sequence)].write(vector_observations, rewards, local_done)
+        self._header['sequence'] = sequence
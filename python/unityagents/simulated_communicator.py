@@ -0,0 +1,210 @@
+import io
+import logging
+
+import numpy as np
+from PIL import Image
+
+from .communicator import Communicator
+from .environment import UnityEnvironment
+from communicator_objects import UnityOutput, UnityInput, ResolutionProto, BrainParametersProto, \
+    UnityRLInitializationOutput, AgentInfoProto, UnityRLOutput, EnvironmentParametersProto
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("unityagents")
+
+
+class _SimulatedBrain(object):
+    def __init__(self, name, brain_type, num_agents, vector_observation_size, num_stacked_vector_observations,
+                 frames, is_discrete, vector_action_size, action_matrix, max_step, goal_radius, random):
+        """
+        State and dynamics of the agents of one simulated brain.
+        """
+        self.name = name
+        self.brain_type = brain_type
+        self.num_agents = num_agents
+        self.vector_observation_size = vector_observation_size
+        self.num_stacked_vector_observations = num_stacked_vector_observations
+        self.frames = frames
+        self.is_discrete = is_discrete
+        self.action_size = len(vector_action_size) if is_discrete else vector_action_size[0]
+        self.action_matrix = action_matrix
+        self.max_step = max_step
+        self.goal_radius = goal_radius
+        self.random = random
+        self.positions = np.zeros((num_agents, vector_observation_size), np.float32)
+        self.observations = np.zeros((num_agents, vector_observation_size * num_stacked_vector_observations),
+                                     np.float32)
+        self.steps = np.zeros(num_agents, np.int32)
+        self.actions = np.zeros((num_agents, self.action_size), np.float32)
+        self.memories = [[] for _ in range(num_agents)]
+        self.rewards = np.zeros(num_agents, np.float32)
+        self.done = np.zeros(num_agents, bool)
+        self.max_reached = np.zeros(num_agents, bool)
+
+    def reset_agents(self, agents):
+        self.positions[agents] = self.random.uniform(-1, 1, (len(agents), self.vector_observation_size))
+        self.observations[agents] = np.tile(self.positions[agents], self.num_stacked_vector_observations)
+        self.steps[agents] = 0
+        self.actions[agents] = 0
+        self.rewards[agents] = 0
+        self.done[agents] = False
+        self.max_reached[agents] = False
+
+    def heuristic_actions(self):
+        """
+        Actions bringing the points closer to the origin, taken by the teacher brain.
+        """
+        if self.is_discrete:
+            directions = -self.positions.dot(self.action_matrix.T)
+            return np.where(directions > 0, 1, 2).astype(np.float32)
+        return np.clip(-10 * self.positions.dot(self.action_matrix.T), -1, 1)
+
+    def step(self, actions, memories=None):
+        # Agents which were done at the previous step start a new episode, as the Agents of an Academy do.
+        self.reset_agents(np.nonzero(self.done)[0])
+        self.actions[:] = actions
+        if memories is not None:
+            self.memories = memories
+        if self.is_discrete:
+            moves = np.where(self.actions == 1, 1, np.where(self.actions >= 2, -1, 0)).dot(self.action_matrix)
+        else:
+            moves = np.clip(self.actions, -1, 1).dot(self.action_matrix)
+        self.positions += moves + self.random.normal(0, 0.01, self.positions.shape)
+        self.observations = np.concatenate(
+            [self.observations[:, self.vector_observation_size:], self.positions], axis=1)
+        self.steps += 1
+        distances = np.linalg.norm(self.positions, axis=1)
+        reached = distances < self.goal_radius
+        self.max_reached = (self.steps >= self.max_step) & ~reached
+        self.done = reached | self.max_reached
+        self.rewards = np.where(reached, 1.0, -0.01 * distances).astype(np.float32)
+
+    def agent_infos(self):
+        frame_indices = (np.minimum(np.linalg.norm(self.positions, axis=1) / 2, 1) * 7).astype(int)
+        return [AgentInfoProto(
+            stacked_vector_observation=self.observations[i].tolist(),
+            visual_observations=[frames[frame_indices[i]] for frames in self.frames],
+            text_observation='',
+            stored_vector_actions=self.actions[i].tolist(),
+            stored_text_actions='',
+            memories=self.memories[i],
+            reward=float(self.rewards[i]),
+            done=bool(self.done[i]),
+            max_step_reached=bool(self.max_reached[i]),
+            id=i) for i in range(self.num_agents)]
+
+
+class SimulatedCommunicator(Communicator):
+    def __init__(self, num_agents=8, vector_observation_size=8, num_stacked_vector_observations=1,
+                 camera_resolutions=None, vector_action_space_type='continuous', vector_action_size=2,
+                 max_step=100, goal_radius=0.2, seed=0, brain_name='SimulatedBrain',
+                 academy_name='SimulatedAcademy', teacher_brain_name=None):
+        """
+        Communicator simulating an Academy without Unity. Every agent moves a point of dimension
+        vector_observation_size with its actions and is rewarded for bringing it close to the origin.
+        Used to run and benchmark the Python side of the training loop.
+
+        :param num_agents: Number of agents linked to the brain.
+        :param vector_observation_size: Size of the vector observation of an agent.
+        :param num_stacked_vector_observations: Number of vector observations stacked.
+        :param camera_resolutions: List of (height, width, gray_scale) of the visual observations.
+        :param vector_action_space_type: 'continuous' or 'discrete'.
+        :param vector_action_size: Size of the continuous action, or list of the sizes of the discrete branches.
+        :param max_step: Number of steps after which an agent is done with max_step_reached.
+        :param goal_radius: Distance to the origin under which an agent is done.
+        :param seed: Random seed of the dynamics.
+        :param brain_name: Name of the external brain.
+        :param academy_name: Name of the academy.
+        :param teacher_brain_name: If set, adds a heuristic brain of this name with the same parameters, whose
+        agents are driven towards the origin. It can be imitated by the external brain.
+        """
+        self.camera_resolutions = camera_resolutions or []
+        self.is_discrete = vector_action_space_type == 'discrete'
+        if self.is_discrete:
+            self.vector_action_size = list(vector_action_size) \
+                if isinstance(vector_action_size, (list, tuple)) else [vector_action_size]
+        else:
+            self.vector_action_size = [vector_action_size]
+        self.vector_observation_size = vector_observation_size
+        self.num_stacked_vector_observations = num_stacked_vector_observations
+        self.brain_name = brain_name
+        self.academy_name = academy_name
+        self.has_been_closed = False
+        self._random = np.random.RandomState(seed)
+        if self.is_discrete:
+            # Every branch moves the point along one axis, its first choice does nothing.
+            action_matrix = np.zeros((len(self.vector_action_size), vector_observation_size), np.float32)
+            for i in range(len(self.vector_action_size)):
+                action_matrix[i, i % vector_observation_size] = 0.1
+        else:
+            action_matrix = self._random.normal(
+                0, 0.1, (self.vector_action_size[0], vector_observation_size)).astype(np.float32)
+        # Images are encoded once, agents are shown the frame of their distance to the origin.
+        # Like Unity, gray scale cameras send RGB images which are averaged by UnityEnvironment.
+        frames = [[self._encode_frame(height, width, level) for level in np.linspace(0, 255, 8).astype(np.uint8)]
+                  for height, width, _ in self.camera_resolutions]
+        brains = [(brain_name, 2)]
+        if teacher_brain_name is not None:
+            brains.append((teacher_brain_name, 1))
+        self._brains = [_SimulatedBrain(name, brain_type, num_agents, vector_observation_size,
+                                        num_stacked_vector_observations, frames, self.is_discrete,
+                                        self.vector_action_size, action_matrix, max_step, goal_radius, self._random)
+                        for name, brain_type in brains]
+        self._has_been_reset = False
+
+    @staticmethod
+    def _encode_frame(height, width, level):
+        pixels = np.full((height, width, 3), level, dtype=np.uint8)
+        pixels[:, :width // 2, 1:] = 255 - level
+        output = io.BytesIO()
+        Image.fromarray(pixels).save(output, format='PNG')
+        return output.getvalue()
+
+    def initialize(self, inputs: UnityInput) -> UnityOutput:
+        brain_parameters = [BrainParametersProto(
+            vector_observation_size=self.vector_observation_size,
+            num_stacked_vector_observations=self.num_stacked_vector_observations,
+            vector_action_size=self.vector_action_size,
+            camera_resolutions=[ResolutionProto(height=height, width=width, gray_scale=gray_scale)
+                                for height, width, gray_scale in self.camera_resolutions],
+            vector_action_descriptions=[''] * len(self.vector_action_size),
+            vector_action_space_type=int(not self.is_discrete),
+            brain_name=brain.name,
+            brain_type=brain.brain_type
+        ) for brain in self._brains]
+        return UnityOutput(rl_initialization_output=UnityRLInitializationOutput(
+            name=self.academy_name,
+            version='API-4',
+            log_path='',
+            brain_parameters=brain_parameters,
+            environment_parameters=EnvironmentParametersProto()
+        ))
+
+    def exchange(self, inputs: UnityInput) -> UnityOutput:
+        rl_input = inputs.rl_input
+        for brain in self._brains:
+            if rl_input.command == 1 or not self._has_been_reset:
+                brain.reset_agents(np.arange(brain.num_agents))
+            elif brain.brain_type == 2:
+                agent_actions = rl_input.agent_actions[brain.name].value
+                brain.step([list(x.vector_actions) for x in agent_actions],
+                           [list(x.memories) for x in agent_actions])
+            else:
+                brain.step(brain.heuristic_actions())
+        self._has_been_reset = True
+        return UnityOutput(rl_output=UnityRLOutput(
+            global_done=False,
+            agentInfos={brain.name: UnityRLOutput.ListAgentInfoProto(value=brain.agent_infos())
+                        for brain in self._brains}))
+
+    def close(self):
+        self.has_been_closed = True
+
+
+def launch_simulated_environment(worker_index, **kwargs):
+    """
+    Environment factory of UnityVecEnvironment and TrainerController running a SimulatedCommunicator.
+    Use functools.partial to set the keyword arguments of the SimulatedCommunicator.
+    """
+    kwargs['seed'] = kwargs.get('seed', 0) + worker_index
+    return UnityEnvironment(communicator=SimulatedCommunicator(**kwargs))
@@ -4,7 +4,7 @@ import struct
 
 from .communicator import Communicator
 from communicator_objects import UnityMessage, UnityOutput, UnityInput
-from .exception import UnityTimeOutException
+from .exception import UnityTimeOutException, UnityEnvironmentException
 
 
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +26,8 @@ class SocketCommunicator(Communicator):
         self.worker_id = worker_id
         self._socket = None
         self._conn = None
+        self._header = bytearray(4)
+        self._receive_buffer = bytearray(self._buffer_size)
 
     def initialize(self, inputs: UnityInput) -> UnityOutput:
         try:
@@ -42,6 +44,7 @@ class SocketCommunicator(Communicator):
             self._socket.listen(1)
             self._conn, _ = self._socket.accept()
             self._conn.settimeout(30)
+            self._conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         except :
             raise UnityTimeOutException(
                 "The Unity environment took too long to respond. Make sure that :\n"
@@ -56,19 +59,36 @@ class SocketCommunicator(Communicator):
         initialization_output.ParseFromString(self._communicator_receive())
         return initialization_output.unity_output
 
+    def _receive_into(self, view):
+        """
+        Fills the memoryview with the next len(view) bytes of the connection.
+        """
+        received = 0
+        while received < len(view):
+            n_bytes = self._conn.recv_into(view[received:])
+            if n_bytes == 0:
+                raise UnityEnvironmentException("The environment closed the connection.")
+            received += n_bytes
+
     def _communicator_receive(self):
+        """
+        Reads the next length prefixed message into the receive buffer, which grows to fit the largest message.
+        :return: The bytes of the message. They are copied out of the buffer since the pure Python implementation
+                 of protobuf only parses bytes.
+        """
         try:
-            s = self._conn.recv(self._buffer_size)
-            message_length = struct.unpack("I", bytearray(s[:4]))[0]
-            s = s[4:]
-            while len(s) != message_length:
-                s += self._conn.recv(self._buffer_size)
+            self._receive_into(memoryview(self._header))
+            message_length = struct.unpack("I", self._header)[0]
+            if message_length > len(self._receive_buffer):
+                self._receive_buffer = bytearray(max(message_length, 2 * len(self._receive_buffer)))
+            message = memoryview(self._receive_buffer)[:message_length]
+            self._receive_into(message)
         except socket.timeout as e:
             raise UnityTimeOutException("The environment took too long to respond.")
-        return s
+        return bytes(message)
 
     def _communicator_send(self, message):
-        self._conn.send(struct.pack("I", len(message)) + message)
+        self._conn.sendall(struct.pack("I", len(message)) + message)
 
     def exchange(self, inputs: UnityInput) -> UnityOutput:
         message = UnityMessage()
@@ -92,7 +112,7 @@ class SocketCommunicator(Communicator):
         if self._socket is not None:
             self._socket.close()
             self._socket = None
-        if self._socket is not None:
+        if self._conn is not None:
             self._conn.close()
             self._conn = None
 
@@ -0,0 +1,288 @@
+import logging
+import multiprocessing
+
+import numpy as np
+
+from .brain import BrainInfo, AllBrainInfo
+from .environment import UnityEnvironment
+from .exception import UnityEnvironmentException, UnityActionException
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("unityagents")
+
+
+def launch_unity_environment(file_name, worker_id, base_port, seed, docker_training, no_graphics, worker_index):
+    """
+    Default environment factory of UnityVecEnvironment. Launches the Unity executable on the port of the
+    worker_index-th consecutive worker id.
+    """
+    return UnityEnvironment(file_name=file_name,
+                            worker_id=worker_id + worker_index,
+                            base_port=base_port,
+                            seed=seed + worker_index,
+                            docker_training=docker_training,
+                            no_graphics=no_graphics)
+
+
+def _worker(remote, env_factory, worker_index):
+    """
+    Main loop of the sub-process owning one UnityEnvironment. Commands are received from
+    the UnityVecEnvironment through remote and their results are sent back the same way.
+    """
+    env = None
+    try:
+        env = env_factory(worker_index)
+        while True:
+            command, payload = remote.recv()
+            if command == 'step':
+                all_brain_info = env.step(**payload)
+                remote.send(('ok', (all_brain_info, env.global_done)))
+            elif command == 'reset':
+                all_brain_info = env.reset(**payload)
+                remote.send(('ok', (all_brain_info, env.global_done)))
+            elif command == 'parameters':
+                remote.send(('ok', {
+                    'brains': env.brains,
+                    'brain_names': env.brain_names,
+                    'external_brain_names': env.external_brain_names,
+                    'academy_name': env.academy_name,
+                    'log_path': env.logfile_path,
+                    'reset_parameters': env._resetParameters
+                }))
+            elif command == 'close':
+                break
+    except (KeyboardInterrupt, EOFError):
+        try:
+            remote.send(('error', KeyboardInterrupt()))
+        except (BrokenPipeError, EOFError):
+            pass
+    except Exception as e:
+        try:
+            remote.send(('error', e))
+        except (BrokenPipeError, EOFError):
+            pass
+    finally:
+        if env is not None:
+            env.close()
+        remote.close()
+
+
+class UnityVecEnvironment(object):
+    def __init__(self, env_factory, n_env=1):
+        """
+        Launches n_env Unity environments in separate processes and exposes them as a single environment.
+        The BrainInfo of each brain returned by reset and step are the concatenation of the BrainInfos of
+        all the environments. The id of each agent is prefixed by the index of its environment to keep them unique.
+        reset, step_async and step_wait can also be given a subset of the environments, the workers, so that some
+        environments simulate while the agents of the others are deciding their actions.
+
+        :param env_factory: Function taking the index of a worker and returning the UnityEnvironment it must run.
+        Must be picklable when multiprocessing does not fork.
+        :int n_env: Number of environments to launch.
+        """
+        if n_env < 1:
+            raise UnityEnvironmentException("The number of environments must be at least 1.")
+        self.n_env = n_env
+        self._global_dones = [None] * n_env
+        self._step_pending = [False] * n_env
+        self._n_agents = [{} for _ in range(n_env)]
+        self._remotes = []
+        self._processes = []
+        for worker_index in range(n_env):
+            parent_remote, child_remote = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, args=(child_remote, env_factory, worker_index))
+            process.daemon = True
+            process.start()
+            child_remote.close()
+            self._remotes.append(parent_remote)
+            self._processes.append(process)
+        self._loaded = True
+
+        parameters = self._exchange_all('parameters', [None] * n_env)[0]
+        self._brains = parameters['brains']
+        self._brain_names = parameters['brain_names']
+        self._external_brain_names = parameters['external_brain_names']
+        self._academy_name = parameters['academy_name']
+        self._log_path = parameters['log_path']
+        self._resetParameters = parameters['reset_parameters']
+        logger.info("\n'{0}' started successfully in {1} environments!".format(self._academy_name, n_env))
+
+    @property
+    def logfile_path(self):
+        return self._log_path
+
+    @property
+    def brains(self):
+        return self._brains
+
+    @property
+    def global_done(self):
+        if None in self._global_dones:
+            return None
+        return any(self._global_dones)
+
+    @property
+    def academy_name(self):
+        return self._academy_name
+
+    @property
+    def number_brains(self):
+        return len(self._brain_names)
+
+    @property
+    def number_external_brains(self):
+        return len(self._external_brain_names)
+
+    @property
+    def brain_names(self):
+        return self._brain_names
+
+    @property
+    def external_brain_names(self):
+        return self._external_brain_names
+
+    def _workers(self, workers):
+        return list(range(self.n_env)) if workers is None else list(workers)
+
+    def _exchange_all(self, command, payloads, workers=None):
+        workers = self._workers(workers)
+        if any([self._step_pending[worker_index] for worker_index in workers]):
+            raise UnityActionException("A step is in progress. Call 'step_wait()' first.")
+        for worker_index, payload in zip(workers, payloads):
+            self._remotes[worker_index].send((command, payload))
+        return [self._receive(self._remotes[worker_index]) for worker_index in workers]
+
+    @staticmethod
+    def _receive(remote):
+        try:
+            status, result = remote.recv()
+        except EOFError:
+            raise UnityEnvironmentException("An environment process exited unexpectedly.")
+        if status == 'error':
+            raise result
+        return result
+
+    def reset(self, config=None, train_mode=True, workers=None) -> AllBrainInfo:
+        """
+        Sends a signal to reset the unity environments.
+        :param workers: Indices of the environments to reset, all of them if None.
+        :return: AllBrainInfo  : A Data structure corresponding to the initial reset state of the environments.
+        """
+        if not self._loaded:
+            raise UnityEnvironmentException("No Unity environment is loaded.")
+        workers = self._workers(workers)
+        results = self._exchange_all('reset', [{'config': config, 'train_mode': train_mode}] * len(workers), workers)
+        if config is not None:
+            for k in config:
+                self._resetParameters[k] = config[k]
+        return self._merge_results(results, workers)
+
+    def step(self, vector_action=None, memory=None, text_action=None, value=None) -> AllBrainInfo:
+        """
+        Provides the environments with the actions of all their agents. The actions of each brain are given in the
+        same order as the agents of the last AllBrainInfo returned.
+        :return: AllBrainInfo  : A Data structure corresponding to the new state of the environments.
+        """
+        self.step_async(vector_action, memory, text_action, value)
+        return self.step_wait()
+
+    def step_async(self, vector_action=None, memory=None, text_action=None, value=None, workers=None):
+        """
+        Sends the actions to the environments without waiting for them to simulate it. The resulting
+        AllBrainInfo must be collected with step_wait before the environments can be stepped or reset again.
+        :param workers: Indices of the environments to step, all of them if None. The actions of each brain are
+        given in the same order as the agents of the last AllBrainInfo returned for these environments.
+        """
+        workers = self._workers(workers)
+        if any([self._step_pending[worker_index] for worker_index in workers]):
+            raise UnityActionException("A step is already in progress. Call 'step_wait()' before stepping again.")
+        if not self._loaded:
+            raise UnityEnvironmentException("No Unity environment is loaded.")
+        if any([self._global_dones[worker_index] is None for worker_index in workers]):
+            raise UnityActionException(
+                "You cannot conduct step without first calling reset. Reset the environment with 'reset()'")
+        if any([self._global_dones[worker_index] for worker_index in workers]):
+            raise UnityActionException("The episode is completed. Reset the environment with 'reset()'")
+        inputs = {'vector_action': vector_action, 'memory': memory, 'text_action': text_action, 'value': value}
+        payloads = [{} for _ in workers]
+        for key, brain_inputs in inputs.items():
+            if brain_inputs is None:
+                continue
+            if not isinstance(brain_inputs, dict):
+                if len(self._external_brain_names) != 1:
+                    raise UnityActionException(
+                        "You have {0} brains, you need to feed a dictionary of brain names as keys "
+                        "and {1} as values".format(len(self._external_brain_names), key))
+                brain_inputs = {self._external_brain_names[0]: brain_inputs}
+            for payload in payloads:
+                payload[key] = {}
+            for brain_name, brain_input in brain_inputs.items():
+                for payload, worker_input in zip(payloads, self._split(brain_input, brain_name, workers)):
+                    payload[key][brain_name] = worker_input
+        for worker_index, payload in zip(workers, payloads):
+            self._remotes[worker_index].send(('step', payload))
+            self._step_pending[worker_index] = True
+
+    def step_wait(self, workers=None) -> AllBrainInfo:
+        """
+        Waits for the environments to simulate the actions sent with step_async.
+        :param workers: Indices of the environments to wait for, the ones stepped if None.
+        :return: AllBrainInfo  : A Data structure corresponding to the new state of the environments.
+        """
+        if workers is None:
+            workers = [worker_index for worker_index in range(self.n_env) if self._step_pending[worker_index]]
+        workers = self._workers(workers)
+        if len(workers) == 0 or not all([self._step_pending[worker_index] for worker_index in workers]):
+            raise UnityActionException("No step is in progress. Call 'step_async()' before 'step_wait()'.")
+        results = []
+        for worker_index in workers:
+            self._step_pending[worker_index] = False
+            results.append(self._receive(self._remotes[worker_index]))
+        return self._merge_results(results, workers)
+
+    def _split(self, brain_input, brain_name, workers):
+        """
+        Splits the input of a brain for all the agents of the given environments into one input per environment.
+        """
+        counts = [self._n_agents[worker_index].get(brain_name, 0) for worker_index in workers]
+        total = sum(counts)
+        if brain_input is None or isinstance(brain_input, str) or total == 0:
+            return [brain_input] * len(workers)
+        if len(brain_input) != total:
+            brain_input = np.reshape(brain_input, (total, -1))
+        bounds = np.cumsum([0] + counts)
+        return [brain_input[bounds[i]:bounds[i + 1]] for i in range(len(workers))]
+
+    def _merge_results(self, results, workers=None):
+        workers = self._workers(workers)
+        merged = {}
+        for worker_index, (_, global_done) in zip(workers, results):
+            self._global_dones[worker_index] = global_done
+        for brain_name in results[0][0]:
+            brain_infos = []
+            for worker_index, (all_brain_info, _) in zip(workers, results):
+                brain_info = all_brain_info[brain_name]
+                brain_info.agents = ['{0}-{1}'.format(worker_index, agent_id) for agent_id in brain_info.agents]
+                self._n_agents[worker_index][brain_name] = len(brain_info.agents)
+                brain_infos.append(brain_info)
+            merged[brain_name] = BrainInfo.merge_instances(brain_infos)
+        return merged
+
+    def close(self):
+        """
+        Sends a shutdown signal to all the unity environments and terminates their processes.
+        """
+        if not self._loaded:
+            raise UnityEnvironmentException("No Unity environment is loaded.")
+        self._loaded = False
+        for remote in self._remotes:
+            try:
+                remote.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        for remote in self._remotes:
+            remote.close()
@@ -1,7 +1,11 @@
 from .buffer import *
 from .curriculum import *
+from .inference import *
 from .meta_curriculum import *
 from .models import *
+from .normalizer import *
+from .rollout import *
+from .allreduce import *
 from .trainer_controller import *
 from .bc.models import *
 from .bc.trainer import *
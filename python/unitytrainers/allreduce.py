@@ -0,0 +1,261 @@
+# # Unity ML-Agents Toolkit
+# ## Data-parallel learner
+"""
+Splits every mini-batch of the update of a PPO model across local processes, each holding a replica of the model,
+and averages their gradients with a ring all-reduce over Unix sockets before applying them.
+"""
+
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import types
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import tensorflow as tf
+
+from unitytrainers.buffer import Buffer
+from unitytrainers.ppo.trainer import PPOTrainer
+from unitytrainers.rollout import PolicyVariables
+from unitytrainers.trainer import UnityTrainerException
+
+logger = logging.getLogger("unitytrainers")
+
+
+class RingAllReduce(object):
+    def __init__(self, rank, size, socket_dir, timeout=60):
+        """
+        Connects a process to its neighbours of a ring of size processes through Unix sockets.
+        :param rank: Index of the process in the ring.
+        :param size: Number of processes of the ring.
+        :param socket_dir: Directory of the sockets, shared by all the processes of the ring.
+        :param timeout: Number of seconds to wait for the following process to listen.
+        """
+        self.rank = rank
+        self.size = size
+        self._listener = Listener(os.path.join(socket_dir, str(rank)), family='AF_UNIX')
+        right_address = os.path.join(socket_dir, str((rank + 1) % size))
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self._right = Client(right_address, family='AF_UNIX')
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.time() > deadline:
+                    raise UnityTrainerException("The process {0} of the all-reduce ring could not connect to the "
+                                                "following one.".format(rank))
+                time.sleep(0.01)
+        self._left = self._listener.accept()
+
+    def _exchange(self, chunk):
+        # Even processes send first and odd ones receive first, so that the ring never blocks on full sockets.
+        if self.rank % 2 == 0:
+            self._right.send_bytes(chunk)
+            return self._left.recv_bytes()
+        received = self._left.recv_bytes()
+        self._right.send_bytes(chunk)
+        return received
+
+    def allreduce_mean(self, vector):
+        """
+        Averages a vector across the processes of the ring. Every process sends and receives 2 (size - 1) / size
+        times the size of the vector, whatever the number of processes.
+        :param vector: 1-D np.array of float32, the same size in every process.
+        :return: The mean of the vectors of all the processes.
+        """
+        if self.size == 1:
+            return vector
+        chunks = np.array_split(np.array(vector, dtype=np.float32), self.size)
+        # Reduce-scatter: after size - 1 steps, chunk (rank + 1) % size holds the sum of all the processes.
+        for step in range(self.size - 1):
+            send_index = (self.rank - step) % self.size
+            receive_index = (self.rank - step - 1) % self.size
+            received = self._exchange(chunks[send_index].tobytes())
+            chunks[receive_index] += np.frombuffer(received, dtype=np.float32)
+        # All-gather: the summed chunks go around the ring.
+        for step in range(self.size - 1):
+            send_index = (self.rank + 1 - step) % self.size
+            receive_index = (self.rank - step) % self.size
+            received = self._exchange(chunks[send_index].tobytes())
+            chunks[receive_index] = np.frombuffer(received, dtype=np.float32).copy()
+        return np.concatenate(chunks) / self.size
+
+    def close(self):
+        self._right.close()
+        self._left.close()
+        self._listener.close()
+
+
+def _replica(remote, rank, size, socket_dir, brain, trainer_parameters, seed):
+    """
+    Main loop of the process of a replica of a PPO model. Runs the updates of the model sent by the first process,
+    on its own part of every mini-batch.
+    """
+    ring = None
+    try:
+        ring = RingAllReduce(rank, size, socket_dir)
+        config = tf.ConfigProto(intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)
+        with tf.Session(config=config) as sess, tempfile.TemporaryDirectory() as summary_dir:
+            # The trainer only needs the parameters of its brain from the environment.
+            environment = types.SimpleNamespace(brains={brain.brain_name: brain})
+            trainer = PPOTrainer(sess, environment, brain.brain_name,
+                                 dict(trainer_parameters, summary_path=summary_dir), False, seed, 0)
+            trainer.data_parallel = DataParallelLearner(ring)
+            variables = PolicyVariables(tf.global_variables())
+            sess.run(tf.global_variables_initializer())
+            remote.send(('ok', None))
+            while True:
+                command, payload = remote.recv()
+                if command == 'close':
+                    break
+                variables.set(sess, payload['variables'])
+                trainer.step = payload['step']
+                update_buffer = Buffer.AgentBuffer()
+                for key, data in payload['fields'].items():
+                    update_buffer[key].set(data)
+                trainer.update_epochs(update_buffer, payload['permutations'])
+                remote.send(('ok', None))
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception as e:
+        try:
+            remote.send(('error', e))
+        except (BrokenPipeError, EOFError):
+            pass
+    finally:
+        if ring is not None:
+            ring.close()
+        remote.close()
+
+
+class DataParallelLearner(object):
+    def __init__(self, ring):
+        """
+        Data-parallel update of the model of a PPO trainer. The first process, holding the trainer, creates it with
+        the start method, which spawns the processes of the replicas of the model.
+        :param ring: RingAllReduce of the process.
+        """
+        self.ring = ring
+        self._remotes = []
+        self._processes = []
+        self._socket_dir = None
+        self._variables = None
+
+    @staticmethod
+    def start(n_processes, brain, trainer_parameters, seed):
+        """
+        Spawns n_processes - 1 processes holding a replica of the model of a PPO trainer, and connects them with
+        the current process in an all-reduce ring.
+        :param n_processes: Number of processes the mini-batches are split across, including the current one.
+        :param brain: BrainParameters of the brain of the trainer.
+        :param trainer_parameters: The parameters of the trainer.
+        :param seed: Random seed.
+        :return: The DataParallelLearner of the current process.
+        """
+        socket_dir = tempfile.mkdtemp()
+        # The replicas are spawned rather than forked since TensorFlow does not support being forked once imported.
+        context = multiprocessing.get_context('spawn')
+        remotes, processes = [], []
+        for rank in range(1, n_processes):
+            remote, replica_remote = context.Pipe()
+            process = context.Process(target=_replica, args=(
+                replica_remote, rank, n_processes, socket_dir, brain, trainer_parameters, seed))
+            process.daemon = True
+            process.start()
+            replica_remote.close()
+            remotes.append(remote)
+            processes.append(process)
+        learner = DataParallelLearner(RingAllReduce(0, n_processes, socket_dir))
+        learner._remotes = remotes
+        learner._processes = processes
+        learner._socket_dir = socket_dir
+        learner._wait_replicas()
+        logger.info("The model of brain {0} is updated in {1} processes.".format(brain.brain_name, n_processes))
+        return learner
+
+    def _wait_replicas(self):
+        for remote in self._remotes:
+            try:
+                status, result = remote.recv()
+            except EOFError:
+                raise UnityTrainerException("A replica of the model exited unexpectedly.")
+            if status == 'error':
+                raise result
+
+    def update(self, trainer, update_buffer, permutations):
+        """
+        Runs the epochs of an update in all the processes.
+        :param trainer: The PPOTrainer of the current process.
+        :param update_buffer: AgentBuffer of the experiences of the update.
+        :param permutations: List of the orders of the experiences of each epoch.
+        :return: The result of the update_epochs method of the trainer.
+        """
+        if self._variables is None:
+            # The graph of the session, since the update may run in a thread with another default graph.
+            scope = trainer.variable_scope + '/' if trainer.variable_scope else ''
+            self._variables = PolicyVariables(trainer.sess.graph.get_collection(tf.GraphKeys.GLOBAL_VARIABLES,
+                                                                                scope))
+        # The replicas start every update from the state of the model, Adam optimizer included, of this process.
+        message = ('update', {'variables': self._variables.get(trainer.sess),
+                              'step': trainer.step,
+                              'fields': {key: field.data for key, field in update_buffer.items()},
+                              'permutations': permutations})
+        for remote in self._remotes:
+            remote.send(message)
+        try:
+            result = trainer.update_epochs(update_buffer, permutations)
+        except (OSError, EOFError):
+            # A replica failing closes its sockets, its own error is the cause of the failure.
+            self._wait_replicas()
+            raise
+        self._wait_replicas()
+        return result
+
+    def run_mini_batch(self, trainer, mini_batch, run_list):
+        """
+        Computes the gradients of the part of a mini-batch of the process, averages them across the processes and
+        applies them.
+        :param trainer: The PPOTrainer of the process.
+        :param mini_batch: Dictionary of field name to the np.array of the elements of the mini-batch.
+        :param run_list: Losses to evaluate. Their value is also averaged.
+        :return: A dictionary of the losses to their value.
+        """
+        model = trainer.model
+        # The elements of the mini-batches are whole sequences when the model is recurrent.
+        shard = {key: np.array_split(value, self.ring.size)[self.ring.rank] for key, value in mini_batch.items()}
+        values = trainer.sess.run(model.gradients + run_list,
+                                  feed_dict=trainer.make_update_feed_dict(shard, proximal=trainer.async_update))
+        # The parts of the mini-batch differ by one element when the processes do not divide it, the gradients of
+        # each part are weighted by its length so that their mean is the gradient of the whole mini-batch.
+        weight = len(next(iter(shard.values()))) * self.ring.size / len(next(iter(mini_batch.values())))
+        flat = np.concatenate([np.ravel(value) for value in values]).astype(np.float32) * weight
+        flat = self.ring.allreduce_mean(flat)
+        feed_dict = {}
+        offset = 0
+        for holder, value in zip(model.gradient_holders + [None] * len(run_list), values):
+            size = np.size(value)
+            if holder is not None:
+                feed_dict[holder] = flat[offset:offset + size].reshape(np.shape(value))
+            offset += size
+        trainer.sess.run(model.apply_gradient_holders, feed_dict=feed_dict)
+        return dict(zip(run_list, flat[-len(run_list):])) if run_list else {}
+
+    def close(self):
+        """
+        Stops the replicas.
+        """
+        for remote in self._remotes:
+            try:
+                remote.send(('close', None))
+            except (BrokenPipeError, EOFError):
+                pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self.ring.close()
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
@@ -48,6 +48,7 @@ class BehavioralCloningTrainer(Trainer):
             self.m_size = trainer_parameters["memory_size"]
             self.sequence_length = trainer_parameters["sequence_length"]
         self.n_sequences = max(int(trainer_parameters['batch_size'] / self.sequence_length), 1)
+        self.step = 0
         self.cumulative_rewards = {}
         self.episode_steps = {}
         self.stats = {'losses': [], 'episode_length': [], 'cumulative_reward': []}
@@ -108,7 +109,7 @@ class BehavioralCloningTrainer(Trainer):
         Returns the number of steps the trainer has performed
         :return: the step count of the trainer
         """
-        return self.sess.run(self.model.global_step)
+        return self.step
 
     @property
     def get_last_reward(self):
@@ -123,23 +124,36 @@ class BehavioralCloningTrainer(Trainer):
 
     def increment_step_and_update_last_reward(self):
         """
-        Increment the step count of the trainer and Updates the last reward
+        Increment the step count of the trainer and Updates the last reward.
+        The step count is kept in Python and only written to the model by save_step_to_graph.
         """
-        self.sess.run(self.model.increment_step)
-        return
+        self.step += 1
 
-    def take_action(self, all_brain_info: AllBrainInfo):
+    def save_step_to_graph(self):
         """
-        Decides actions given state/observation information, and takes them in environment.
+        Writes the step count of the trainer to the variables of its model.
+        """
+        self.sess.run(self.model.update_step, feed_dict={self.model.new_step: self.step})
+
+    def load_step_from_graph(self):
+        """
+        Reads the step count of the trainer from the variables of its model.
+        """
+        self.step = int(self.sess.run(self.model.global_step))
+
+    def prepare_action(self, all_brain_info: AllBrainInfo):
+        """
+        Creates the run of the session deciding the actions given state/observation information.
         :param all_brain_info: AllBrainInfo from environment.
-        :return: a tuple containing action, memories, values and an object
-        to be passed to add experiences
+        :return: a tuple containing the feed dict and the list of tensors of the run, or None if
+        there is no agent to decide the actions of
         """
         if len(all_brain_info[self.brain_name].agents) == 0:
-            return [], [], [], None, None
+            return None
 
         agent_brain = all_brain_info[self.brain_name]
-        feed_dict = {self.model.dropout_rate: 1.0, self.model.sequence_length: 1}
+        feed_dict = {self.model.dropout_rate: 1.0, self.model.sequence_length: 1,
+                     self.model.current_step: self.step}
 
         if self.use_visual_observations:
             for i, _ in enumerate(agent_brain.visual_observations):
@@ -150,11 +164,19 @@ class BehavioralCloningTrainer(Trainer):
             if agent_brain.memories.shape[1] == 0:
                 agent_brain.memories = np.zeros((len(agent_brain.agents), self.m_size))
             feed_dict[self.model.memory_in] = agent_brain.memories
-            agent_action, memories = self.sess.run(self.inference_run_list, feed_dict)
-            return agent_action, memories, None, None, None
-        else:
-            agent_action = self.sess.run(self.inference_run_list, feed_dict)
-        return agent_action, None, None, None, None
+        return feed_dict, self.inference_run_list
+
+    def complete_action(self, all_brain_info: AllBrainInfo, run_out):
+        """
+        Decides actions from the outputs of the run created by prepare_action.
+        :param all_brain_info: AllBrainInfo from environment.
+        :param run_out: A dictionary of the tensors of the run to their value.
+        :return: a tuple containing action, memories, values and an object
+        to be passed to add experiences
+        """
+        if self.use_recurrent:
+            return run_out[self.model.sample_action], run_out[self.model.memory_out], None, None, None
+        return run_out[self.model.sample_action], None, None, None, None
 
     def add_experiences(self, curr_info: AllBrainInfo, next_info: AllBrainInfo, take_action_outputs):
         """
@@ -175,8 +197,8 @@ class BehavioralCloningTrainer(Trainer):
             if stored_info_teacher is None:
                 continue
             else:
-                idx = stored_info_teacher.agents.index(agent_id)
-                next_idx = next_info_teacher.agents.index(agent_id)
+                idx = stored_info_teacher.agent_index[agent_id]
+                next_idx = next_info_teacher.agent_index[agent_id]
                 if stored_info_teacher.text_observations[idx] != "":
                     info_teacher_record, info_teacher_reset = \
                         stored_info_teacher.text_observations[idx].lower().split(",")
@@ -212,7 +234,7 @@ class BehavioralCloningTrainer(Trainer):
             if stored_info_student is None:
                 continue
             else:
-                next_idx = next_info_student.agents.index(agent_id)
+                next_idx = next_info_student.agent_index[agent_id]
                 if agent_id not in self.cumulative_rewards:
                     self.cumulative_rewards[agent_id] = 0
                 self.cumulative_rewards[agent_id] += next_info_student.rewards[next_idx]
@@ -279,22 +301,24 @@ class BehavioralCloningTrainer(Trainer):
             _buffer = self.training_buffer.update_buffer
             start = j * self.n_sequences
             end = (j + 1) * self.n_sequences
+            mini_batch = _buffer.make_mini_batch(start, end)
 
             feed_dict = {self.model.dropout_rate: 0.5,
                          self.model.batch_size: self.n_sequences,
-                         self.model.sequence_length: self.sequence_length}
+                         self.model.sequence_length: self.sequence_length,
+                         self.model.current_step: self.step}
             if self.is_continuous_action:
-                feed_dict[self.model.true_action] = np.array(_buffer['actions'][start:end]).\
+                feed_dict[self.model.true_action] = mini_batch['actions'].\
                     reshape([-1, self.brain.vector_action_space_size[0]])
             else:
-                feed_dict[self.model.true_action] = np.array(_buffer['actions'][start:end]).reshape(
+                feed_dict[self.model.true_action] = mini_batch['actions'].reshape(
                     [-1, len(self.brain.vector_action_space_size)])
             if self.use_vector_observations:
-                feed_dict[self.model.vector_in] = np.array(_buffer['vector_observations'][start:end])\
+                feed_dict[self.model.vector_in] = mini_batch['vector_observations']\
                     .reshape([-1, self.brain.vector_observation_space_size * self.brain.num_stacked_vector_observations])
             if self.use_visual_observations:
                 for i, _ in enumerate(self.model.visual_in):
-                    _obs = np.array(_buffer['visual_observations%d' % i][start:end])
+                    _obs = mini_batch['visual_observations%d' % i]
                     feed_dict[self.model.visual_in[i]] = _obs
             if self.use_recurrent:
                 feed_dict[self.model.memory_in] = np.zeros([self.n_sequences, self.m_size])
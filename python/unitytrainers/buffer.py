@@ -22,29 +22,95 @@ class Buffer(dict):
         The keys correspond to the name of the field. Example: state, action
         """
 
-        class AgentBufferField(list):
+        class AgentBufferField(object):
             """
-            AgentBufferField is a list of numpy arrays. When an agent collects a field, you can add it to his
-            AgentBufferField with the append method.
+            AgentBufferField stores the elements collected by an agent for one field in a preallocated NumPy array
+            of shape (capacity, *element shape). When an agent collects a field, you can add it to his
+            AgentBufferField with the append method. The capacity grows geometrically and is kept when the field
+            is reset, so that filling the field again does not allocate.
+            Elements are stored as float32, except uint8 elements (visual observations) which are stored as uint8.
             """
+            initial_capacity = 16
+
+            def __init__(self):
+                self._data = None
+                self._length = 0
 
             def __str__(self):
-                return str(np.array(self).shape)
+                return str(np.shape(self.data))
+
+            def __len__(self):
+                return self._length
+
+            def __iter__(self):
+                return iter(self.data)
+
+            def __getitem__(self, item):
+                return self.data[item]
+
+            def __array__(self, dtype=None):
+                data = self.data
+                return data if dtype is None else data.astype(dtype)
+
+            @property
+            def data(self):
+                """
+                View of the elements of the field. It is only valid until the field is modified.
+                """
+                if self._data is None:
+                    return np.zeros(0, dtype=np.float32)
+                return self._data[:self._length]
+
+            def _reserve(self, element_shape, dtype, capacity):
+                """
+                Makes room for capacity elements of shape element_shape, keeping the current elements.
+                """
+                if self._data is not None and (self._data.shape[1:] != element_shape or self._data.dtype != dtype):
+                    if self._length > 0:
+                        raise BufferException("Cannot add elements of shape {0} to a field of elements of shape {1}."
+                                              .format(element_shape, self._data.shape[1:]))
+                    self._data = None
+                if self._data is None:
+                    self._data = np.empty((max(capacity, self.initial_capacity),) + element_shape, dtype=dtype)
+                elif capacity > len(self._data):
+                    data = np.empty((max(capacity, 2 * len(self._data)),) + element_shape, dtype=dtype)
+                    data[:self._length] = self._data[:self._length]
+                    self._data = data
+
+            @staticmethod
+            def _as_array(data):
+                data = np.asarray(data)
+                return data if data.dtype == np.uint8 else data.astype(np.float32, copy=False)
+
+            def append(self, element):
+                """
+                Adds an element to the end of the field.
+                :param element: The np.array (or scalar) to append.
+                """
+                element = self._as_array(element)
+                self._reserve(element.shape, element.dtype, self._length + 1)
+                self._data[self._length] = element
+                self._length += 1
 
             def extend(self, data):
                 """
-                Ads a list of np.arrays to the end of the list of np.arrays.
+                Ads a list of np.arrays to the end of the field.
                 :param data: The np.array list to append.
                 """
-                self += list(np.array(data))
+                data = self._as_array(data)
+                if len(data) == 0:
+                    return
+                self._reserve(data.shape[1:], data.dtype, self._length + len(data))
+                self._data[self._length:self._length + len(data)] = data
+                self._length += len(data)
 
             def set(self, data):
                 """
-                Sets the list of np.array to the input data
+                Sets the elements of the field to the input data
                 :param data: The np.array list to be set.
                 """
-                self[:] = []
-                self[:] = list(np.array(data))
+                self._length = 0
+                self.extend(data)
 
             def get_batch(self, batch_size=None, training_length=1, sequential=True):
                 """
@@ -62,14 +128,15 @@ class Buffer(dict):
                 if training_length == 1:
                     # When the training length is 1, the method returns a list of elements,
                     # not a list of sequences of elements.
+                    # The elements are returned as a view on the storage of the field.
                     if batch_size is None:
                         # If batch_size is None : All the elements of the AgentBufferField are returned.
-                        return np.array(self)
+                        return self.data
                     else:
                         # return the batch_size last elements
                         if batch_size > len(self):
                             raise BufferException("Batch size requested is too large")
-                        return np.array(self[-batch_size:])
+                        return self.data[len(self) - batch_size:]
                 else:
                     # The training_length is not None, the method returns a list of SEQUENCES of elements
                     if not sequential:
@@ -82,10 +149,12 @@ class Buffer(dict):
                         if (len(self) - training_length + 1) < batch_size:
                             raise BufferException("The batch size and training length requested for get_batch where"
                                                   " too large given the current number of data points.")
-                        tmp_list = []
-                        for end in range(len(self) - batch_size + 1, len(self) + 1):
-                            tmp_list += [np.array(self[end - training_length:end])]
-                        return np.array(tmp_list)
+                        # Every window of training_length consecutive elements is a strided view of the storage.
+                        data = self.data
+                        windows = np.lib.stride_tricks.as_strided(
+                            data, shape=(len(self) - training_length + 1, training_length) + data.shape[1:],
+                            strides=(data.strides[0],) + data.strides)
+                        return np.array(windows[len(windows) - batch_size:])
                     if sequential:
                         # The sequences will not have overlapping elements (this involves padding)
                         leftover = len(self) % training_length
@@ -98,21 +167,28 @@ class Buffer(dict):
                         if batch_size > (len(self) // training_length + 1 * (leftover != 0)):
                             raise BufferException("The batch size and training length requested for get_batch where"
                                                   " too large given the current number of data points.")
-                        tmp_list = []
-                        padding = np.array(self[-1]) * 0
-                        # The padding is made with zeros and its shape is given by the shape of the last element
-                        for end in range(len(self), len(self) % training_length, -training_length)[:batch_size]:
-                            tmp_list += [np.array(self[end - training_length:end])]
-                        if (leftover != 0) and (len(tmp_list) < batch_size):
-                            tmp_list += [np.array([padding] * (training_length - leftover) + self[:leftover])]
-                        tmp_list.reverse()
-                        return np.array(tmp_list)
+                        data = self.data
+                        if leftover != 0:
+                            # The first sequence is left padded with zeros to be training_length long
+                            padded = np.zeros((len(self) + training_length - leftover,) + data.shape[1:],
+                                              dtype=data.dtype)
+                            padded[training_length - leftover:] = data
+                            data = padded
+                        sequences = data.reshape((-1, training_length) + data.shape[1:])
+                        return sequences[len(sequences) - batch_size:]
+
+            def permute(self, indices):
+                """
+                Reorders the elements of the field in place.
+                :param indices: The permutation of the indices of the elements.
+                """
+                self._data[:self._length] = self.data[indices]
 
             def reset_field(self):
                 """
-                Resets the AgentBufferField
+                Resets the AgentBufferField. Its storage is kept for the next elements.
                 """
-                self[:] = []
+                self._length = 0
 
         def __init__(self):
             self.last_brain_info = None
@@ -154,20 +230,30 @@ class Buffer(dict):
                 l = len(self[key])
             return True
 
-        def shuffle(self, key_list=None):
+        def shuffle(self, key_list=None, permutation=None):
             """
             Shuffles the fields in key_list in a consistent way: The reordering will
             be the same across fields.
             :param key_list: The fields that must be shuffled.
+            :param permutation: The reordering of the elements. A random one if None.
             """
             if key_list is None:
                 key_list = list(self.keys())
             if not self.check_length(key_list):
                 raise BufferException("Unable to shuffle if the fields are not of same length")
-            s = np.arange(len(self[key_list[0]]))
-            np.random.shuffle(s)
+            s = np.random.permutation(len(self[key_list[0]])) if permutation is None else permutation
             for key in key_list:
-                self[key][:] = [self[key][i] for i in s]
+                self[key].permute(s)
+
+        def make_mini_batch(self, start, end):
+            """
+            Creates a mini-batch of the elements start to end of every field, as views on their storage.
+            The views are only valid until the fields are modified.
+            :param start: The index of the first element of the mini-batch.
+            :param end: The index following the last element of the mini-batch.
+            :return: A dictionary of field name to the np.array of its elements.
+            """
+            return {key: field.data[start:end] for key, field in self.items()}
 
     def __init__(self):
         self.update_buffer = self.AgentBuffer()
@@ -0,0 +1,111 @@
+# # Unity ML-Agents Toolkit
+# ## Frozen graph inference
+"""
+Decides the actions of the external brains with the graph exported at the end of the training, which only holds
+the nodes computing the actions, the value estimates and the memories, the training parts of the models being left
+out.
+"""
+
+import logging
+
+import numpy as np
+import tensorflow as tf
+
+from unityagents import AllBrainInfo
+from unitytrainers.trainer import UnityTrainerException
+
+logger = logging.getLogger("unitytrainers")
+
+
+class InferenceEngine(object):
+    def __init__(self, graph_path, brains, graph_scopes):
+        """
+        Loads a graph exported by the TrainerController in a session of its own.
+        :param graph_path: Path of the .bytes file of the exported graph.
+        :param brains: Dictionary of the names of the external brains to their BrainParameters.
+        :param graph_scopes: Dictionary of the names of the external brains to the scope of their model.
+        """
+        graph_def = tf.GraphDef()
+        with open(graph_path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.sess = tf.Session(graph=self.graph)
+        self.brains = brains
+        self.tensors = {}
+        for brain_name, graph_scope in graph_scopes.items():
+            scope = graph_scope + '/' if graph_scope else ''
+            tensors = {name: self._get_tensor(scope + name) for name in [
+                'action', 'value_estimate', 'recurrent_out', 'recurrent_in', 'vector_observation', 'batch_size',
+                'sequence_length', 'prev_action', 'dropout_rate']}
+            if tensors['action'] is None:
+                raise UnityTrainerException("The graph {0} has no action node for brain {1}."
+                                            .format(graph_path, brain_name))
+            tensors['visual_observations'] = [
+                self._get_visual_tensor(scope + 'visual_observation_' + str(i))
+                for i in range(brains[brain_name].number_visual_observations)]
+            self.tensors[brain_name] = tensors
+        logger.info("Loaded the graph {0}.".format(graph_path))
+
+    def _get_tensor(self, name):
+        try:
+            return self.graph.get_tensor_by_name(name + ':0')
+        except KeyError:
+            return None
+
+    def _get_visual_tensor(self, name):
+        # The frames are fed as they are decoded to the uint8 placeholder, which the float one defaults to once
+        # scaled, unless the graph only has the float one.
+        tensor = self._get_tensor(name + '_uint8')
+        if tensor is None:
+            tensor = self._get_tensor(name)
+        return tensor
+
+    def decide_actions(self, all_brain_info: AllBrainInfo):
+        """
+        Decides the actions of the agents of all the external brains in a single run of the session.
+        :param all_brain_info: A dictionary of brain names and BrainInfo from environment.
+        :return: A tuple of dictionaries, indexed by brain name, of the vector actions, memories, text actions
+                 and values to step the environment with.
+        """
+        feed_dict, run_list = {}, []
+        for brain_name, tensors in self.tensors.items():
+            brain_info = all_brain_info[brain_name]
+            if len(brain_info.agents) == 0:
+                continue
+            for name, value in [('batch_size', len(brain_info.agents)), ('sequence_length', 1),
+                                ('vector_observation', brain_info.vector_observations), ('dropout_rate', 1.0)]:
+                if tensors[name] is not None:
+                    feed_dict[tensors[name]] = value
+            for tensor, observations in zip(tensors['visual_observations'], brain_info.visual_observations):
+                if tensor is None:
+                    continue
+                if tensor.dtype == tf.uint8 or observations.dtype != np.uint8:
+                    feed_dict[tensor] = observations
+                else:
+                    feed_dict[tensor] = observations.astype(np.float32) / 255.0
+            if tensors['recurrent_in'] is not None:
+                if brain_info.memories.shape[1] == 0:
+                    brain_info.memories = np.zeros((len(brain_info.agents), tensors['recurrent_in'].shape[1]))
+                feed_dict[tensors['recurrent_in']] = brain_info.memories
+            if tensors['prev_action'] is not None:
+                feed_dict[tensors['prev_action']] = brain_info.previous_vector_actions.reshape(
+                    [-1, len(self.brains[brain_name].vector_action_space_size)])
+            run_list += [t for t in [tensors['action'], tensors['value_estimate'], tensors['recurrent_out']]
+                         if t is not None]
+        run_out = dict(zip(run_list, self.sess.run(run_list, feed_dict=feed_dict))) if run_list else {}
+        vector_action, memory, text_action, value = {}, {}, {}, {}
+        for brain_name, tensors in self.tensors.items():
+            if tensors['action'] not in run_out:
+                vector_action[brain_name], memory[brain_name], text_action[brain_name], value[brain_name] = \
+                    [], [], [], None
+                continue
+            vector_action[brain_name] = run_out[tensors['action']]
+            memory[brain_name] = run_out.get(tensors['recurrent_out'])
+            text_action[brain_name] = None
+            value[brain_name] = run_out.get(tensors['value_estimate'])
+        return vector_action, memory, text_action, value
+
+    def close(self):
+        self.sess.close()
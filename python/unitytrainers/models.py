@@ -14,7 +14,12 @@ class LearningModel(object):
         self.normalize = False
         self.use_recurrent = False
         self.global_step, self.increment_step = self.create_global_steps()
+        # The trainer keeps the step count and feeds it to the runs, global_step is only updated at save time.
+        self.current_step = tf.placeholder_with_default(self.global_step, shape=[], name='current_step')
+        self.new_step = tf.placeholder(shape=[], dtype=tf.int32, name='new_step')
+        self.update_step = tf.assign(self.global_step, self.new_step)
         self.visual_in = []
+        self.visual_in_scaled = []
         self.batch_size = tf.placeholder(shape=None, dtype=tf.int32, name='batch_size')
         self.sequence_length = tf.placeholder(shape=None, dtype=tf.int32, name='sequence_length')
         self.mask_input = tf.placeholder(shape=[None], dtype=tf.float32, name='masks')
@@ -41,10 +46,11 @@ class LearningModel(object):
     @staticmethod
     def create_visual_input(camera_parameters, name):
         """
-        Creates image input op.
+        Creates image input op. Observations are fed as uint8 and scaled to [0, 1] in the graph. The scaled tensor
+        can also be fed directly with floats under the given name, as the exported graph is fed by Unity.
         :param camera_parameters: Parameters for visual observation from BrainInfo.
         :param name: Desired name of input op.
-        :return: input op.
+        :return: uint8 input op and scaled float input tensor.
         """
         o_size_h = camera_parameters['height']
         o_size_w = camera_parameters['width']
@@ -55,8 +61,11 @@ class LearningModel(object):
         else:
             c_channels = 3
 
-        visual_in = tf.placeholder(shape=[None, o_size_h, o_size_w, c_channels], dtype=tf.float32, name=name)
-        return visual_in
+        visual_in = tf.placeholder(shape=[None, o_size_h, o_size_w, c_channels], dtype=tf.uint8,
+                                   name=name + '_uint8')
+        visual_in_scaled = tf.placeholder_with_default(tf.cast(visual_in, tf.float32) / 255.0,
+                                                       shape=[None, o_size_h, o_size_w, c_channels], name=name)
+        return visual_in, visual_in_scaled
 
     def create_vector_input(self, name='vector_observation'):
         """
@@ -71,24 +80,27 @@ class LearningModel(object):
                                                 initializer=tf.zeros_initializer())
             self.running_variance = tf.get_variable("running_variance", [self.o_size], trainable=False,
                                                     dtype=tf.float32, initializer=tf.ones_initializer())
-            self.update_mean, self.update_variance = self.create_normalizer_update(self.vector_in)
+            self.normalization_steps = tf.get_variable("normalization_steps", [], trainable=False, dtype=tf.int64,
+                                                       initializer=tf.zeros_initializer())
+            self.update_normalization = self.create_normalizer_update()
 
-            self.normalized_state = tf.clip_by_value((self.vector_in - self.running_mean) / tf.sqrt(
-                self.running_variance / (tf.cast(self.global_step, tf.float32) + 1)), -5, 5,
-                                                     name="normalized_state")
+            self.normalized_state = tf.clip_by_value((self.vector_in - self.running_mean) / (tf.sqrt(
+                self.running_variance) + 1e-8), -5, 5, name="normalized_state")
             return self.normalized_state
         else:
             return self.vector_in
 
-    def create_normalizer_update(self, vector_input):
-        mean_current_observation = tf.reduce_mean(vector_input, axis=0)
-        new_mean = self.running_mean + (mean_current_observation - self.running_mean) / \
-                   tf.cast(self.global_step + 1, tf.float32)
-        new_variance = self.running_variance + (mean_current_observation - new_mean) * \
-                       (mean_current_observation - self.running_mean)
-        update_mean = tf.assign(self.running_mean, new_mean)
-        update_variance = tf.assign(self.running_variance, new_variance)
-        return update_mean, update_variance
+    def create_normalizer_update(self):
+        """
+        Creates the op writing the statistics of the RunningNormalizer of the trainer to the normalization variables.
+        The statistics are computed in Python and only written when they change.
+        """
+        self.new_mean = tf.placeholder(shape=[self.o_size], dtype=tf.float32, name='new_mean')
+        self.new_variance = tf.placeholder(shape=[self.o_size], dtype=tf.float32, name='new_variance')
+        self.new_normalization_steps = tf.placeholder(shape=[], dtype=tf.int64, name='new_normalization_steps')
+        return tf.group(tf.assign(self.running_mean, self.new_mean),
+                        tf.assign(self.running_variance, self.new_variance),
+                        tf.assign(self.normalization_steps, self.new_normalization_steps))
 
     @staticmethod
     def create_vector_observation_encoder(observation_input, h_size, activation, num_layers, scope, reuse):
@@ -144,9 +156,12 @@ class LearningModel(object):
         activation_fn = self.swish
 
         self.visual_in = []
+        self.visual_in_scaled = []
         for i in range(brain.number_visual_observations):
-            visual_input = self.create_visual_input(brain.camera_resolutions[i], name="visual_observation_" + str(i))
+            visual_input, visual_input_scaled = self.create_visual_input(brain.camera_resolutions[i],
+                                                                         name="visual_observation_" + str(i))
             self.visual_in.append(visual_input)
+            self.visual_in_scaled.append(visual_input_scaled)
         vector_observation_input = self.create_vector_input()
 
         final_hiddens = []
@@ -155,7 +170,7 @@ class LearningModel(object):
             hidden_state, hidden_visual = None, None
             if self.v_size > 0:
                 for j in range(brain.number_visual_observations):
-                    encoded_visual = self.create_visual_observation_encoder(self.visual_in[j], h_size,
+                    encoded_visual = self.create_visual_observation_encoder(self.visual_in_scaled[j], h_size,
                                                                             activation_fn, num_layers,
                                                                             "main_graph_{}_encoder{}"
                                                                             .format(i, j), False)
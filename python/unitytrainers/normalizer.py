@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class RunningNormalizer(object):
+    def __init__(self, size):
+        """
+        Running mean and variance of the vector observations, used to normalize them.
+        The statistics are merged batch by batch with the parallel algorithm of Chan et al.
+        :param size: Size of the vector observations.
+        """
+        self.size = size
+        self.count = 0
+        self.mean = np.zeros(size, dtype=np.float64)
+        self._m2 = np.zeros(size, dtype=np.float64)
+
+    @property
+    def variance(self):
+        """
+        Returns the variance of the observations seen so far, or ones if none was seen.
+        """
+        if self.count == 0:
+            return np.ones(self.size, dtype=np.float64)
+        return self._m2 / self.count
+
+    def update(self, observations):
+        """
+        Adds a batch of observations to the statistics.
+        :param observations: Array of shape (number of observations, size).
+        """
+        observations = np.asarray(observations, dtype=np.float64).reshape([-1, self.size])
+        batch_count = len(observations)
+        if batch_count == 0:
+            return
+        batch_mean = observations.mean(axis=0)
+        batch_m2 = np.square(observations - batch_mean).sum(axis=0)
+        delta = batch_mean - self.mean
+        count = self.count + batch_count
+        self.mean = self.mean + delta * batch_count / count
+        self._m2 = self._m2 + batch_m2 + np.square(delta) * self.count * batch_count / count
+        self.count = count
+
+    def set(self, mean, variance, count):
+        """
+        Sets the statistics, for instance to the ones restored from a checkpoint.
+        :param mean: Mean of the observations.
+        :param variance: Variance of the observations.
+        :param count: Number of observations.
+        """
+        self.count = int(count)
+        self.mean = np.asarray(mean, dtype=np.float64).copy()
+        self._m2 = np.asarray(variance, dtype=np.float64) * self.count
@@ -31,6 +31,7 @@ class PPOModel(LearningModel):
         if num_layers < 1:
             num_layers = 1
         self.last_reward, self.new_reward, self.update_reward = self.create_reward_encoder()
+        self.step_end = tf.group(self.update_step, self.update_reward)
         if brain.vector_action_space_type == "continuous":
             self.create_cc_actor_critic(h_size, num_layers)
             self.entropy = tf.ones_like(tf.reshape(self.value, [-1])) * self.entropy
@@ -65,20 +66,23 @@ class PPOModel(LearningModel):
 
         if self.v_size > 0:
             self.next_visual_in = []
+            self.next_visual_in_scaled = []
             visual_encoders = []
             next_visual_encoders = []
             for i in range(self.v_size):
                 # Create input ops for next (t+1) visual observations.
-                next_visual_input = self.create_visual_input(self.brain.camera_resolutions[i],
-                                                             name="next_visual_observation_" + str(i))
+                next_visual_input, next_visual_input_scaled = self.create_visual_input(
+                    self.brain.camera_resolutions[i], name="next_visual_observation_" + str(i))
                 self.next_visual_in.append(next_visual_input)
+                self.next_visual_in_scaled.append(next_visual_input_scaled)
 
                 # Create the encoder ops for current and next visual input. Not that these encoders are siamese.
-                encoded_visual = self.create_visual_observation_encoder(self.visual_in[i], self.curiosity_enc_size,
+                encoded_visual = self.create_visual_observation_encoder(self.visual_in_scaled[i],
+                                                                        self.curiosity_enc_size,
                                                                         self.swish, 1, "stream_{}_visual_obs_encoder"
                                                                         .format(i), False)
 
-                encoded_next_visual = self.create_visual_observation_encoder(self.next_visual_in[i],
+                encoded_next_visual = self.create_visual_observation_encoder(self.next_visual_in_scaled[i],
                                                                              self.curiosity_enc_size,
                                                                              self.swish, 1,
                                                                              "stream_{}_visual_obs_encoder".format(i),
@@ -137,19 +141,39 @@ class PPOModel(LearningModel):
         """
         Creates forward model TensorFlow ops for Curiosity module.
         Predicts encoded future state based on encoded current state and given action.
+        The same forward model also predicts the current encoded state from previous_encoded_state and
+        previous_actions, so that the intrinsic reward of the previous transition can be computed with the action.
         :param encoded_state: Tensor corresponding to encoded current state.
         :param encoded_next_state: Tensor corresponding to encoded next state.
         """
-        combined_input = tf.concat([encoded_state, self.selected_actions], axis=1)
-        hidden = tf.layers.dense(combined_input, 256, activation=self.swish)
+        hidden_layer = tf.layers.Dense(256, activation=self.swish)
         # We compare against the concatenation of all observation streams, hence `self.v_size + int(self.o_size > 0)`.
-        pred_next_state = tf.layers.dense(hidden, self.curiosity_enc_size * (self.v_size + int(self.o_size > 0)),
-                                          activation=None)
+        prediction_layer = tf.layers.Dense(self.curiosity_enc_size * (self.v_size + int(self.o_size > 0)),
+                                           activation=None)
+        combined_input = tf.concat([encoded_state, self.selected_actions], axis=1)
+        pred_next_state = prediction_layer(hidden_layer(combined_input))
 
         squared_difference = 0.5 * tf.reduce_sum(tf.squared_difference(pred_next_state, encoded_next_state), axis=1)
         self.intrinsic_reward = tf.clip_by_value(self.curiosity_strength * squared_difference, 0, 1)
         self.forward_loss = tf.reduce_mean(tf.dynamic_partition(squared_difference, self.mask, 2)[1])
 
+        self.encoded_state = encoded_state
+        self.previous_encoded_state = tf.placeholder(shape=[None, encoded_state.shape[1]], dtype=tf.float32,
+                                                     name='previous_encoded_state')
+        if self.brain.vector_action_space_type == "continuous":
+            self.previous_actions = tf.placeholder(shape=[None, self.a_size[0]], dtype=tf.float32,
+                                                   name='previous_actions')
+            previous_selected_actions = self.previous_actions
+        else:
+            self.previous_actions = tf.placeholder(shape=[None, len(self.a_size)], dtype=tf.int32,
+                                                   name='previous_actions')
+            previous_selected_actions = tf.concat([
+                tf.one_hot(self.previous_actions[:, i], self.a_size[i]) for i in range(len(self.a_size))], axis=1)
+        pred_state = prediction_layer(hidden_layer(
+            tf.concat([self.previous_encoded_state, previous_selected_actions], axis=1)))
+        previous_squared_difference = 0.5 * tf.reduce_sum(tf.squared_difference(pred_state, encoded_state), axis=1)
+        self.previous_intrinsic_reward = tf.clip_by_value(self.curiosity_strength * previous_squared_difference, 0, 1)
+
     def create_ppo_optimizer(self, probs, old_probs, value, entropy, beta, epsilon, lr, max_step):
         """
         Creates training-specific Tensorflow ops for PPO models.
@@ -164,12 +188,12 @@ class PPOModel(LearningModel):
         """
         self.returns_holder = tf.placeholder(shape=[None], dtype=tf.float32, name='discounted_rewards')
         self.advantage = tf.placeholder(shape=[None, 1], dtype=tf.float32, name='advantages')
-        self.learning_rate = tf.train.polynomial_decay(lr, self.global_step, max_step, 1e-10, power=1.0)
+        self.learning_rate = tf.train.polynomial_decay(lr, self.current_step, max_step, 1e-10, power=1.0)
 
         self.old_value = tf.placeholder(shape=[None], dtype=tf.float32, name='old_value_estimates')
 
-        decay_epsilon = tf.train.polynomial_decay(epsilon, self.global_step, max_step, 0.1, power=1.0)
-        decay_beta = tf.train.polynomial_decay(beta, self.global_step, max_step, 1e-5, power=1.0)
+        decay_epsilon = tf.train.polynomial_decay(epsilon, self.current_step, max_step, 0.1, power=1.0)
+        decay_beta = tf.train.polynomial_decay(beta, self.current_step, max_step, 1e-5, power=1.0)
         optimizer = tf.train.AdamOptimizer(learning_rate=self.learning_rate)
 
         clipped_value_estimate = self.old_value + tf.clip_by_value(tf.reduce_sum(value, axis=1) - self.old_value,
@@ -182,14 +206,26 @@ class PPOModel(LearningModel):
         # Here we calculate PPO policy loss. In continuous control this is done independently for each action gaussian
         # and then averaged together. This provides significantly better performance than treating the probability
         # as an average of probabilities, or as a joint probability.
+        # When the model is updated asynchronously, old_probs are the ones of the policy at the start of the update
+        # and the clipped importance weights correct for the lag of the policy that collected the experiences.
+        self.importance_weights = tf.placeholder_with_default(tf.ones_like(self.advantage), shape=[None, 1],
+                                                              name='importance_weights')
         r_theta = tf.exp(probs - old_probs)
         p_opt_a = r_theta * self.advantage
         p_opt_b = tf.clip_by_value(r_theta, 1.0 - decay_epsilon, 1.0 + decay_epsilon) * self.advantage
-        self.policy_loss = -tf.reduce_mean(tf.dynamic_partition(tf.minimum(p_opt_a, p_opt_b), self.mask, 2)[1])
+        self.policy_loss = -tf.reduce_mean(tf.dynamic_partition(
+            self.importance_weights * tf.minimum(p_opt_a, p_opt_b), self.mask, 2)[1])
 
         self.loss = self.policy_loss + 0.5 * self.value_loss - decay_beta * tf.reduce_mean(
             tf.dynamic_partition(entropy, self.mask, 2)[1])
 
         if self.use_curiosity:
             self.loss += 10 * (0.2 * self.forward_loss + 0.8 * self.inverse_loss)
-        self.update_batch = optimizer.minimize(self.loss)
+        # The gradients are also exposed with placeholders to apply them, so that the data-parallel learner can
+        # average the gradients of its processes before applying them.
+        gradients, variables = zip(*[(g, v) for g, v in optimizer.compute_gradients(self.loss) if g is not None])
+        self.gradients = [tf.convert_to_tensor(g) for g in gradients]
+        self.update_batch = optimizer.apply_gradients(zip(self.gradients, variables))
+        self.gradient_holders = [tf.placeholder(shape=g.shape, dtype=g.dtype, name='gradient_holder')
+                                 for g in self.gradients]
+        self.apply_gradient_holders = optimizer.apply_gradients(zip(self.gradient_holders, variables))
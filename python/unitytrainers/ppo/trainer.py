@@ -4,12 +4,14 @@
 
 import logging
 import os
+import threading
 
 import numpy as np
 import tensorflow as tf
 
 from unityagents import AllBrainInfo, BrainInfo
 from unitytrainers.buffer import Buffer
+from unitytrainers.normalizer import RunningNormalizer
 from unitytrainers.ppo.models import PPOModel
 from unitytrainers.trainer import UnityTrainerException, Trainer
 
@@ -44,6 +46,7 @@ class PPOTrainer(Trainer):
         self.use_curiosity = bool(trainer_parameters['use_curiosity'])
         self.sequence_length = 1
         self.step = 0
+        self.last_reward = 0.0
         self.has_updated = False
         self.m_size = None
         if self.use_recurrent:
@@ -80,9 +83,23 @@ class PPOTrainer(Trainer):
             stats['inverse_loss'] = []
             stats['intrinsic_reward'] = []
             self.intrinsic_rewards = {}
+        # BrainInfo of the last action and its curiosity encoded states, from which the next action also computes
+        # the intrinsic rewards of the transition. The BrainInfo of these rewards and the rewards themselves.
+        self.last_encoded_states = None
+        self.fused_intrinsic_rewards = None
         self.stats = stats
 
         self.training_buffer = Buffer()
+        # When the model is updated asynchronously, the experiences are collected in a second update buffer
+        # while the learner thread updates the model with the first one.
+        self.async_update = bool(trainer_parameters.get('async_update', False))
+        self.max_importance_weight = float(trainer_parameters.get('max_importance_weight', 1.0))
+        self.spare_update_buffer = Buffer.AgentBuffer()
+        self.learner = None
+        self.learner_stats = None
+        self.learner_error = None
+        if self.async_update:
+            stats['importance_weight'] = []
         self.cumulative_rewards = {}
         self.episode_steps = {}
         self.is_continuous_action = (env.brains[brain_name].vector_action_space_type == "continuous")
@@ -100,8 +117,21 @@ class PPOTrainer(Trainer):
             self.inference_run_list.append(self.model.output_pre)
         if self.use_recurrent:
             self.inference_run_list.extend([self.model.memory_out])
-        if self.is_training and self.use_vector_obs and self.trainer_parameters['normalize']:
-            self.inference_run_list.extend([self.model.update_mean, self.model.update_variance])
+        self.normalizer = None
+        if self.use_vector_obs and self.trainer_parameters['normalize']:
+            self.normalizer = RunningNormalizer(self.model.o_size)
+        # When the mini-batches are split across processes, the data-parallel learner runs the update with
+        # replicas of the model.
+        self.data_parallel = None
+        data_parallel_processes = int(trainer_parameters.get('data_parallel_processes', 1))
+        if training and data_parallel_processes > 1:
+            if max(int(trainer_parameters['batch_size'] / self.sequence_length), 1) < data_parallel_processes:
+                raise UnityTrainerException("The mini-batches of brain {0} are too small to be split across {1} "
+                                            "processes.".format(brain_name, data_parallel_processes))
+            # Imported here since the data-parallel learner creates the replicas of the model with this module.
+            from unitytrainers.allreduce import DataParallelLearner
+            self.data_parallel = DataParallelLearner.start(data_parallel_processes, self.brain, trainer_parameters,
+                                                           seed)
 
     def __str__(self):
         return '''Hyperparameters for the PPO Trainer of brain {0}: \n{1}'''.format(
@@ -143,34 +173,83 @@ class PPOTrainer(Trainer):
         Returns the last reward the trainer has had
         :return: the new last reward
         """
-        return self.sess.run(self.model.last_reward)
+        return self.last_reward
 
     def increment_step_and_update_last_reward(self):
         """
-        Increment the step count of the trainer and Updates the last reward
+        Increment the step count of the trainer and Updates the last reward.
+        They are kept in Python and only written to the model by save_step_to_graph.
         """
         if len(self.stats['cumulative_reward']) > 0:
-            mean_reward = np.mean(self.stats['cumulative_reward'])
-            self.sess.run([self.model.update_reward,
-                           self.model.increment_step],
-                          feed_dict={self.model.new_reward: mean_reward})
-        else:
-            self.sess.run(self.model.increment_step)
-        self.step = self.sess.run(self.model.global_step)
+            self.last_reward = float(np.mean(self.stats['cumulative_reward']))
+        self.step += 1
+
+    def save_step_to_graph(self):
+        """
+        Writes the step count and the last reward of the trainer to the variables of its model.
+        """
+        self.sess.run(self.model.step_end, feed_dict={self.model.new_step: self.step,
+                                                      self.model.new_reward: self.last_reward})
+
+    def load_step_from_graph(self):
+        """
+        Reads the step count and the last reward of the trainer from the variables of its model, as well as the
+        statistics of its normalizer.
+        """
+        step, last_reward = self.sess.run([self.model.global_step, self.model.last_reward])
+        self.step, self.last_reward = int(step), float(last_reward)
+        if self.normalizer is not None:
+            mean, variance, count = self.sess.run([self.model.running_mean, self.model.running_variance,
+                                                   self.model.normalization_steps])
+            if count == 0 and self.step > 0:
+                # The checkpoints written before the normalization steps were saved updated the statistics at
+                # every step, and kept the sum of the squared deviations as the variance.
+                count = self.step
+                variance = variance / (self.step + 1)
+                self.sess.run(self.model.update_normalization,
+                              feed_dict={self.model.new_mean: mean,
+                                         self.model.new_variance: variance,
+                                         self.model.new_normalization_steps: count})
+            self.normalizer.set(mean, variance, count)
+
+    def update_normalizer(self, vector_observations):
+        """
+        Adds vector observations to the statistics of the normalizer and writes them to the model.
+        :param vector_observations: Array of the vector observations.
+        """
+        if len(vector_observations) == 0:
+            return
+        self.normalizer.update(vector_observations)
+        self.sess.run(self.model.update_normalization,
+                      feed_dict={self.model.new_mean: self.normalizer.mean,
+                                 self.model.new_variance: self.normalizer.variance,
+                                 self.model.new_normalization_steps: self.normalizer.count})
+
+    def add_update_experiences(self, fields, stats):
+        """
+        Adds experiences ready for an update, collected by a rollout worker, to the update buffer, and their
+        vector observations to the normalizer.
+        :param fields: Dictionary of the fields of the update buffer of the worker to their elements.
+        :param stats: Dictionary of the training statistics of the worker.
+        """
+        super(PPOTrainer, self).add_update_experiences(fields, stats)
+        if self.normalizer is not None and self.is_training and 'vector_obs' in fields:
+            vector_observations = fields['vector_obs'].reshape([-1, self.model.o_size])
+            self.update_normalizer(vector_observations[fields['masks'].reshape([-1]) > 0])
 
-    def take_action(self, all_brain_info: AllBrainInfo):
+    def prepare_action(self, all_brain_info: AllBrainInfo):
         """
-        Decides actions given observations information, and takes them in environment.
+        Creates the run of the session deciding the actions given observations information.
         :param all_brain_info: A dictionary of brain names and BrainInfo from environment.
-        :return: a tuple containing action, memories, values and an object
-        to be passed to add experiences
+        :return: a tuple containing the feed dict and the list of tensors of the run, or None if
+        there is no agent to decide the actions of
         """
         curr_brain_info = all_brain_info[self.brain_name]
         if len(curr_brain_info.agents) == 0:
-            return [], [], [], None, None
+            return None
 
         feed_dict = {self.model.batch_size: len(curr_brain_info.vector_observations),
-                     self.model.sequence_length: 1}
+                     self.model.sequence_length: 1, self.model.current_step: self.step}
         if self.use_recurrent:
             if not self.is_continuous_action:
                 feed_dict[self.model.prev_action] = curr_brain_info.previous_vector_actions.reshape(
@@ -184,8 +263,32 @@ class PPOTrainer(Trainer):
         if self.use_vector_obs:
             feed_dict[self.model.vector_in] = curr_brain_info.vector_observations
 
-        values = self.sess.run(self.inference_run_list, feed_dict=feed_dict)
-        run_out = dict(zip(self.inference_run_list, values))
+        run_list = self.inference_run_list
+        if self.use_curiosity:
+            run_list = run_list + [self.model.encoded_state]
+            # The intrinsic rewards of the transition from the last action are computed in the same run when
+            # the agents are the same and the model was not updated since, nor is being updated.
+            last_encoded_states = self.last_encoded_states
+            if last_encoded_states is not None and last_encoded_states[0].agents == curr_brain_info.agents \
+                    and self.learner is None:
+                run_list.append(self.model.previous_intrinsic_reward)
+                feed_dict[self.model.previous_encoded_state] = last_encoded_states[1]
+                feed_dict[self.model.previous_actions] = curr_brain_info.previous_vector_actions
+        return feed_dict, run_list
+
+    def complete_action(self, all_brain_info: AllBrainInfo, run_out):
+        """
+        Decides actions from the outputs of the run created by prepare_action.
+        :param all_brain_info: A dictionary of brain names and BrainInfo from environment.
+        :param run_out: A dictionary of the tensors of the run to their value.
+        :return: a tuple containing action, memories, values and an object
+        to be passed to add experiences
+        """
+        curr_brain_info = all_brain_info[self.brain_name]
+        if self.use_curiosity:
+            self.last_encoded_states = (curr_brain_info, run_out[self.model.encoded_state])
+            self.fused_intrinsic_rewards = (curr_brain_info, run_out[self.model.previous_intrinsic_reward]) \
+                if self.model.previous_intrinsic_reward in run_out else None
         self.stats['value_estimate'].append(run_out[self.model.value].mean())
         self.stats['entropy'].append(run_out[self.model.entropy].mean())
         self.stats['learning_rate'].append(run_out[self.model.learning_rate])
@@ -215,7 +318,7 @@ class PPOTrainer(Trainer):
             agent_brain_info = self.training_buffer[agent_id].last_brain_info
             if agent_brain_info is None:
                 agent_brain_info = next_info
-            agent_index = agent_brain_info.agents.index(agent_id)
+            agent_index = agent_brain_info.agent_index[agent_id]
             for i in range(len(next_info.visual_observations)):
                 visual_observations[i].append(agent_brain_info.visual_observations[i][agent_index])
             vector_observations.append(agent_brain_info.vector_observations[agent_index])
@@ -240,9 +343,14 @@ class PPOTrainer(Trainer):
         :return: Intrinsic rewards for all agents.
         """
         if self.use_curiosity:
-            feed_dict = {self.model.batch_size: len(next_info.vector_observations), self.model.sequence_length: 1}
+            fused_intrinsic_rewards = self.fused_intrinsic_rewards
+            if fused_intrinsic_rewards is not None and fused_intrinsic_rewards[0] is next_info:
+                # Already computed when taking the action following next_info
+                return fused_intrinsic_rewards[1] * float(self.has_updated)
+            feed_dict = {self.model.batch_size: len(next_info.vector_observations), self.model.sequence_length: 1,
+                         self.model.current_step: self.step}
             if self.is_continuous_action:
-                feed_dict[self.model.output] = next_info.previous_vector_actions
+                feed_dict[self.model.selected_actions] = next_info.previous_vector_actions
             else:
                 feed_dict[self.model.action_holder] = next_info.previous_vector_actions
 
@@ -266,29 +374,30 @@ class PPOTrainer(Trainer):
         else:
             return None
 
-    def generate_value_estimate(self, brain_info, idx):
+    def generate_value_estimates(self, brain_info, idxs):
         """
-        Generates value estimates for bootstrapping.
+        Generates value estimates for bootstrapping, for several agents with a single evaluation of the model.
         :param brain_info: BrainInfo to be used for bootstrapping.
-        :param idx: Index in BrainInfo of agent.
-        :return: Value estimate.
+        :param idxs: Indices in BrainInfo of the agents.
+        :return: Array of the value estimates of the agents.
         """
-        feed_dict = {self.model.batch_size: 1, self.model.sequence_length: 1}
+        feed_dict = {self.model.batch_size: len(idxs), self.model.sequence_length: 1,
+                     self.model.current_step: self.step}
         if self.use_visual_obs:
             for i in range(len(brain_info.visual_observations)):
-                feed_dict[self.model.visual_in[i]] = [brain_info.visual_observations[i][idx]]
+                feed_dict[self.model.visual_in[i]] = brain_info.visual_observations[i][idxs]
         if self.use_vector_obs:
-            feed_dict[self.model.vector_in] = [brain_info.vector_observations[idx]]
+            feed_dict[self.model.vector_in] = brain_info.vector_observations[idxs]
         if self.use_recurrent:
             if brain_info.memories.shape[1] == 0:
                 brain_info.memories = np.zeros(
                     (len(brain_info.vector_observations), self.m_size))
-            feed_dict[self.model.memory_in] = [brain_info.memories[idx]]
+            feed_dict[self.model.memory_in] = brain_info.memories[idxs]
         if not self.is_continuous_action and self.use_recurrent:
-            feed_dict[self.model.prev_action] = brain_info.previous_vector_actions[idx].reshape(
+            feed_dict[self.model.prev_action] = brain_info.previous_vector_actions[idxs].reshape(
                 [-1, len(self.brain.vector_action_space_size)])
-        value_estimate = self.sess.run(self.model.value, feed_dict)
-        return value_estimate
+        value_estimates = self.sess.run(self.model.value, feed_dict)
+        return value_estimates[:, 0]
 
     def add_experiences(self, curr_all_info: AllBrainInfo, next_all_info: AllBrainInfo, take_action_outputs):
         """
@@ -310,8 +419,8 @@ class PPOTrainer(Trainer):
             stored_info = self.training_buffer[agent_id].last_brain_info
             stored_take_action_outputs = self.training_buffer[agent_id].last_take_action_outputs
             if stored_info is not None:
-                idx = stored_info.agents.index(agent_id)
-                next_idx = next_info.agents.index(agent_id)
+                idx = stored_info.agent_index[agent_id]
+                next_idx = next_info.agent_index[agent_id]
                 if not stored_info.local_done[idx]:
                     if self.use_visual_obs:
                         for i, _ in enumerate(stored_info.visual_observations):
@@ -365,48 +474,65 @@ class PPOTrainer(Trainer):
         """
 
         info = new_info[self.brain_name]
+        finished, value_next, bootstrapped = [], [], []
         for l in range(len(info.agents)):
             agent_actions = self.training_buffer[info.agents[l]]['actions']
             if ((info.local_done[l] or len(agent_actions) > self.trainer_parameters['time_horizon'])
                     and len(agent_actions) > 0):
                 agent_id = info.agents[l]
                 if info.local_done[l] and not info.max_reached[l]:
-                    value_next = 0.0
+                    value_next.append(0.0)
+                elif info.max_reached[l]:
+                    # The value of the last observation was already estimated when taking the last action
+                    bootstrapping_info = self.training_buffer[agent_id].last_brain_info
+                    take_action_outputs = self.training_buffer[agent_id].last_take_action_outputs
+                    idx = bootstrapping_info.agent_index[agent_id]
+                    value_next.append(float(take_action_outputs[self.model.value][idx, 0]))
                 else:
-                    if info.max_reached[l]:
-                        bootstrapping_info = self.training_buffer[agent_id].last_brain_info
-                        idx = bootstrapping_info.agents.index(agent_id)
-                    else:
-                        bootstrapping_info = info
-                        idx = l
-                    value_next = self.generate_value_estimate(bootstrapping_info, idx)
-
-                self.training_buffer[agent_id]['advantages'].set(
-                    get_gae(
-                        rewards=self.training_buffer[agent_id]['rewards'].get_batch(),
-                        value_estimates=self.training_buffer[agent_id]['value_estimates'].get_batch(),
-                        value_next=value_next,
-                        gamma=self.trainer_parameters['gamma'],
-                        lambd=self.trainer_parameters['lambd']))
-                self.training_buffer[agent_id]['discounted_returns'].set(
-                    self.training_buffer[agent_id]['advantages'].get_batch()
-                    + self.training_buffer[agent_id]['value_estimates'].get_batch())
-
-                self.training_buffer.append_update_buffer(agent_id, batch_size=None,
-                                                          training_length=self.sequence_length)
-
-                self.training_buffer[agent_id].reset_agent()
-                if info.local_done[l]:
-                    self.stats['cumulative_reward'].append(
-                        self.cumulative_rewards.get(agent_id, 0))
-                    self.stats['episode_length'].append(
-                        self.episode_steps.get(agent_id, 0))
-                    self.cumulative_rewards[agent_id] = 0
-                    self.episode_steps[agent_id] = 0
-                    if self.use_curiosity:
-                        self.stats['intrinsic_reward'].append(
-                            self.intrinsic_rewards.get(agent_id, 0))
-                        self.intrinsic_rewards[agent_id] = 0
+                    # Estimated below, together with the other agents reaching the time horizon
+                    value_next.append(0.0)
+                    bootstrapped.append(len(finished))
+                finished.append(l)
+        if len(bootstrapped) > 0:
+            value_estimates = self.generate_value_estimates(info, [finished[i] for i in bootstrapped])
+            for i, value_estimate in zip(bootstrapped, value_estimates):
+                value_next[i] = float(value_estimate)
+
+        # The advantages of all the trajectories finishing at this step are computed together
+        agent_ids = [info.agents[l] for l in finished]
+        advantages = get_gae_batch(
+            rewards=[self.training_buffer[agent_id]['rewards'].get_batch() for agent_id in agent_ids],
+            value_estimates=[self.training_buffer[agent_id]['value_estimates'].get_batch() for agent_id in agent_ids],
+            value_next=value_next,
+            gamma=self.trainer_parameters['gamma'],
+            lambd=self.trainer_parameters['lambd'])
+        vector_observations = []
+        for l, agent_id, agent_advantages in zip(finished, agent_ids, advantages):
+            self.training_buffer[agent_id]['advantages'].set(agent_advantages)
+            self.training_buffer[agent_id]['discounted_returns'].set(
+                agent_advantages + self.training_buffer[agent_id]['value_estimates'].get_batch())
+            if self.normalizer is not None and self.is_training:
+                # The views stay valid after the reset of the buffer of the agent, which keeps its storage.
+                vector_observations.append(self.training_buffer[agent_id]['vector_obs'].get_batch())
+
+            self.training_buffer.append_update_buffer(agent_id, batch_size=None,
+                                                      training_length=self.sequence_length)
+
+            self.training_buffer[agent_id].reset_agent()
+            if info.local_done[l]:
+                self.stats['cumulative_reward'].append(
+                    self.cumulative_rewards.get(agent_id, 0))
+                self.stats['episode_length'].append(
+                    self.episode_steps.get(agent_id, 0))
+                self.cumulative_rewards[agent_id] = 0
+                self.episode_steps[agent_id] = 0
+                if self.use_curiosity:
+                    self.stats['intrinsic_reward'].append(
+                        self.intrinsic_rewards.get(agent_id, 0))
+                    self.intrinsic_rewards[agent_id] = 0
+        if len(vector_observations) > 0:
+            # The statistics are updated once with all the trajectories finishing at this step
+            self.update_normalizer(np.concatenate(vector_observations))
 
     def end_episode(self):
         """
@@ -414,6 +540,8 @@ class PPOTrainer(Trainer):
         Get only called when the academy resets.
         """
         self.training_buffer.reset_all()
+        self.last_encoded_states = None
+        self.fused_intrinsic_rewards = None
         for agent_id in self.cumulative_rewards:
             self.cumulative_rewards[agent_id] = 0
         for agent_id in self.episode_steps:
@@ -427,88 +555,207 @@ class PPOTrainer(Trainer):
         Returns whether or not the trainer has enough elements to run update model
         :return: A boolean corresponding to whether or not update_model() can be run
         """
+        if self.learner is not None:
+            if self.learner.is_alive():
+                return False
+            self.wait_update()
         size_of_buffer = len(self.training_buffer.update_buffer['actions'])
         return size_of_buffer > max(int(self.trainer_parameters['buffer_size'] / self.sequence_length), 1)
 
     def update_model(self):
         """
-        Uses training_buffer to update model.
+        Uses training_buffer to update model. When the update is asynchronous, it runs in a learner thread
+        on the experiences collected so far while the following ones are collected in another update buffer.
+        """
+        self.wait_update()
+        # The states encoded before the update cannot be compared with the states encoded after it.
+        self.last_encoded_states = None
+        if not self.async_update:
+            self._add_update_stats(self._update_from_buffer(self.training_buffer.update_buffer))
+            return
+        update_buffer = self.training_buffer.update_buffer
+        self.training_buffer.update_buffer = self.spare_update_buffer
+        self.spare_update_buffer = update_buffer
+        self.learner_stats = None
+        self.learner = threading.Thread(target=self._learn, args=(update_buffer,))
+        self.learner.daemon = True
+        self.learner.start()
+
+    def wait_update(self):
+        """
+        Waits for the learner thread, if any, to be done with its update, adds the statistics of the update
+        and raises its error if it failed.
+        """
+        if self.learner is not None:
+            self.learner.join()
+            self.learner = None
+            # The states encoded during the update cannot be compared with the states encoded after it.
+            self.last_encoded_states = None
+            if self.learner_stats is not None:
+                self._add_update_stats(self.learner_stats)
+                self.learner_stats = None
+        if self.learner_error is not None:
+            error, self.learner_error = self.learner_error, None
+            raise error
+
+    def _learn(self, update_buffer):
+        # The statistics are added by the main thread, which writes and resets them.
+        try:
+            self.learner_stats = self._update_from_buffer(update_buffer)
+        except Exception as e:
+            self.learner_error = e
+
+    def _add_update_stats(self, update_stats):
+        for key, value in update_stats.items():
+            self.stats[key].append(value)
+
+    def make_update_feed_dict(self, mini_batch, proximal=False):
+        """
+        Creates the feed dict of the model from a mini-batch of the update buffer.
+        :param mini_batch: Dictionary of field name to the np.array of its elements.
+        :param proximal: Whether to feed the proximal action probabilities and the importance weights.
+        :return: The feed dict.
+        """
+        feed_dict = {self.model.batch_size: len(mini_batch['actions']),
+                     self.model.sequence_length: self.sequence_length,
+                     self.model.current_step: self.step,
+                     self.model.mask_input: mini_batch['masks'].reshape([-1]),
+                     self.model.returns_holder: mini_batch['discounted_returns'].reshape([-1]),
+                     self.model.old_value: mini_batch['value_estimates'].reshape([-1]),
+                     self.model.advantage: mini_batch['advantages'].reshape([-1, 1]),
+                     self.model.all_old_log_probs: mini_batch['action_probs'].reshape(
+                         [-1, sum(self.brain.vector_action_space_size)])}
+        if proximal:
+            feed_dict[self.model.all_old_log_probs] = mini_batch['proximal_action_probs'].reshape(
+                [-1, sum(self.brain.vector_action_space_size)])
+            feed_dict[self.model.importance_weights] = mini_batch['importance_weights'].reshape([-1, 1])
+        if self.is_continuous_action:
+            feed_dict[self.model.output_pre] = mini_batch['actions_pre'].reshape(
+                [-1, self.brain.vector_action_space_size[0]])
+        else:
+            feed_dict[self.model.action_holder] = mini_batch['actions'].reshape(
+                [-1, len(self.brain.vector_action_space_size)])
+            if self.use_recurrent:
+                feed_dict[self.model.prev_action] = mini_batch['prev_action'].reshape(
+                    [-1, len(self.brain.vector_action_space_size)])
+        if self.use_vector_obs:
+            total_observation_length = self.brain.vector_observation_space_size * \
+                                       self.brain.num_stacked_vector_observations
+            feed_dict[self.model.vector_in] = mini_batch['vector_obs'].reshape(
+                [-1, total_observation_length])
+            if self.use_curiosity:
+                feed_dict[self.model.next_vector_in] = mini_batch['next_vector_in'] \
+                    .reshape([-1, total_observation_length])
+        if self.use_visual_obs:
+            for i, _ in enumerate(self.model.visual_in):
+                _obs = mini_batch['visual_obs%d' % i]
+                if self.sequence_length > 1 and self.use_recurrent:
+                    (_batch, _seq, _w, _h, _c) = _obs.shape
+                    feed_dict[self.model.visual_in[i]] = _obs.reshape([-1, _w, _h, _c])
+                else:
+                    feed_dict[self.model.visual_in[i]] = _obs
+            if self.use_curiosity:
+                for i, _ in enumerate(self.model.visual_in):
+                    _obs = mini_batch['next_visual_obs%d' % i]
+                    if self.sequence_length > 1 and self.use_recurrent:
+                        (_batch, _seq, _w, _h, _c) = _obs.shape
+                        feed_dict[self.model.next_visual_in[i]] = _obs.reshape([-1, _w, _h, _c])
+                    else:
+                        feed_dict[self.model.next_visual_in[i]] = _obs
+        if self.use_recurrent:
+            mem_in = mini_batch['memory'][:, 0, :]
+            feed_dict[self.model.memory_in] = mem_in
+        return feed_dict
+
+    def compute_importance_weights(self, update_buffer, n_sequences):
+        """
+        Computes the action probabilities of the current policy, the proximal policy of the update, and the
+        clipped importance weights of the experiences of the update buffer, collected by an older policy.
+        :param update_buffer: The AgentBuffer of the experiences to update the model with.
+        :param n_sequences: Number of sequences evaluated per run.
+        :return: The mean of the importance weights.
+        """
+        run_list = [self.model.all_log_probs, self.model.log_probs, self.model.old_log_probs]
+        proximal_probs, log_weights = [], []
+        for start in range(0, len(update_buffer['actions']), n_sequences):
+            mini_batch = update_buffer.make_mini_batch(start, start + n_sequences)
+            all_log_probs, log_probs, old_log_probs = self.sess.run(
+                run_list, feed_dict=self.make_update_feed_dict(mini_batch))
+            proximal_probs.append(all_log_probs)
+            log_weights.append(log_probs - old_log_probs)
+        shape = update_buffer['action_probs'].data.shape
+        update_buffer['proximal_action_probs'].set(np.concatenate(proximal_probs).reshape(shape))
+        weights = np.minimum(np.exp(np.concatenate(log_weights)), self.max_importance_weight)
+        update_buffer['importance_weights'].set(weights.reshape(shape[:-1] + (1,)))
+        return weights.mean()
+
+    def _update_from_buffer(self, update_buffer):
+        """
+        Updates the model with the experiences of an update buffer and resets it.
+        :param update_buffer: The AgentBuffer of the experiences to update the model with.
+        :return: A dictionary of the training statistics of the update.
+        """
+        update_stats = {}
+        n_sequences = max(int(self.trainer_parameters['batch_size'] / self.sequence_length), 1)
+        advantages = update_buffer['advantages'].get_batch()
+        update_buffer['advantages'].set((advantages - advantages.mean()) / (advantages.std() + 1e-10))
+        if self.async_update:
+            update_stats['importance_weight'] = self.compute_importance_weights(update_buffer, n_sequences)
+        permutations = [np.random.permutation(len(update_buffer['actions']))
+                        for _ in range(self.trainer_parameters['num_epoch'])]
+        if self.data_parallel is None:
+            value_total, policy_total, forward_total, inverse_total = self.update_epochs(update_buffer,
+                                                                                         permutations)
+        else:
+            value_total, policy_total, forward_total, inverse_total = self.data_parallel.update(
+                self, update_buffer, permutations)
+        update_stats['value_loss'] = np.mean(value_total)
+        update_stats['policy_loss'] = np.mean(policy_total)
+        if self.use_curiosity:
+            update_stats['forward_loss'] = np.mean(forward_total)
+            update_stats['inverse_loss'] = np.mean(inverse_total)
+        update_buffer.reset_agent()
+        return update_stats
+
+    def update_epochs(self, update_buffer, permutations):
+        """
+        Runs the epochs of an update of the model, with the experiences of each epoch reordered by a permutation.
+        :param update_buffer: The AgentBuffer of the experiences to update the model with.
+        :param permutations: List of one permutation of the experiences per epoch.
+        :return: The lists of the value, policy, forward and inverse losses of the mini-batches.
         """
         n_sequences = max(int(self.trainer_parameters['batch_size'] / self.sequence_length), 1)
         value_total, policy_total, forward_total, inverse_total = [], [], [], []
-        advantages = self.training_buffer.update_buffer['advantages'].get_batch()
-        self.training_buffer.update_buffer['advantages'].set(
-            (advantages - advantages.mean()) / (advantages.std() + 1e-10))
-        num_epoch = self.trainer_parameters['num_epoch']
-        for k in range(num_epoch):
-            self.training_buffer.update_buffer.shuffle()
-            buffer = self.training_buffer.update_buffer
-            for l in range(len(self.training_buffer.update_buffer['actions']) // n_sequences):
+        for permutation in permutations:
+            update_buffer.shuffle(permutation=permutation)
+            for l in range(len(update_buffer['actions']) // n_sequences):
                 start = l * n_sequences
                 end = (l + 1) * n_sequences
-                feed_dict = {self.model.batch_size: n_sequences,
-                             self.model.sequence_length: self.sequence_length,
-                             self.model.mask_input: np.array(buffer['masks'][start:end]).flatten(),
-                             self.model.returns_holder: np.array(buffer['discounted_returns'][start:end]).flatten(),
-                             self.model.old_value: np.array(buffer['value_estimates'][start:end]).flatten(),
-                             self.model.advantage: np.array(buffer['advantages'][start:end]).reshape([-1, 1]),
-                             self.model.all_old_log_probs: np.array(buffer['action_probs'][start:end]).reshape(
-                                 [-1, sum(self.brain.vector_action_space_size)])}
-                if self.is_continuous_action:
-                    feed_dict[self.model.output_pre] = np.array(buffer['actions_pre'][start:end]).reshape(
-                        [-1, self.brain.vector_action_space_size[0]])
-                else:
-                    feed_dict[self.model.action_holder] = np.array(buffer['actions'][start:end]).reshape(
-                        [-1, len(self.brain.vector_action_space_size)])
-                    if self.use_recurrent:
-                        feed_dict[self.model.prev_action] = np.array(buffer['prev_action'][start:end]).reshape(
-                            [-1, len(self.brain.vector_action_space_size)])
-                if self.use_vector_obs:
-                    total_observation_length = self.brain.vector_observation_space_size * \
-                                               self.brain.num_stacked_vector_observations
-                    feed_dict[self.model.vector_in] = np.array(buffer['vector_obs'][start:end]).reshape(
-                        [-1, total_observation_length])
-                    if self.use_curiosity:
-                        feed_dict[self.model.next_vector_in] = np.array(buffer['next_vector_in'][start:end]) \
-                            .reshape([-1, total_observation_length])
-                if self.use_visual_obs:
-                    for i, _ in enumerate(self.model.visual_in):
-                        _obs = np.array(buffer['visual_obs%d' % i][start:end])
-                        if self.sequence_length > 1 and self.use_recurrent:
-                            (_batch, _seq, _w, _h, _c) = _obs.shape
-                            feed_dict[self.model.visual_in[i]] = _obs.reshape([-1, _w, _h, _c])
-                        else:
-                            feed_dict[self.model.visual_in[i]] = _obs
-                    if self.use_curiosity:
-                        for i, _ in enumerate(self.model.visual_in):
-                            _obs = np.array(buffer['next_visual_obs%d' % i][start:end])
-                            if self.sequence_length > 1 and self.use_recurrent:
-                                (_batch, _seq, _w, _h, _c) = _obs.shape
-                                feed_dict[self.model.next_visual_in[i]] = _obs.reshape([-1, _w, _h, _c])
-                            else:
-                                feed_dict[self.model.next_visual_in[i]] = _obs
-                if self.use_recurrent:
-                    mem_in = np.array(buffer['memory'][start:end])[:, 0, :]
-                    feed_dict[self.model.memory_in] = mem_in
-
-                run_list = [self.model.value_loss, self.model.policy_loss, self.model.update_batch]
+                mini_batch = update_buffer.make_mini_batch(start, end)
+                run_list = [self.model.value_loss, self.model.policy_loss]
                 if self.use_curiosity:
                     run_list.extend([self.model.forward_loss, self.model.inverse_loss])
-                values = self.sess.run(run_list, feed_dict=feed_dict)
+                if self.data_parallel is None:
+                    feed_dict = self.make_update_feed_dict(mini_batch, proximal=self.async_update)
+                    values = self.sess.run(run_list + [self.model.update_batch], feed_dict=feed_dict)
+                    run_out = dict(zip(run_list, values))
+                else:
+                    run_out = self.data_parallel.run_mini_batch(self, mini_batch, run_list)
                 self.has_updated = True
-                run_out = dict(zip(run_list, values))
                 value_total.append(run_out[self.model.value_loss])
                 policy_total.append(np.abs(run_out[self.model.policy_loss]))
                 if self.use_curiosity:
                     inverse_total.append(run_out[self.model.inverse_loss])
                     forward_total.append(run_out[self.model.forward_loss])
-        self.stats['value_loss'].append(np.mean(value_total))
-        self.stats['policy_loss'].append(np.mean(policy_total))
-        if self.use_curiosity:
-            self.stats['forward_loss'].append(np.mean(forward_total))
-            self.stats['inverse_loss'].append(np.mean(inverse_total))
-        self.training_buffer.reset_update_buffer()
+        return value_total, policy_total, forward_total, inverse_total
 
+    def close(self):
+        """
+        Stops the processes of the data-parallel learner, if any.
+        """
+        if self.data_parallel is not None:
+            self.data_parallel.close()
+            self.data_parallel = None
 
 def discount_rewards(r, gamma=0.99, value_next=0.0):
     """
@@ -540,3 +787,59 @@ def get_gae(rewards, value_estimates, value_next=0.0, gamma=0.99, lambd=0.95):
     delta_t = rewards + gamma * value_estimates[1:] - value_estimates[:-1]
     advantage = discount_rewards(r=delta_t, gamma=gamma * lambd)
     return advantage
+
+
+def discount_rewards_batch(r, gamma=0.99, value_next=0.0, block_size=64):
+    """
+    Computes discounted sums of future rewards of several trajectories at once. The time-steps are discounted
+    block_size at a time with a matrix product, each block being bootstrapped with the sum of the next one.
+    :param r: Array of rewards of shape (number of trajectories, T). Shorter trajectories are left padded.
+    :param gamma: Discount factor.
+    :param value_next: T+1 value estimate of every trajectory, as a scalar or an array.
+    :param block_size: Number of time-steps discounted together.
+    :return: discounted sums of future rewards as an array of the shape of r.
+    """
+    r = np.asarray(r, dtype=np.float64)
+    n_trajectories, length = r.shape
+    block_size = max(min(block_size, length), 1)
+    # discounts[t, k] is the discount of the reward at time-step k seen from time-step t <= k of a block
+    steps = np.arange(block_size)
+    exponents = steps[None, :] - steps[:, None]
+    discounts = np.where(exponents >= 0, gamma ** np.maximum(exponents, 0), 0.0)
+    next_block_discounts = gamma ** (block_size - steps).astype(np.float64)
+    discounted_r = np.empty_like(r)
+    running_add = np.broadcast_to(np.asarray(value_next, dtype=np.float64).reshape(-1), (n_trajectories,))
+    for end in range(length, 0, -block_size):
+        start = max(end - block_size, 0)
+        size = end - start
+        discounted_r[:, start:end] = r[:, start:end].dot(discounts[-size:, -size:].T) \
+            + running_add[:, None] * next_block_discounts[-size:]
+        running_add = discounted_r[:, start]
+    return discounted_r
+
+
+def get_gae_batch(rewards, value_estimates, value_next, gamma=0.99, lambd=0.95):
+    """
+    Computes generalized advantage estimates of several trajectories at once.
+    :param rewards: list of the arrays of rewards of every trajectory.
+    :param value_estimates: list of the arrays of value estimates of every trajectory.
+    :param value_next: list of the value estimates following the last time-step of every trajectory.
+    :param gamma: Discount factor.
+    :param lambd: GAE weighing factor.
+    :return: list of the arrays of advantage estimates of every trajectory.
+    """
+    if len(rewards) == 0:
+        return []
+    lengths = [len(r) for r in rewards]
+    length = max(lengths)
+    # The trajectories are right aligned, so that they all end at the last time-step. The padding before them
+    # does not change their advantages.
+    delta_t = np.zeros((len(rewards), length))
+    values = np.zeros((len(rewards), length + 1))
+    for i, (r, v) in enumerate(zip(rewards, value_estimates)):
+        delta_t[i, length - lengths[i]:] = r
+        values[i, length - lengths[i]:length] = v
+    values[:, length] = value_next
+    delta_t += gamma * values[:, 1:] - values[:, :-1]
+    advantages = discount_rewards_batch(delta_t, gamma=gamma * lambd)
+    return [advantages[i, length - lengths[i]:] for i in range(len(rewards))]
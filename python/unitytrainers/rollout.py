@@ -0,0 +1,346 @@
+# # Unity ML-Agents Toolkit
+# ## Rollout workers
+"""
+Worker processes each owning a Unity environment and a copy of the policy, deciding the actions of their agents
+and sending the experiences of the trainers to the learner, which broadcasts the policy back after its updates.
+"""
+
+import logging
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+import traceback
+import zlib
+from multiprocessing.connection import wait
+
+import tensorflow as tf
+
+from unityagents.exception import UnityEnvironmentException
+from unitytrainers.bc.trainer import BehavioralCloningTrainer
+from unitytrainers.ppo.trainer import PPOTrainer
+
+logger = logging.getLogger("unitytrainers")
+
+# Number of steps after which a worker sends its statistics and step count even if no experience is ready.
+MAX_STEPS_PER_MESSAGE = 100
+
+
+def _dumps(message):
+    return zlib.compress(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def _loads(data):
+    return pickle.loads(zlib.decompress(data))
+
+
+class PolicyVariables(object):
+    def __init__(self, variables=None):
+        """
+        Variables of the default graph the rollout workers need to decide actions: the trainable ones and the
+        statistics of the observation normalization.
+        :param variables: List of the variables to transfer instead.
+        """
+        normalization_names = ['running_mean', 'running_variance', 'normalization_steps']
+        if variables is None:
+            variables = tf.trainable_variables() + [
+                v for v in tf.global_variables() if v.op.name.split('/')[-1] in normalization_names]
+        self.variables = variables
+        self._values = [v.initializer.inputs[1] for v in self.variables]
+
+    def get(self, sess):
+        """
+        Returns the dictionary of the names of the variables to their values.
+        """
+        return dict(zip([v.op.name for v in self.variables], sess.run(self.variables)))
+
+    def set(self, sess, values):
+        """
+        Assigns the values returned by get, in a single run of the session.
+        """
+        sess.run([v.initializer for v in self.variables],
+                 feed_dict={value: values[v.op.name] for v, value in zip(self.variables, self._values)})
+
+
+class _CommandReceiver(threading.Thread):
+    def __init__(self, remote):
+        """
+        Thread of a rollout worker reading the commands of the learner as soon as they arrive, so that the learner
+        is never blocked sending a policy while the worker is sending experiences. Only the last policy is kept.
+        """
+        super(_CommandReceiver, self).__init__()
+        self.daemon = True
+        self.remote = remote
+        self.closed = False
+        self._policy = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        try:
+            while True:
+                command, payload = _loads(self.remote.recv_bytes())
+                if command == 'close':
+                    break
+                with self._lock:
+                    self._policy = payload
+        except (EOFError, OSError):
+            pass
+        self.closed = True
+
+    def pop_policy(self):
+        """
+        Returns the last policy received since the previous call, or None.
+        """
+        with self._lock:
+            policy, self._policy = self._policy, None
+        return policy
+
+
+def _rollout_worker(experience_remote, command_remote, env_factory, worker_index):
+    """
+    Main loop of a rollout worker process. It creates the trainers of the learner, without training them,
+    decides the actions of the agents of its environment with the last policy received and sends the
+    experiences ready for an update to the learner.
+    """
+    env = None
+    try:
+        env = env_factory(worker_index)
+        experience_remote.send_bytes(_dumps(('parameters', {
+            'brains': env.brains,
+            'brain_names': env.brain_names,
+            'external_brain_names': env.external_brain_names,
+            'academy_name': env.academy_name,
+            'log_path': env.logfile_path,
+            'reset_parameters': env._resetParameters
+        })))
+        command, start = _loads(command_remote.recv_bytes())
+        if command == 'close':
+            return
+        receiver = _CommandReceiver(command_remote)
+        receiver.start()
+        tf.reset_default_graph()
+        with tf.Session() as sess, tempfile.TemporaryDirectory() as summary_dir:
+            trainers = {}
+            for brain_name in env.external_brain_names:
+                trainer_parameters = dict(start['trainer_parameters'][brain_name],
+                                          summary_path=os.path.join(summary_dir, str(len(trainers))))
+                if trainer_parameters['trainer'] == 'imitation':
+                    trainer_class = BehavioralCloningTrainer
+                else:
+                    trainer_class = PPOTrainer
+                trainers[brain_name] = trainer_class(sess, env, brain_name, trainer_parameters, False,
+                                                     start['seed'] + worker_index, start['run_id'])
+            policy_variables = PolicyVariables()
+            sess.run(tf.global_variables_initializer())
+            policy = None
+            while policy is None and not receiver.closed:
+                receiver.join(0.01)
+                policy = receiver.pop_policy()
+            steps = 0
+            config = None
+            curr_info = None
+            while not receiver.closed:
+                if policy is not None:
+                    policy_variables.set(sess, policy['variables'])
+                    for brain_name, trainer in trainers.items():
+                        trainer.step = policy['steps'][brain_name]
+                        if policy['has_updated'][brain_name]:
+                            trainer.has_updated = True
+                    config = policy['config']
+                if curr_info is None or env.global_done:
+                    curr_info = env.reset(config=config, train_mode=start['train_mode'])
+                    for trainer in trainers.values():
+                        trainer.end_episode()
+                vector_action, memory, text_action, value, outputs = {}, {}, {}, {}, {}
+                for brain_name, trainer in trainers.items():
+                    (vector_action[brain_name], memory[brain_name], text_action[brain_name], value[brain_name],
+                     outputs[brain_name]) = trainer.take_action(curr_info)
+                new_info = env.step(vector_action=vector_action, memory=memory, text_action=text_action,
+                                    value=value)
+                for brain_name, trainer in trainers.items():
+                    trainer.add_experiences(curr_info, new_info, outputs[brain_name])
+                    trainer.process_experiences(curr_info, new_info)
+                curr_info = new_info
+                steps += 1
+                ready = any([len(field) > 0 for trainer in trainers.values()
+                             for field in trainer.training_buffer.update_buffer.values()])
+                if ready or steps >= MAX_STEPS_PER_MESSAGE:
+                    experiences = {}
+                    for brain_name, trainer in trainers.items():
+                        update_buffer = trainer.training_buffer.update_buffer
+                        experiences[brain_name] = (
+                            {key: field.data for key, field in update_buffer.items() if len(field) > 0},
+                            {key: values for key, values in trainer.stats.items() if len(values) > 0})
+                    experience_remote.send_bytes(_dumps(('experiences', (experiences, steps))))
+                    for trainer in trainers.values():
+                        trainer.training_buffer.reset_update_buffer()
+                        for key in trainer.stats:
+                            trainer.stats[key] = []
+                    steps = 0
+                policy = receiver.pop_policy()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        try:
+            try:
+                message = _dumps(('error', e))
+                _loads(message)
+            except Exception:
+                # The learner still receives the traceback of an error which cannot be pickled.
+                message = _dumps(('error', UnityEnvironmentException(traceback.format_exc())))
+            experience_remote.send_bytes(message)
+        except (BrokenPipeError, EOFError):
+            pass
+    finally:
+        if env is not None:
+            env.close()
+        experience_remote.close()
+        command_remote.close()
+
+
+class RolloutWorkers(object):
+    def __init__(self, env_factory, n_workers=1):
+        """
+        Launches n_workers rollout worker processes, each running the environment returned by env_factory.
+        The experiences are received from the workers through local pipes, and the policy is broadcast to them
+        through other pipes. Exposes the brains of the environment like a UnityEnvironment.
+
+        :param env_factory: Function taking the index of a worker and returning the UnityEnvironment it must run.
+        Must be picklable.
+        :int n_workers: Number of worker processes to launch.
+        """
+        if n_workers < 1:
+            raise UnityEnvironmentException("The number of rollout workers must be at least 1.")
+        self.n_workers = n_workers
+        self._experience_remotes = []
+        self._command_remotes = []
+        self._processes = []
+        # The workers are spawned rather than forked since they run TensorFlow, which does not support being
+        # forked once imported.
+        context = multiprocessing.get_context('spawn')
+        for worker_index in range(n_workers):
+            experience_remote, worker_experience_remote = context.Pipe(duplex=False)
+            worker_command_remote, command_remote = context.Pipe(duplex=False)
+            process = context.Process(target=_rollout_worker, args=(
+                worker_experience_remote, worker_command_remote, env_factory, worker_index))
+            process.daemon = True
+            process.start()
+            worker_experience_remote.close()
+            worker_command_remote.close()
+            self._experience_remotes.append(experience_remote)
+            self._command_remotes.append(command_remote)
+            self._processes.append(process)
+        self._loaded = True
+
+        parameters = [self._receive(remote, 'parameters') for remote in self._experience_remotes][0]
+        self._brains = parameters['brains']
+        self._brain_names = parameters['brain_names']
+        self._external_brain_names = parameters['external_brain_names']
+        self._academy_name = parameters['academy_name']
+        self._log_path = parameters['log_path']
+        self._resetParameters = parameters['reset_parameters']
+        logger.info("\n'{0}' started successfully in {1} rollout workers!".format(self._academy_name, n_workers))
+
+    @property
+    def logfile_path(self):
+        return self._log_path
+
+    @property
+    def brains(self):
+        return self._brains
+
+    @property
+    def academy_name(self):
+        return self._academy_name
+
+    @property
+    def number_brains(self):
+        return len(self._brain_names)
+
+    @property
+    def number_external_brains(self):
+        return len(self._external_brain_names)
+
+    @property
+    def brain_names(self):
+        return self._brain_names
+
+    @property
+    def external_brain_names(self):
+        return self._external_brain_names
+
+    @staticmethod
+    def _receive(remote, expected_command):
+        try:
+            command, payload = _loads(remote.recv_bytes())
+        except EOFError:
+            raise UnityEnvironmentException("A rollout worker process exited unexpectedly.")
+        if command == 'error':
+            raise payload
+        if command != expected_command:
+            raise UnityEnvironmentException("A rollout worker sent '{0}' instead of '{1}'."
+                                            .format(command, expected_command))
+        return payload
+
+    def _send_all(self, command, payload):
+        data = _dumps((command, payload))
+        for remote in self._command_remotes:
+            remote.send_bytes(data)
+
+    def start(self, trainer_parameters, train_mode, run_id, seed):
+        """
+        Makes the workers create their trainers. They start collecting experiences once they receive a policy.
+        :param trainer_parameters: Dictionary of brain names to the parameters of their trainer.
+        :param train_mode: Whether to run the environments in training mode.
+        :param run_id: The sub-directory name for model and summary statistics.
+        :param seed: Random seed of the first worker, the following workers use the next ones.
+        """
+        self._send_all('start', {'trainer_parameters': trainer_parameters, 'train_mode': train_mode,
+                                 'run_id': run_id, 'seed': seed})
+
+    def broadcast(self, variables, steps, has_updated, config=None):
+        """
+        Sends a policy to all the workers, which use it from their next step.
+        :param variables: Values of the PolicyVariables of the learner.
+        :param steps: Dictionary of brain names to the step count of their trainer.
+        :param has_updated: Dictionary of brain names to whether the model of their trainer was updated.
+        :param config: Reset parameters of the environments at their next reset.
+        """
+        self._send_all('policy', {'variables': variables, 'steps': steps, 'has_updated': has_updated,
+                                  'config': config})
+
+    def receive(self):
+        """
+        Waits for at least one of the workers to send experiences.
+        :return: A list of one tuple per message received, containing the dictionary of brain names to the fields of
+                 the update buffer and the statistics of their trainer, and the number of steps they were collected in.
+        """
+        ready = wait(self._experience_remotes)
+        return [self._receive(remote, 'experiences') for remote in ready]
+
+    def close(self):
+        """
+        Stops the workers and their environments.
+        """
+        if not self._loaded:
+            raise UnityEnvironmentException("No Unity environment is loaded.")
+        self._loaded = False
+        for remote in self._command_remotes:
+            try:
+                remote.send_bytes(_dumps(('close', None)))
+            except (BrokenPipeError, EOFError):
+                pass
+        for remote, process in zip(self._experience_remotes, self._processes):
+            # The worker may be blocked sending experiences that must be read for it to stop.
+            while process.is_alive():
+                try:
+                    if remote.poll(0.1):
+                        remote.recv_bytes()
+                except (EOFError, OSError):
+                    process.join(timeout=10)
+                    break
+            if process.is_alive():
+                process.terminate()
+        for remote in self._experience_remotes + self._command_remotes:
+            remote.close()
@@ -83,6 +83,40 @@ class Trainer(object):
         """
         raise UnityTrainerException("The increment_step_and_update_last_reward method was not implemented.")
 
+    def save_step_to_graph(self):
+        """
+        Writes the step count and the last reward of the trainer to the variables of its model.
+        Called before the model is saved.
+        """
+        raise UnityTrainerException("The save_step_to_graph method was not implemented.")
+
+    def load_step_from_graph(self):
+        """
+        Reads the step count and the last reward of the trainer from the variables of its model.
+        Called after the model is restored.
+        """
+        raise UnityTrainerException("The load_step_from_graph method was not implemented.")
+
+    def prepare_action(self, all_brain_info: AllBrainInfo):
+        """
+        Creates the run of the session deciding the actions given state/observation information. The runs of
+        several trainers sharing a session can be merged into a single one.
+        :param all_brain_info: A dictionary of brain names and BrainInfo from environment.
+        :return: a tuple containing the feed dict and the list of tensors of the run, or None if
+        there is no agent to decide the actions of
+        """
+        raise UnityTrainerException("The prepare_action method was not implemented.")
+
+    def complete_action(self, all_brain_info: AllBrainInfo, run_out):
+        """
+        Decides actions from the outputs of the run created by prepare_action.
+        :param all_brain_info: A dictionary of brain names and BrainInfo from environment.
+        :param run_out: A dictionary of the tensors of the run to their value.
+        :return: a tuple containing action, memories, values and an object
+        to be passed to add experiences
+        """
+        raise UnityTrainerException("The complete_action method was not implemented.")
+
     def take_action(self, all_brain_info: AllBrainInfo):
         """
         Decides actions given state/observation information, and takes them in environment.
@@ -90,7 +124,12 @@ class Trainer(object):
         :return: a tuple containing action, memories, values and an object
         to be passed to add experiences
         """
-        raise UnityTrainerException("The take_action method was not implemented.")
+        run = self.prepare_action(all_brain_info)
+        if run is None:
+            return [], [], [], None, None
+        feed_dict, run_list = run
+        values = self.sess.run(run_list, feed_dict=feed_dict)
+        return self.complete_action(all_brain_info, dict(zip(run_list, values)))
 
     def add_experiences(self, curr_info: AllBrainInfo, next_info: AllBrainInfo, take_action_outputs):
         """
@@ -130,6 +169,31 @@ class Trainer(object):
         """
         raise UnityTrainerException("The update_model method was not implemented.")
 
+    def add_update_experiences(self, fields, stats):
+        """
+        Adds experiences ready for an update, collected by a rollout worker, to the update buffer.
+        :param fields: Dictionary of the fields of the update buffer of the worker to their elements.
+        :param stats: Dictionary of the training statistics of the worker.
+        """
+        for key, data in fields.items():
+            self.training_buffer.update_buffer[key].extend(data)
+        for key, values in stats.items():
+            if key in self.stats:
+                self.stats[key].extend(values)
+
+    def wait_update(self):
+        """
+        Waits for the update of the model running in the background, if any, to be over.
+        Called before the model is saved.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases the resources of the trainer. Called at the end of the training.
+        """
+        pass
+
     def write_summary(self, global_step, lesson_num=0):
         """
         Saves training statistics to Tensorboard.
@@ -155,6 +219,7 @@ class Trainer(object):
             summary.value.add(tag='Info/Lesson', simple_value=lesson_num)
             self.summary_writer.add_summary(summary, self.get_step)
             self.summary_writer.flush()
+            self.save_step_to_graph()
 
     def write_tensorboard_text(self, key, input_dict):
         """
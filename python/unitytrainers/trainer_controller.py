@@ -4,6 +4,8 @@
 
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import yaml
 import re
@@ -11,10 +13,13 @@ import numpy as np
 import tensorflow as tf
 from tensorflow.python.tools import freeze_graph
 from unityagents.environment import UnityEnvironment
+from unityagents.vec_environment import UnityVecEnvironment, launch_unity_environment
 from unityagents.exception import UnityEnvironmentException
 
 from unitytrainers.ppo.trainer import PPOTrainer
 from unitytrainers.bc.trainer import BehavioralCloningTrainer
+from unitytrainers.inference import InferenceEngine
+from unitytrainers.rollout import RolloutWorkers, PolicyVariables
 from unitytrainers.meta_curriculum import MetaCurriculum
 from unitytrainers.exception import MetaCurriculumError
 
@@ -23,7 +28,8 @@ class TrainerController(object):
     def __init__(self, env_path, run_id, save_freq, curriculum_folder,
                  fast_simulation, load, train, worker_id, keep_checkpoints,
                  lesson, seed, docker_target_name, trainer_config_path,
-                 no_graphics):
+                 no_graphics, num_envs=1, env_factory=None, pipeline=False,
+                 num_workers=0):
         """
         :param env_path: Location to the environment executable to be loaded.
         :param run_id: The sub-directory name for model and summary statistics
@@ -44,6 +50,18 @@ class TrainerController(object):
                configuration file.
         :param no_graphics: Whether to run the Unity simulator in no-graphics
                             mode.
+        :param num_envs: Number of Unity environments to launch in parallel
+               on consecutive worker ids.
+        :param env_factory: Function taking the index of an environment and
+               returning it, used instead of launching env_path. For instance
+               a partial of launch_simulated_environment.
+        :param pipeline: Whether to split the environments in two groups and
+               decide the actions of one group while the other simulates,
+               the experiences being processed by a worker thread.
+        :param num_workers: Number of rollout worker processes, each running
+               an environment and a copy of the policy, collecting the
+               experiences the models are updated with. 0 to collect them in
+               this process.
         """
         self.trainer_config_path = trainer_config_path
 
@@ -88,15 +106,23 @@ class TrainerController(object):
         self.worker_id = worker_id
         self.keep_checkpoints = keep_checkpoints
         self.trainers = {}
+        self.global_step = 0
         self.seed = seed
+        self.num_envs = num_envs
+        self.pipeline = pipeline
+        self.num_workers = num_workers
+        if self.pipeline and self.num_envs < 2:
+            raise UnityEnvironmentException('The pipelined mode needs at '
+                                            'least two environments.')
+        if self.num_workers > 0 and (self.num_envs > 1 or self.pipeline):
+            raise UnityEnvironmentException('Each rollout worker runs a '
+                                            'single environment.')
         np.random.seed(self.seed)
         tf.set_random_seed(self.seed)
-        self.env = UnityEnvironment(file_name=env_path,
-                                    worker_id=self.worker_id,
-                                    seed=self.seed,
-                                    docker_training=self.docker_training,
-                                    no_graphics=no_graphics)
-        if env_path is None:
+        self.env = self._create_environment(env_path, no_graphics, env_factory)
+        if env_factory is not None:
+            self.env_name = self.env.academy_name
+        elif env_path is None:
             self.env_name = 'editor_'+self.env.academy_name
         else:
             # Extract out name of environment
@@ -120,6 +146,42 @@ class TrainerController(object):
                                               'name as the Brain '
                                               'whose curriculum it defines.')
 
+    def _create_environment(self, env_path, no_graphics, env_factory=None):
+        """
+        Launches the environment(s) the trainers will collect experiences from.
+        :param env_path: Location to the environment executable to be loaded.
+        :param no_graphics: Whether to run the Unity simulator in no-graphics
+                            mode.
+        :param env_factory: Function taking the index of an environment and
+               returning it, used instead of launching env_path.
+        :return: A UnityEnvironment, a UnityVecEnvironment when more than
+                 one environment is requested, or RolloutWorkers when
+                 rollout workers are requested.
+        """
+        if env_factory is not None:
+            if self.num_workers > 0:
+                return RolloutWorkers(env_factory, self.num_workers)
+            if self.num_envs > 1:
+                return UnityVecEnvironment(env_factory, self.num_envs)
+            return env_factory(0)
+        if self.num_envs > 1 or self.num_workers > 0:
+            if env_path is None:
+                raise UnityEnvironmentException('It is not possible to launch '
+                                                'more than one environment '
+                                                'when training from the '
+                                                'editor.')
+            env_factory = partial(launch_unity_environment, env_path,
+                                  self.worker_id, 5005, self.seed,
+                                  self.docker_training, no_graphics)
+            if self.num_workers > 0:
+                return RolloutWorkers(env_factory, self.num_workers)
+            return UnityVecEnvironment(env_factory, self.num_envs)
+        return UnityEnvironment(file_name=env_path,
+                                worker_id=self.worker_id,
+                                seed=self.seed,
+                                docker_training=self.docker_training,
+                                no_graphics=no_graphics)
+
     def _get_progresses(self):
         if self.meta_curriculum:
             brain_names_to_progresses = {}
@@ -170,12 +232,80 @@ class TrainerController(object):
         :param steps: Current number of steps in training process.
         :param saver: Tensorflow saver for session.
         """
+        for trainer in self.trainers.values():
+            # The checkpoint must not mix the weights of before and after an
+            # asynchronous update.
+            trainer.wait_update()
+            trainer.save_step_to_graph()
         last_checkpoint = self.model_path + '/model-' + str(steps) + '.cptk'
         saver.save(sess, last_checkpoint)
         tf.train.write_graph(sess.graph_def, self.model_path,
                              'raw_graph_def.pb', as_text=False)
         self.logger.info("Saved Model")
 
+    def _restore_model(self, sess, checkpoint_path):
+        """
+        Restores the variables saved in a checkpoint, the ones added to the
+        models since it was written being initialized.
+        :param sess: Current Tensorflow session.
+        :param checkpoint_path: Path of the checkpoint to restore.
+        """
+        saved_names = set(name for name, _ in
+                          tf.train.list_variables(checkpoint_path))
+        saved, missing = [], []
+        for variable in tf.global_variables():
+            if variable.op.name in saved_names:
+                saved.append(variable)
+            else:
+                missing.append(variable)
+        if missing:
+            self.logger.info('The checkpoint {0} has none of the variables '
+                             '{1}, which are initialized.'
+                             .format(checkpoint_path,
+                                     ', '.join(v.op.name for v in missing)))
+            sess.run(tf.variables_initializer(missing))
+        tf.train.Saver(saved).restore(sess, checkpoint_path)
+
+    def _graph_path(self):
+        """
+        Returns the path of the .bytes file the model is exported to.
+        """
+        return (self.model_path + '/' + self.env_name + "_" + self.run_id
+                + '.bytes')
+
+    def _is_graph_up_to_date(self):
+        """
+        Returns whether the exported graph exists and is not older than the
+        latest checkpoint of the model, so that it can be run instead of the
+        trainers loading the model.
+        """
+        if not os.path.isfile(self._graph_path()):
+            return False
+        ckpt = tf.train.get_checkpoint_state(self.model_path)
+        if ckpt is None:
+            return True
+        checkpoint_path = ckpt.model_checkpoint_path
+        # The checkpoints of the V2 format are split in several files.
+        if os.path.isfile(checkpoint_path + '.index'):
+            checkpoint_path += '.index'
+        if not os.path.isfile(checkpoint_path) or \
+           os.path.getmtime(checkpoint_path) <= \
+           os.path.getmtime(self._graph_path()):
+            return True
+        self.logger.info('The checkpoint {0} is more recent than the exported '
+                         'graph {1}, the model is loaded by the trainers.'
+                         .format(checkpoint_path, self._graph_path()))
+        return False
+
+    def _graph_scope(self, brain_name):
+        """
+        Returns the scope of the model of a brain, empty when there is a
+        single external brain.
+        """
+        if len(self.env.external_brain_names) > 1:
+            return re.sub('[^0-9a-zA-Z]+', '-', brain_name)
+        return ''
+
     def _export_graph(self):
         """
         Exports latest saved model to .bytes format for Unity embedding.
@@ -187,8 +317,7 @@ class TrainerController(object):
             input_binary=True,
             input_checkpoint=ckpt.model_checkpoint_path,
             output_node_names=target_nodes,
-            output_graph=(self.model_path + '/' + self.env_name + "_"
-                + self.run_id + '.bytes'),
+            output_graph=self._graph_path(),
             clear_devices=True, initializer_nodes="", input_saver="",
             restore_op_name="save/restore_all",
             filename_tensor_name="save/Const:0")
@@ -200,7 +329,7 @@ class TrainerController(object):
         for brain_name in self.env.external_brain_names:
             trainer_parameters = trainer_config['default'].copy()
             if len(self.env.external_brain_names) > 1:
-                graph_scope = re.sub('[^0-9a-zA-Z]+', '-', brain_name)
+                graph_scope = self._graph_scope(brain_name)
                 trainer_parameters['graph_scope'] = graph_scope
                 trainer_parameters['summary_path'] = '{basedir}/{name}'.format(
                     basedir=self.summaries_dir,
@@ -261,26 +390,381 @@ class TrainerController(object):
                                             'permissions are set correctly.'
                                             .format(model_path))
 
-    def _increment_lessons_and_reset_env(self):
+    def _increment_lessons_and_reset_env(self, groups=None):
         """Increments the lessons of curriculums if there is a metacurriculum
         and resets the environment.
 
+        Args:
+            groups: Lists of the indices of the environments of each group
+                    in the pipelined mode, None otherwise.
+
         Returns:
             A Data structure corresponding to the initial reset state of the
-            environment.
+            environment, or a list of them, one per group.
+        """
+        config = None
+        if self.meta_curriculum is not None:
+            self.meta_curriculum.increment_lessons(self._get_progresses())
+            config = self.meta_curriculum.get_config()
+        if groups is None:
+            return self.env.reset(config=config,
+                                  train_mode=self.fast_simulation)
+        return [self.env.reset(config=config, train_mode=self.fast_simulation,
+                               workers=group)
+                for group in groups]
+
+    def _broadcast_policy(self, sess, policy_variables):
         """
+        Sends the current policy to the rollout workers, along with the reset
+        parameters of the curriculums after incrementing their lessons.
+        :param sess: Current Tensorflow session.
+        :param policy_variables: PolicyVariables of the trainers.
+        """
+        config = None
         if self.meta_curriculum is not None:
             self.meta_curriculum.increment_lessons(self._get_progresses())
-            return self.env.reset(config=self.meta_curriculum.get_config(),
+            config = self.meta_curriculum.get_config()
+        self.env.broadcast(
+            policy_variables.get(sess),
+            {brain_name: trainer.get_step
+             for brain_name, trainer in self.trainers.items()},
+            {brain_name: getattr(trainer, 'has_updated', False)
+             for brain_name, trainer in self.trainers.items()},
+            config)
+
+    def _take_action(self, sess, curr_info):
+        """
+        Decides the actions of all the trainers given the current state, in
+        a single run of the session merging the runs of the trainers.
+        :param sess: The session shared by the trainers.
+        :param curr_info: Current AllBrainInfo.
+        :return: A tuple of dictionaries, indexed by brain name, of the
+                 vector actions, memories, text actions, values and the
+                 outputs of the take_action method of each trainer.
+        """
+        take_action_vector, \
+        take_action_memories, \
+        take_action_text, \
+        take_action_value, \
+        take_action_outputs \
+            = {}, {}, {}, {}, {}
+        feed_dict, run_list = {}, []
+        for brain_name, trainer in self.trainers.items():
+            run = trainer.prepare_action(curr_info)
+            if run is None:
+                (take_action_vector[brain_name],
+                 take_action_memories[brain_name],
+                 take_action_text[brain_name],
+                 take_action_value[brain_name],
+                 take_action_outputs[brain_name]) = [], [], [], None, None
+            else:
+                feed_dict.update(run[0])
+                run_list.extend(run[1])
+        if run_list:
+            run_out = dict(zip(run_list, sess.run(run_list,
+                                                  feed_dict=feed_dict)))
+            for brain_name, trainer in self.trainers.items():
+                if brain_name not in take_action_vector:
+                    (take_action_vector[brain_name],
+                     take_action_memories[brain_name],
+                     take_action_text[brain_name],
+                     take_action_value[brain_name],
+                     take_action_outputs[brain_name]) = \
+                        trainer.complete_action(curr_info, run_out)
+        return take_action_vector, take_action_memories, take_action_text, \
+            take_action_value, take_action_outputs
+
+    def _process_step(self, sess, saver, curr_info, new_info,
+                      take_action_outputs):
+        """
+        Adds the experiences of a step to the trainers, updates their models
+        when they are ready and saves the model when needed.
+        :param sess: Current Tensorflow session.
+        :param saver: Tensorflow saver for session.
+        :param curr_info: AllBrainInfo the actions were taken from.
+        :param new_info: AllBrainInfo resulting from the actions.
+        :param take_action_outputs: Outputs of the take_action method of
+               each trainer.
+        """
+        self._process_experiences(curr_info, new_info, take_action_outputs)
+        self._end_step(sess, saver)
+
+    def _process_experiences(self, curr_info, new_info, take_action_outputs):
+        """
+        Adds the experiences of a step to the trainers and updates their
+        models when they are ready.
+        :param curr_info: AllBrainInfo the actions were taken from.
+        :param new_info: AllBrainInfo resulting from the actions.
+        :param take_action_outputs: Outputs of the take_action method of
+               each trainer.
+        """
+        for brain_name, trainer in self.trainers.items():
+            trainer.add_experiences(curr_info, new_info,
+                                    take_action_outputs[brain_name])
+            trainer.process_experiences(curr_info, new_info)
+            if trainer.is_ready_update() and self.train_model \
+               and trainer.get_step <= trainer.get_max_steps:
+                # Perform gradient descent with experience buffer
+                trainer.update_model()
+
+    def _end_step(self, sess, saver):
+        """
+        Writes the training statistics of the trainers, increments their step
+        and saves the model when needed.
+        :param sess: Current Tensorflow session.
+        :param saver: Tensorflow saver for session.
+        """
+        for brain_name, trainer in self.trainers.items():
+            # Write training statistics to Tensorboard.
+            if self.meta_curriculum is not None:
+                trainer.write_summary(
+                    self.global_step,
+                    lesson_num=self.meta_curriculum
+                               .brains_to_curriculums[brain_name]
+                               .lesson_num)
+            else:
+                trainer.write_summary(self.global_step)
+            if self.train_model \
+               and trainer.get_step <= trainer.get_max_steps:
+                trainer.increment_step_and_update_last_reward()
+        if self.train_model:
+            self.global_step += 1
+        if self.global_step % self.save_freq == 0 and self.global_step != 0 \
+           and self.train_model:
+            # Save Tensorflow model
+            self._save_model(sess, steps=self.global_step, saver=saver)
+
+    def _keep_learning(self):
+        """
+        Returns whether a trainer has not reached its maximum number of steps
+        yet, always when the models are not trained.
+        """
+        return any([t.get_step <= t.get_max_steps
+                    for t in self.trainers.values()]) \
+            or not self.train_model
+
+    def _reset_episode(self, groups=None):
+        """
+        Resets the environment once it is done, and ends the episode of the
+        trainers.
+        :param groups: Lists of the indices of the environments of each group
+               in the pipelined mode, None otherwise.
+        :return: The AllBrainInfo of the reset, or a list of them, one per
+                 group.
+        """
+        curr_info = self._increment_lessons_and_reset_env(groups)
+        for trainer in self.trainers.values():
+            trainer.end_episode()
+        return curr_info
+
+    def _run_inference(self):
+        """
+        Runs the models of the exported graph in the environment, without
+        building the training graph nor storing the experiences.
+        """
+        engine = InferenceEngine(
+            self._graph_path(),
+            {brain_name: self.env.brains[brain_name]
+             for brain_name in self.env.external_brain_names},
+            {brain_name: self._graph_scope(brain_name)
+             for brain_name in self.env.external_brain_names})
+        config = None
+        if self.meta_curriculum is not None:
+            config = self.meta_curriculum.get_config()
+        try:
+            curr_info = self.env.reset(config=config,
                                        train_mode=self.fast_simulation)
-        else:
-            return self.env.reset(train_mode=self.fast_simulation)
+            while True:
+                if self.env.global_done:
+                    curr_info = self.env.reset(
+                        config=config, train_mode=self.fast_simulation)
+                vector_action, memory, text_action, value = \
+                    engine.decide_actions(curr_info)
+                curr_info = self.env.step(vector_action=vector_action,
+                                          memory=memory,
+                                          text_action=text_action,
+                                          value=value)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            engine.close()
+            self.env.close()
+
+    def _learn_with_workers(self, sess, saver):
+        """
+        Trains the models with the experiences of the rollout workers, which
+        keep collecting them while the models are updated, and receive the
+        policies after each update.
+        :param sess: Current Tensorflow session.
+        :param saver: Tensorflow saver for session.
+        """
+        policy_variables = PolicyVariables()
+        self.env.start({brain_name: trainer.parameters
+                        for brain_name, trainer in self.trainers.items()},
+                       self.fast_simulation, self.run_id, self.seed)
+        self._broadcast_policy(sess, policy_variables)
+        while self._keep_learning():
+            updated = False
+            for experiences, steps in self.env.receive():
+                for brain_name, trainer in self.trainers.items():
+                    trainer.add_update_experiences(*experiences[brain_name])
+                for _ in range(steps):
+                    self._end_step(sess, saver)
+                for brain_name, trainer in self.trainers.items():
+                    if trainer.is_ready_update() and self.train_model \
+                       and trainer.get_step <= trainer.get_max_steps:
+                        trainer.update_model()
+                        updated = True
+            if updated:
+                # The asynchronous updates must be over for the workers to
+                # receive the updated policy.
+                for trainer in self.trainers.values():
+                    trainer.wait_update()
+                self._broadcast_policy(sess, policy_variables)
+
+    def _learn_pipelined(self, sess, saver):
+        """
+        Trains the models deciding the actions of a group of environments
+        while the other group simulates, the experiences of a step being
+        processed by a worker thread meanwhile. The trainers step once both
+        groups have stepped, as they step once all the environments have in
+        the sequential mode. The intrinsic rewards of the curiosity are not
+        computed with the actions, whose consecutive runs are for the agents
+        of different groups.
+        :param sess: Current Tensorflow session.
+        :param saver: Tensorflow saver for session.
+        """
+        groups = [list(range(self.num_envs))[i::2] for i in range(2)]
+        curr_info = self._increment_lessons_and_reset_env(groups)
+        take_action_outputs = [None, None]
+        stepping = [False, False]
+        group = 0
+        group_steps = 0
+        processing = None
+        # Leaving the executor waits for the processing of the last step,
+        # including when the training is interrupted.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            while self._keep_learning():
+                pending_steps = []
+                if stepping[group]:
+                    new_info = self.env.step_wait(workers=groups[group])
+                    stepping[group] = False
+                    pending_steps.append((curr_info[group], new_info,
+                                          take_action_outputs[group]))
+                    curr_info[group] = new_info
+                if self.env.global_done:
+                    # All the environments are reset, as in the sequential
+                    # mode.
+                    other = 1 - group
+                    if stepping[other]:
+                        new_info = self.env.step_wait(workers=groups[other])
+                        stepping[other] = False
+                        pending_steps.append((curr_info[other], new_info,
+                                              take_action_outputs[other]))
+                    if processing is not None:
+                        processing.result()
+                        processing = None
+                        group_steps = self._end_group_step(sess, saver,
+                                                           group_steps)
+                    for pending_step in pending_steps:
+                        self._process_experiences(*pending_step)
+                        group_steps = self._end_group_step(sess, saver,
+                                                           group_steps)
+                    curr_info = self._reset_episode(groups)
+                    group = 0
+                    continue
+                take_action_vector, \
+                take_action_memories, \
+                take_action_text, \
+                take_action_value, \
+                take_action_outputs[group] = \
+                    self._take_action(sess, curr_info[group])
+                self.env.step_async(vector_action=take_action_vector,
+                                    memory=take_action_memories,
+                                    text_action=take_action_text,
+                                    value=take_action_value,
+                                    workers=groups[group])
+                stepping[group] = True
+                for pending_step in pending_steps:
+                    if processing is not None:
+                        processing.result()
+                        group_steps = self._end_group_step(sess, saver,
+                                                           group_steps)
+                    # The statistics are written by this thread, which also
+                    # adds those of the actions to them.
+                    processing = executor.submit(self._process_experiences,
+                                                 *pending_step)
+                group = 1 - group
+            if processing is not None:
+                processing.result()
+                group_steps = self._end_group_step(sess, saver, group_steps)
+        for group in range(2):
+            if stepping[group]:
+                new_info = self.env.step_wait(workers=groups[group])
+                self._process_experiences(curr_info[group], new_info,
+                                          take_action_outputs[group])
+                group_steps = self._end_group_step(sess, saver, group_steps)
+
+    def _end_group_step(self, sess, saver, group_steps):
+        """
+        Ends the step of a group of environments in the pipelined mode, and
+        the step of the trainers every other group step.
+        :param sess: Current Tensorflow session.
+        :param saver: Tensorflow saver for session.
+        :param group_steps: Number of group steps ended so far.
+        :return: The updated number of group steps.
+        """
+        group_steps += 1
+        if group_steps % 2 == 0:
+            self._end_step(sess, saver)
+        return group_steps
+
+    def _learn_sequential(self, sess, saver):
+        """
+        Trains the models processing the experiences of a step while the
+        environment simulates the following step.
+        :param sess: Current Tensorflow session.
+        :param saver: Tensorflow saver for session.
+        """
+        curr_info = self._increment_lessons_and_reset_env()
+        pending_step = None
+        while self._keep_learning():
+            if self.env.global_done:
+                if pending_step is not None:
+                    self._process_step(sess, saver, *pending_step)
+                    pending_step = None
+                curr_info = self._reset_episode()
+            # Decide and take an action
+            take_action_vector, \
+            take_action_memories, \
+            take_action_text, \
+            take_action_value, \
+            take_action_outputs = self._take_action(sess, curr_info)
+            self.env.step_async(vector_action=take_action_vector,
+                                memory=take_action_memories,
+                                text_action=take_action_text,
+                                value=take_action_value)
+            if pending_step is not None:
+                self._process_step(sess, saver, *pending_step)
+            new_info = self.env.step_wait()
+            pending_step = (curr_info, new_info, take_action_outputs)
+            curr_info = new_info
+        if pending_step is not None:
+            self._process_step(sess, saver, *pending_step)
 
     def start_learning(self):
         # TODO: Should be able to start learning at different lesson numbers
         # for each curriculum.
         if self.meta_curriculum is not None:
             self.meta_curriculum.set_all_curriculums_to_lesson_num(self.lesson)
+        if not self.train_model and self.load_model \
+           and self.num_workers == 0 and self._is_graph_up_to_date():
+            # Only the nodes deciding the actions of the exported graph are
+            # run when the loaded models are not trained.
+            self.logger.info('Running the exported graph {0}.'
+                             .format(self._graph_path()))
+            self._run_inference()
+            return
         trainer_config = self._load_config()
         self._create_model_path(self.model_path)
 
@@ -305,79 +789,41 @@ class TrainerController(object):
                                      'sure you specified the right '
                                      '--run-id'
                                      .format(self.model_path))
-                saver.restore(sess, ckpt.model_checkpoint_path)
+                self._restore_model(sess, ckpt.model_checkpoint_path)
+                for trainer in self.trainers.values():
+                    trainer.load_step_from_graph()
             else:
                 sess.run(init)
-            global_step = 0  # This is only for saving the model
-            curr_info = self._increment_lessons_and_reset_env()
+            self.global_step = 0  # This is only for saving the model
             if self.train_model:
                 for brain_name, trainer in self.trainers.items():
                     trainer.write_tensorboard_text('Hyperparameters',
                                                    trainer.parameters)
             try:
-                while any([t.get_step <= t.get_max_steps \
-                           for k, t in self.trainers.items()]) \
-                      or not self.train_model:
-                    if self.env.global_done:
-                        curr_info = self._increment_lessons_and_reset_env()
-                        for brain_name, trainer in self.trainers.items():
-                            trainer.end_episode()
-                    # Decide and take an action
-                    take_action_vector, \
-                    take_action_memories, \
-                    take_action_text, \
-                    take_action_value, \
-                    take_action_outputs \
-                        = {}, {}, {}, {}, {}
-                    for brain_name, trainer in self.trainers.items():
-                        (take_action_vector[brain_name],
-                         take_action_memories[brain_name],
-                         take_action_text[brain_name],
-                         take_action_value[brain_name],
-                         take_action_outputs[brain_name]) = \
-                            trainer.take_action(curr_info)
-                    new_info = self.env.step(vector_action=take_action_vector,
-                                             memory=take_action_memories,
-                                             text_action=take_action_text,
-                                             value=take_action_value)
-                    for brain_name, trainer in self.trainers.items():
-                        trainer.add_experiences(curr_info, new_info,
-                            take_action_outputs[brain_name])
-                        trainer.process_experiences(curr_info, new_info)
-                        if trainer.is_ready_update() and self.train_model \
-                           and trainer.get_step <= trainer.get_max_steps:
-                            # Perform gradient descent with experience buffer
-                            trainer.update_model()
-                        # Write training statistics to Tensorboard.
-                        if self.meta_curriculum is not None:
-                            trainer.write_summary(
-                                global_step,
-                                lesson_num=self.meta_curriculum
-                                           .brains_to_curriculums[brain_name]
-                                           .lesson_num)
-                        else:
-                            trainer.write_summary(global_step)
-                        if self.train_model \
-                           and trainer.get_step <= trainer.get_max_steps:
-                            trainer.increment_step_and_update_last_reward()
-                    if self.train_model:
-                        global_step += 1
-                    if global_step % self.save_freq == 0 and global_step != 0 \
-                       and self.train_model:
-                        # Save Tensorflow model
-                        self._save_model(sess, steps=global_step, saver=saver)
-                    curr_info = new_info
+                if self.num_workers > 0:
+                    self._learn_with_workers(sess, saver)
+                elif self.pipeline:
+                    self._learn_pipelined(sess, saver)
+                else:
+                    self._learn_sequential(sess, saver)
+                for trainer in self.trainers.values():
+                    trainer.wait_update()
                 # Final save Tensorflow model
-                if global_step != 0 and self.train_model:
-                    self._save_model(sess, steps=global_step, saver=saver)
+                if self.global_step != 0 and self.train_model:
+                    self._save_model(sess, steps=self.global_step, saver=saver)
             except KeyboardInterrupt:
                 print('--------------------------Now saving model--------------'
                       '-----------')
+                for trainer in self.trainers.values():
+                    trainer.wait_update()
                 if self.train_model:
                     self.logger.info('Learning was interrupted. Please wait '
                                      'while the graph is generated.')
-                    self._save_model(sess, steps=global_step, saver=saver)
+                    self._save_model(sess, steps=self.global_step, saver=saver)
                 pass
+            finally:
+                for trainer in self.trainers.values():
+                    trainer.close()
         self.env.close()
         if self.train_model:
             self._export_graph()